@@ -2,22 +2,43 @@ import logging
 import os
 import re
 import asyncio
-import asyncpg
-import redis.asyncio as redis
-import pandas as pd
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from aiogram import Bot, Dispatcher, Router, types, F
 from aiogram.filters import Command
 from aiogram.types import (
     InlineKeyboardButton, InlineKeyboardMarkup,
     ReplyKeyboardMarkup, KeyboardButton,
-    Message, CallbackQuery, FSInputFile
+    Message, CallbackQuery, FSInputFile, BufferedInputFile
 )
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
-from openpyxl import load_workbook, Workbook
 from dotenv import load_dotenv
 
+from broadcast import TokenBucket, PerChatLimiter, BroadcastEngine
+from broadcast_jobs import BroadcastJobStore, BroadcastJob, BroadcastScheduler, run_job, REPORT_QUERY, REPORT_HEADER
+from ban_list import BanList, BanMiddleware
+from metrics import (
+    MetricsMiddleware, BotApiMetrics, InstrumentedRedis, HANDLER_LATENCY, BROADCAST_SENT, BROADCAST_ERRORS,
+    watch_pool, start_server as start_metrics_server
+)
+from update_recorder import Anonymiser, UpdateRecorder
+from loop_watchdog import LoopWatchdog
+from profiler import KINDS as PROFILE_KINDS, Profiler
+from media import (
+    MediaCache, AlbumCollector, extract_media, text_payload, album_payload, describe, send_payload, trim_caption
+)
+from blocking_pool import BlockingPool, PoolOverloaded
+from database import Database
+from exporter import stream_export
+from subscription_cache import SubscriptionCache
+from participant_cache import ParticipantCache
+from rate_limit import RateLimiter, RateLimitMiddleware
+from state_storage import MemoryStateStorage, RedisStateStorage, StateMiddleware, UserSession
+from write_behind import DEFERRED, ParticipantWriter, WriteBehindWriter
+from participants_store import (
+    ParticipantJournal, UniquenessIndex, ensure_participant_constraints, warm_up_index, participant_exists, has_participated,
+    count_participants, fetch_participants
+)
+
 # Завантажуємо змінні оточення
 load_dotenv()
 redis_client = None
@@ -30,35 +51,145 @@ DATABASE_PORT = int(os.getenv("DATABASE_PORT", 5432))
 DATABASE_USER = os.getenv("DATABASE_USER")
 DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
+# Пул PostgreSQL на процес (у режимі webhook — на кожного воркера): розміри, скільки
+# чекати на вільне з'єднання, ліміт часу запиту (0 — без ліміту) та кеш операторів
+# (0 — для PgBouncer у режимі transaction; тоді гарячі запити теж не готуються)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", 10))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 0))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 100))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 CHANNEL_USERNAME = os.getenv("CHANNEL_USERNAME")
 YOUTUBE_LINK = os.getenv("YOUTUBE_LINK")
 TWITCH_LINK = os.getenv("TWITCH_LINK")
 SUPPORT_USERNAME = os.getenv("SUPPORT_USERNAME")
-
-# Ініціалізація бота, диспетчера та планувальника
+# Скільки секунд пам'ятаємо результат перевірки підписки (позитивний / негативний)
+SUBSCRIPTION_TTL = int(os.getenv("SUBSCRIPTION_TTL", 600))
+SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", 20))
+# Скільки секунд пам'ятаємо, чи бере користувач участь (так / ні)
+PARTICIPANT_CACHE_TTL = int(os.getenv("PARTICIPANT_CACHE_TTL", 3600))
+PARTICIPANT_CACHE_NEGATIVE_TTL = int(os.getenv("PARTICIPANT_CACHE_NEGATIVE_TTL", 30))
+# Параметри розсилки: швидкість (повідомлень/с) та кількість паралельних відправників
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+# Куди зберігати експорти та у якому форматі: xlsx або csv.gz
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.expanduser("~"), "Desktop"))
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "xlsx")
+# Пул для блокуючих операцій (журнал, Excel): кількість потоків та ліміт черги
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", 4))
+BLOCKING_QUEUE_LIMIT = int(os.getenv("BLOCKING_QUEUE_LIMIT", 200))
+# Сховище станів діалогів: redis або memory, та час життя покинутого стану (секунди)
+STATE_STORAGE = os.getenv("STATE_STORAGE", "redis")
+STATE_TTL = int(os.getenv("STATE_TTL", 3600))
+# Скільки зміна стану може чекати попутного pipeline, перш ніж піде в Redis окремо;
+# при аварійному падінні процесу (не SIGTERM) втрачаються зміни саме за цей час
+STATE_FLUSH_DELAY = float(os.getenv("STATE_FLUSH_DELAY", 0.5))
+# Скільки користувачів із незавершеним діалогом тримаємо в пам'яті (найстаріші витісняються)
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS", 100_000))
+# Антифлуд: мінімальний інтервал (секунди) між подіями одного користувача; 0 — без ліміту
+RATE_LIMIT_MESSAGE = float(os.getenv("RATE_LIMIT_MESSAGE", 2))
+RATE_LIMIT_CALLBACK = float(os.getenv("RATE_LIMIT_CALLBACK", 1))
+RATE_LIMIT_ADMIN = float(os.getenv("RATE_LIMIT_ADMIN", 0))
+# Пакетний запис у БД: розмір пачки, максимальна затримка (мс) та скільки секунд
+# користувач чекає підтвердження реєстрації, перш ніж отримати відповідь «прийнято»
+WRITE_BATCH_ROWS = int(os.getenv("WRITE_BATCH_ROWS", 500))
+WRITE_BATCH_MS = int(os.getenv("WRITE_BATCH_MS", 50))
+DB_CONFIRM_TIMEOUT = float(os.getenv("DB_CONFIRM_TIMEOUT", 5))
+# Заплановані розсилки: за скільки секунд до старту робити знімок отримувачів
+# і як часто перевіряти задачі, заплановані іншими процесами
+SCHEDULE_PREPARE_AHEAD = float(os.getenv("SCHEDULE_PREPARE_AHEAD", 120))
+SCHEDULE_POLL_SECONDS = float(os.getenv("SCHEDULE_POLL_SECONDS", 5))
+# Метрики Prometheus на GET /metrics; 0 — вимкнено. У режимі webhook воркер N слухає METRICS_PORT + N
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+# Сторож циклу подій: поріг блокування (секунди; 0 — вимкнено), крок перевірки
+# та як часто надсилати адміністраторам зведення блокувань
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", 0.5))
+LOOP_WATCHDOG_INTERVAL = float(os.getenv("LOOP_WATCHDOG_INTERVAL", 0.1))
+LOOP_DIGEST_INTERVAL = float(os.getenv("LOOP_DIGEST_INTERVAL", 300))
+# Профілювання на вимогу (/profile): найдовша сесія та крок вибірки семплера, секунди
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 120))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+# Запис знеособлених оновлень для навантажувальних прогонів (benchmarks/replay.py); порожньо — вимкнено.
+# У режимі webhook воркер N пише у RECORD_UPDATES.N
+RECORD_UPDATES = os.getenv("RECORD_UPDATES", "")
+# Режим роботи: polling (один процес) або webhook (шлюз + N процесів-воркерів)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", os.cpu_count() or 1))
+WEBHOOK_WORKER_CONCURRENCY = int(os.getenv("WEBHOOK_WORKER_CONCURRENCY", 100))
+
+# Ініціалізація бота та диспетчера
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
-scheduler = AsyncIOScheduler()
 router = Router()
 logging.basicConfig(level=logging.INFO)
+# Кожен виклик Bot API рахується в метриках (кількість, час, помилки за класом)
+bot.session.middleware(BotApiMetrics())
+metrics_runner = None
+update_recorder = None
+broadcast_pacer = TokenBucket(BROADCAST_RATE)
+broadcast_engine = BroadcastEngine(broadcast_pacer, PerChatLimiter(), concurrency=BROADCAST_CONCURRENCY)
+background_tasks = set()
+# Усі блокуючі файлові операції виконуються тут, а не в циклі подій.
+# Потоки, а не процеси: журнал і індекс учасників живуть у пам'яті цього процесу.
+blocking_pool = BlockingPool(BLOCKING_POOL_SIZE, BLOCKING_QUEUE_LIMIT)
+profiler = Profiler(PROFILE_MAX_SECONDS, PROFILE_SAMPLE_INTERVAL, executor=blocking_pool)
+# Стани реєстрації, адмін-меню та чернетки розсилок (у main() переходять на Redis)
+state_middleware = StateMiddleware(MemoryStateStorage(STATE_TTL, STATE_MAX_USERS))
+# Антифлуд перед фільтрами: SET NX у Redis іде одним pipeline з читанням стану
+# і відкладеними записами станів — один round trip на подію
+rate_limiter = RateLimiter()
+rate_limit_middleware = RateLimitMiddleware(
+    rate_limiter,
+    {"message": RATE_LIMIT_MESSAGE, "callback": RATE_LIMIT_CALLBACK, "admin": RATE_LIMIT_ADMIN},
+    ADMIN_IDS,
+    state=state_middleware
+)
+# Бани зберігаються в PostgreSQL і перевіряються за локальною копією ще до антифлуду
+ban_list = BanList()
+ban_middleware = BanMiddleware(ban_list, ADMIN_IDS)
+router.message.outer_middleware(ban_middleware)
+router.callback_query.outer_middleware(ban_middleware)
+router.message.outer_middleware(rate_limit_middleware)
+router.callback_query.outer_middleware(rate_limit_middleware)
+# Час хендлера разом із завантаженням і збереженням стану — саме це бачить користувач
+metrics_middleware = MetricsMiddleware()
+router.message.middleware(metrics_middleware)
+router.callback_query.middleware(metrics_middleware)
+router.message.middleware(state_middleware)
+router.callback_query.middleware(state_middleware)
+# Черги пакетного запису учасників та логів розсилок (пул БД підключається в on_startup)
+# Рядки, які PostgreSQL відхилив (DataError, порушене обмеження), — у *_rejected.jsonl
+participant_writer = ParticipantWriter(
+    None, max_rows=WRITE_BATCH_ROWS, max_delay=WRITE_BATCH_MS / 1000, spill_path='participants_pending.bin',
+    dead_letter_path='participants_rejected.jsonl'
+)
+log_writer = WriteBehindWriter(
+    None, "broadcast_logs", ["date", "message", "success_count", "failed_count", "job_id"],
+    max_rows=WRITE_BATCH_ROWS, max_delay=WRITE_BATCH_MS / 1000, spill_path='broadcast_logs_pending.bin',
+    dead_letter_path='broadcast_logs_rejected.jsonl'
+)
+# Альбом для розсилки приходить кількома повідомленнями — збираємо їх в один payload
+album_collector = AlbumCollector()
+# Кеш «📍 Мій статус»: повторні натискання не йдуть у PostgreSQL
+participant_cache = ParticipantCache(
+    lambda user_id: has_participated(dp['db'], user_id), positive_ttl=PARTICIPANT_CACHE_TTL, negative_ttl=PARTICIPANT_CACHE_NEGATIVE_TTL
+)
+subscription_cache = SubscriptionCache(
+    bot, CHANNEL_USERNAME, positive_ttl=SUBSCRIPTION_TTL, negative_ttl=SUBSCRIPTION_NEGATIVE_TTL
+)
 
 # Шляхи та стани
 EXCEL_FILE = 'participants.xlsx'
-LOG_FILE = 'broadcast_log.xlsx'
-user_states = {}
-participants_set = set()
-admin_states = {}
-banned_users = set()
-last_message_times = {}
-broadcast_buffer = {}
-SPAM_INTERVAL = timedelta(seconds=5)
-
-# Функція для запланованої розсилки
-
-
-def schedule_broadcast(content: str):
-    for aid in ADMIN_IDS:
-        asyncio.create_task(bot.send_message(aid, content))
+JOURNAL_FILE = os.getenv("JOURNAL_FILE", "participants.jsonl")
+# Скільки ID показувати в «⛔ Забанені»
+BANNED_PREVIEW = 50
 
 # Функція для сповіщення адміністраторів про помилки
 
@@ -70,108 +201,98 @@ async def notify_admins(text: str):
         except Exception:
             pass
 
-# Ініціалізація файлів Excel
-if not os.path.exists(EXCEL_FILE):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Participants"
-    ws.append(["Telegram ID", "Username", "Full Name", "Дата участі", "GGPoker Нік", "Email"])
-    wb.save(EXCEL_FILE)
-
-if not os.path.exists(LOG_FILE):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Logs"
-    ws.append(["Дата", "Повідомлення", "Успішно", "Не вдалося"])
-    wb.save(LOG_FILE)
+
+# Блокуючі виклики в циклі подій: стек і оновлення — в лог одразу, зведення — адміністраторам
+loop_watchdog = LoopWatchdog(LOOP_LAG_THRESHOLD, LOOP_WATCHDOG_INTERVAL, LOOP_DIGEST_INTERVAL, on_digest=notify_admins)
+
+# Індекс унікальності (ID, нікнейм, email) та журнал учасників
+# (participants.xlsx формується лише при експорті). Журнал відкривається
+# в on_startup, тож сам імпорт модуля (тести, бенчмарки) файлів не створює
+participant_index = UniquenessIndex()
+participants_store: ParticipantJournal | None = None
+# Номер воркера в режимі webhook (None — один процес): кожен воркер має власні
+# журнал, spill- і dead-letter файли, бо процеси не можуть ділити їх між собою
+worker_shard: int | None = None
+
+
+def shard_path(path: str | None, shard: int | None) -> str | None:
+    return path if not path or shard is None else f"{path}.{shard}"
+
+
+def open_journal(path: str = JOURNAL_FILE, legacy_excel: str | None = EXCEL_FILE) -> ParticipantJournal:
+    global participants_store
+    participants_store = ParticipantJournal(path, legacy_excel=legacy_excel, index=participant_index)
+    return participants_store
 
 # Функції для роботи з БД та Excel
 
 
 def export_db_to_excel(pool):
     async def inner():
-        async with pool.acquire() as conn:
-            rows = await conn.fetch("SELECT * FROM participants")
-            df = pd.DataFrame(rows, columns=["telegram_id", "username", "full_name", "joined_at", "nickname", "email"])
-            desktop = os.path.join(os.path.expanduser("~"), "Desktop")
-            filename = os.path.join(desktop, f"participants_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-            df.to_excel(filename, index=False)
-            return filename
+        return await stream_export(
+            pool,
+            "SELECT telegram_id, username, full_name, joined_at, nickname, email FROM participants",
+            ["telegram_id", "username", "full_name", "joined_at", "nickname", "email"],
+            EXPORT_DIR, "participants", EXPORT_FORMAT, executor=blocking_pool
+        )
     return inner
 
 
 async def export_logs_to_excel(pool):
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT * FROM broadcast_logs")
-        df = pd.DataFrame(rows, columns=["date", "message", "success_count", "failed_ids"])
-        desktop = os.path.join(os.path.expanduser("~"), "Desktop")
-        filename = os.path.join(desktop, f"broadcast_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        df.to_excel(filename, index=False)
-        return filename
+    return await stream_export(
+        pool, REPORT_QUERY, REPORT_HEADER,
+        EXPORT_DIR, "broadcast_logs", EXPORT_FORMAT, executor=blocking_pool
+    )
 
 
 def save_participant(user: types.User, nickname: str, email: str):
-    if user.id in participants_set:
-        return False
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb.active
     full_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if nickname == row[4] or user.id == row[0]:
-            return False
-    ws.append([
+    return participants_store.add({
+        "telegram_id": user.id,
+        "username": f"@{user.username}" if user.username else "(без username)",
+        "full_name": full_name,
+        "joined_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "nickname": nickname,
+        "email": email
+    })
+
+
+def participants_summary(rows=None) -> str:
+    return "\n".join(
+        f"{r['username']} | {r['full_name']} | {r['nickname']} | {r['joined_at']}"
+        for r in (participants_store.rows() if rows is None else rows)
+    )
+
+
+# Запис у PostgreSQL іде пачками через write-behind чергу (COPY + ON CONFLICT DO NOTHING).
+# Future завершується після коміту пачки: False — унікальні індекси знайшли дубль.
+def save_participant_to_db(user: types.User, nickname: str, email: str) -> asyncio.Future:
+    return participant_writer.submit((
         user.id,
         f"@{user.username}" if user.username else "(без username)",
-        full_name,
-        datetime.now().strftime("%Y-%m-%d %H:%M"),
+        f"{user.first_name or ''} {user.last_name or ''}".strip(),
+        datetime.now(),
         nickname,
         email
-    ])
-    wb.save(EXCEL_FILE)
-    participants_set.add(user.id)
-    return True
-
-
-async def save_participant_to_db(pool, user: types.User, nickname: str, email: str):
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO participants (telegram_id, username, full_name, joined_at, nickname, email)
-            VALUES ($1, $2, $3, $4, $5, $6)
-            ON CONFLICT (telegram_id) DO NOTHING
-            """,
-            user.id,
-            f"@{user.username}" if user.username else "(без username)",
-            f"{user.first_name or ''} {user.last_name or ''}".strip(),
-            datetime.now(),
-            nickname,
-            email
-        )
+    ))
 
 
-async def has_participated(pool, telegram_id: int) -> bool:
-    async with pool.acquire() as conn:
-        result = await conn.fetchval("SELECT 1 FROM participants WHERE telegram_id = $1", telegram_id)
-        return result is not None
 # ─── ЛОГУВАННЯ РОЗСИЛОК ─────────────────────────────────────────────────────
 
 
-async def log_broadcast(pool, message_text: str, success_count: int, failed_list: list[int]):
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO broadcast_logs (date, message, success_count, failed_ids)
-            VALUES ($1, $2, $3, $4)
-            """,
-            datetime.now(),
-            message_text,
-            success_count,
-            ", ".join(map(str, failed_list))
-        )
+# Окремі ID отримувачів не дублюємо: вони вже в broadcast_deliveries
+async def log_broadcast(job: BroadcastJob, stats):
+    await log_writer.write((
+        datetime.now(),
+        job.message,
+        stats.sent,
+        stats.failed_count,
+        job.id
+    ))
 
 
-#Формування клавіатур
-def user_menu(is_admin: bool = False):
+#Формування клавіатур (будуються один раз при старті і перевикористовуються)
+def build_user_menu(is_admin: bool = False):
     buttons = [
         [KeyboardButton(text="📜 Умови"), KeyboardButton(text="🎁 Призи")],
         [KeyboardButton(text="📞 Підтримка"), KeyboardButton(text="📍 Мій статус")],
@@ -183,36 +304,66 @@ def user_menu(is_admin: bool = False):
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True, input_field_placeholder="Оберіть опцію")
 
 
+USER_MENU = build_user_menu(False)
+USER_MENU_ADMIN = build_user_menu(True)
+SUPPORT_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="✍️ Написати в підтримку")],
+        [KeyboardButton(text="🔄 Змінити нікнейм")],
+        [KeyboardButton(text="↩️ Назад до меню")],
+    ],
+    resize_keyboard=True
+)
+ADMIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="👥 Учасники"), KeyboardButton(text="📥 Експорт Excel")],
+        [KeyboardButton(text="📤 Список з бази PostgreSQL")],
+        [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="📣 Розсилка")],
+        [KeyboardButton(text="🕒 Планувати розсилку"), KeyboardButton(text="⛔ Забанені")],
+        [KeyboardButton(text="📊 Експорт логів")],
+        [KeyboardButton(text="↩️ Повернутись")],
+    ],
+    resize_keyboard=True
+)
+CONFIRM_PARTICIPATION_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✅ Підтверджую участь", callback_data="confirm_participation")]
+])
+PARTICIPATE_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✅ Я підписався", callback_data="participate")]
+])
+# Тексти кнопок меню: у записі оновлень лишаються як є, решта тексту знеособлюється
+BUTTON_TEXTS = frozenset(
+    button.text for menu in (USER_MENU_ADMIN, SUPPORT_MENU, ADMIN_MENU) for row in menu.keyboard for button in row
+)
+
+
+def user_menu(is_admin: bool = False):
+    return USER_MENU_ADMIN if is_admin else USER_MENU
+
+
 def support_menu():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✍️ Написати в підтримку")],
-            [KeyboardButton(text="🔄 Змінити нікнейм")],
-            [KeyboardButton(text="↩️ Назад до меню")],
-        ],
-        resize_keyboard=True
-    )
+    return SUPPORT_MENU
 
 
 def admin_menu():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="👥 Учасники"), KeyboardButton(text="📥 Експорт Excel")],
-            [KeyboardButton(text="📤 Список з бази PostgreSQL")],
-            [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="📣 Розсилка")],
-            [KeyboardButton(text="🕒 Планувати розсилку"), KeyboardButton(text="⛔ Забанені")],
-            [KeyboardButton(text="📊 Експорт логів")],
-            [KeyboardButton(text="↩️ Повернутись")],
-        ],
-        resize_keyboard=True
-    )
+    return ADMIN_MENU
+
+
+# Таблиця кнопок меню для handle_messages: текст кнопки → (хендлер, лише для адмінів).
+# Заповнюється декоратором menu_button під час імпорту модуля.
+MENU_ROUTES = {}
+
+
+def menu_button(text: str, admin_only: bool = False):
+    def register(handler):
+        MENU_ROUTES[text] = (handler, admin_only)
+        return handler
+    return register
 
 
 # Хендлер /start
 @router.message(Command("start"))
 async def welcome_user(message: Message):
-    if message.from_user.id in banned_users:
-        return
     await message.answer(
         "👋 Вітаємо у GGpoker Telegram боті! Це не просто бот для участі в розіграші, а також ваш персональний асистент для отримання новин, бонусів та корисної інформації про GGpoker. Натисніть кнопку нижче, щоб розпочати.",
         reply_markup=user_menu(message.from_user.id in ADMIN_IDS)
@@ -222,34 +373,25 @@ async def welcome_user(message: Message):
 # Участь у розігарші
 @router.message(F.text == "🎉 Взяти участь у розігарші")
 async def participate_command(message: Message):
-    if message.from_user.id in banned_users:
-        return
     await message.answer("🔄 Обробляємо запит...", disable_notification=True)
     await asyncio.sleep(1.2)
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Я підписався", callback_data="participate")]
-    ])
     await message.answer(
         f"📋 Для участі в розігарші потрібно:\n"
         f"1. Підписатися на Telegram канал: {CHANNEL_USERNAME}\n"
         f"2. Підписатися на YouTube: {YOUTUBE_LINK}\n"
         f"3. Підписатися на Twitch: {TWITCH_LINK}\n\n"
         "Після цього натисніть кнопку нижче, щоб продовжити.",
-        reply_markup=kb
+        reply_markup=PARTICIPATE_KB
     )
 
 
 # Перевірка підписки
 @router.callback_query(F.data == "participate")
-async def check_subscription(callback: CallbackQuery):
+async def check_subscription(callback: CallbackQuery, session: UserSession):
     user = callback.from_user
-    if user.id in banned_users:
-        return
     await callback.message.answer("🔍 Перевіряємо підписку...", disable_notification=True)
-    await asyncio.sleep(1.5)
     try:
-        member = await bot.get_chat_member(CHANNEL_USERNAME, user.id)
-        if member.status not in ["member", "administrator", "creator"]:
+        if not await subscription_cache.is_subscribed(user.id):
             await callback.answer("❌ Спочатку підпишіться на Telegram-канал!", show_alert=True)
             return
     except Exception as e:
@@ -257,7 +399,7 @@ async def check_subscription(callback: CallbackQuery):
         await notify_admins(f"❗ Помилка перевірки підписки: {e}")
         return
 
-    user_states[user.id] = 'awaiting_nickname'
+    session.user_state = 'awaiting_nickname'
     await callback.message.answer("✅ Ви приєдналися! Введіть ваш GGPoker нікнейм.")
     await callback.answer()
 
@@ -271,6 +413,122 @@ async def open_admin_panel(message: Message):
     await message.answer("🔐 Вхід в адмін‑панель.", reply_markup=admin_menu())
 
 
+# Скидання кешу підписок: /refresh_sub <id> [<id> ...] або /refresh_sub all
+@router.message(Command("refresh_sub"))
+async def refresh_subscription_cache(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    args = (message.text or "").split()[1:]
+    if args == ["all"]:
+        removed = await subscription_cache.invalidate()
+    elif args and all(a.isdigit() for a in args):
+        removed = 0
+        for a in args:
+            removed += await subscription_cache.invalidate(int(a))
+    else:
+        await message.answer("ℹ️ Використання: /refresh_sub <id> [<id> ...] або /refresh_sub all")
+        return
+    await message.answer(f"🔄 Кеш підписок скинуто, записів видалено: {removed}")
+
+
+# Бан та розбан списком: /ban <id> [<id> ...] [причина], /unban <id> [<id> ...]
+# (ID можна розділяти пробілами, комами або переносами рядків)
+def parse_ban_command(text: str) -> tuple[list[int], str | None]:
+    args = re.split(r"[\s,]+", (text or "").strip())[1:]
+    ids = [int(a) for a in args if a.isdigit()]
+    reason = " ".join(a for a in args if a and not a.isdigit()) or None
+    return ids, reason
+
+
+@router.message(Command("ban"))
+async def ban_users(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    ids, reason = parse_ban_command(message.text)
+    if not ids:
+        await message.answer("ℹ️ Використання: /ban <id> [<id> ...] [причина]")
+        return
+    added = await ban_list.ban(ids, reason=reason, banned_by=message.from_user.id)
+    await message.answer(f"⛔ Забанено: {added} (вже були в списку: {len(set(ids)) - added})")
+
+
+@router.message(Command("unban"))
+async def unban_users(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    ids, _ = parse_ban_command(message.text)
+    if not ids:
+        await message.answer("ℹ️ Використання: /unban <id> [<id> ...]")
+        return
+    removed = await ban_list.unban(ids)
+    await message.answer(f"✅ Розбанено: {removed}")
+
+
+# Заплановані розсилки: перегляд і скасування
+@router.message(Command("scheduled"))
+async def list_scheduled_broadcasts(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    jobs = await dp['jobs'].scheduled()
+    if not jobs:
+        await message.answer("🕒 Запланованих розсилок немає.")
+        return
+    lines = [
+        f"#{j.id} — {j.scheduled_at:%Y-%m-%d %H:%M}"
+        + (f" (знімок: {j.total} отримувачів)" if j.status == "prepared" else "")
+        + f"\n{j.message[:60]}"
+        for j in jobs
+    ]
+    await message.answer("🕒 Заплановані розсилки:\n\n" + "\n\n".join(lines))
+
+
+@router.message(Command("cancel_broadcast"))
+async def cancel_scheduled_broadcast(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    args = (message.text or "").split()[1:]
+    if len(args) != 1 or not args[0].lstrip("#").isdigit():
+        await message.answer("ℹ️ Використання: /cancel_broadcast <id>")
+        return
+    job_id = int(args[0].lstrip("#"))
+    if await dp['jobs'].cancel(job_id):
+        await message.answer(f"🗑️ Розсилку #{job_id} скасовано.")
+    else:
+        await message.answer(f"⚠️ Розсилку #{job_id} не знайдено або вона вже почалася.")
+
+
+# Профілювання працюючого бота: /profile [sample|cprofile] [секунди], /profile stop.
+# Сесія охоплює і обробку оновлень, і фонові розсилки; результат приходить файлом
+@router.message(Command("profile"))
+async def profile_bot(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    args = (message.text or "").split()[1:]
+    if args == ["stop"]:
+        if not profiler.stop():
+            await message.answer("ℹ️ Профілювання не запущено.")
+        return
+    kind = args.pop(0) if args and args[0] in PROFILE_KINDS else "sample"
+    if len(args) > 1 or (args and not args[0].isdigit()):
+        await message.answer("ℹ️ Використання: /profile [sample|cprofile] [секунди] або /profile stop")
+        return
+    if profiler.active:
+        await message.answer("⚠️ Профілювання вже триває. Зупинити: /profile stop")
+        return
+    seconds = min(int(args[0]) if args else 30, PROFILE_MAX_SECONDS)
+    await message.answer(f"⏱️ Профілювання ({kind}) на {seconds:g} с…")
+    start_background(send_profile(message, kind, seconds))
+
+
+async def send_profile(message: Message, kind: str, seconds: float):
+    try:
+        filename, data, summary = await profiler.run(kind, seconds)
+        await message.answer_document(BufferedInputFile(data, filename), caption=f"📊 Профіль {kind}: {summary}")
+    except Exception as e:
+        logging.error(f"Помилка профілювання: {e}")
+        await message.answer(f"❌ Профілювання не вдалося: {e}")
+
+
 # Підтримка
 @router.message(F.text == "📞 Підтримка")
 async def show_support_options(message: Message):
@@ -283,8 +541,8 @@ async def handle_write_support(message: Message):
 
 
 @router.message(F.text == "🔄 Змінити нікнейм")
-async def handle_change_nickname(message: Message):
-    user_states[message.from_user.id] = "awaiting_new_nickname"
+async def handle_change_nickname(message: Message, session: UserSession):
+    session.user_state = "awaiting_new_nickname"
     await message.answer("Введіть новий нікнейм для заміни:")
 
 
@@ -300,54 +558,85 @@ async def back_to_main_menu(message: Message):
 
 # Підтвердження участі
 @router.callback_query(F.data == "confirm_participation")
-async def confirm_participation(callback: CallbackQuery):
+async def confirm_participation(callback: CallbackQuery, session: UserSession):
     user_id = callback.from_user.id
-    state = user_states.get(user_id)
+    state = session.user_state
     if not state or not isinstance(state, dict):
         await callback.answer("⚠️ Щось пішло не так. Спробуйте ще.")
         return
     try:
         nickname = state["nickname"]
         email = state["email"]
-        if save_participant(callback.from_user, nickname, email):
-            await save_participant_to_db(dp['db'], callback.from_user, nickname, email)
-            await callback.message.answer(
-                "✅ Участь підтверджено! Успіхів!",
-                reply_markup=user_menu(user_id in ADMIN_IDS)
-            )
-        else:
-            banned_users.add(user_id)
-            await callback.message.answer("🚫 Ви вже брали участь або намагалися обдурити бота.")
+        # Поки індекс прогрівається, учасників із БД у ньому ще немає
+        if not participant_index.ready.is_set() and await participant_exists(dp['db'], user_id, nickname, email):
+            await finish_participation(callback.message, user_id, False)
+            return
+        saved = await blocking_pool.run(save_participant, callback.from_user, nickname, email)
+        if not saved:
+            await finish_participation(callback.message, user_id, False)
+            return
+        inserted = save_participant_to_db(callback.from_user, nickname, email)
+        try:
+            await asyncio.wait_for(asyncio.shield(inserted), DB_CONFIRM_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Рядок лишається в черзі запису; відповідь надішлемо після коміту
+            await callback.message.answer("⏳ Заявку прийнято, очікуємо підтвердження...")
+            start_background(finish_participation(callback.message, user_id, inserted))
+            return
+        except Exception:
+            # Рядок відхилено БД — відповідь і сповіщення в finish_participation
+            pass
+        await finish_participation(callback.message, user_id, inserted)
+    except PoolOverloaded:
+        await callback.message.answer("⏳ Бот перевантажений, спробуйте підтвердити участь трохи пізніше.")
     except Exception as e:
         await notify_admins(f"❌ Помилка при підтвердженні участі:\n{e}")
     finally:
-        user_states.pop(user_id, None)
+        session.user_state = None
         await callback.answer()
 
 
+async def finish_participation(message: Message, user_id: int, inserted):
+    if isinstance(inserted, asyncio.Future):
+        try:
+            inserted = await inserted
+        except Exception as e:
+            # PostgreSQL відхилив рядок — він у dead-letter файлі, заявку не зараховано
+            await blocking_pool.run(participants_store.remove, user_id)
+            await participant_cache.invalidate(user_id)
+            await message.answer("❌ Не вдалося зберегти заявку. Спробуйте ще раз трохи пізніше.")
+            await notify_admins(f"❌ Заявку {user_id} не записано в БД:\n{e}")
+            return
+        if inserted is DEFERRED:
+            # Бот зупиняється: рядок у spill-файлі й запишеться після перезапуску,
+            # запис у журналі лишається
+            await message.answer("⏳ Заявку збережено, вона буде зарахована після перезапуску бота.")
+            return
+        if inserted:
+            # Рядок уже в БД: «📍 Мій статус» одразу бачить участь без запиту
+            await participant_cache.set(user_id, True)
+        else:
+            # Дубль, зареєстрований іншим процесом, бачить лише PostgreSQL
+            await blocking_pool.run(participants_store.remove, user_id)
+            await participant_cache.invalidate(user_id)
+    if inserted:
+        await message.answer("✅ Участь підтверджено! Успіхів!", reply_markup=user_menu(user_id in ADMIN_IDS))
+    else:
+        await ban_list.ban([user_id], reason="duplicate")
+        await message.answer("🚫 Ви вже брали участь або намагалися обдурити бота.")
+
+
 # Обробка повідомлень та адмін-розсилки
 @router.message()
-async def handle_messages(message: Message):
+async def handle_messages(message: Message, session: UserSession):
     user_id = message.from_user.id
     text = message.text
-    if await is_flooding(user_id):
-        await message.answer("⏳ Повільніше, будь ласка!")
-        return
-    if user_id in banned_users:
-        return
-
-    # Антиспам
-    now = datetime.now()
-    last = last_message_times.get(user_id)
-    if last and now - last < SPAM_INTERVAL:
-        return
-    last_message_times[user_id] = now
 
     # Реєстрація
-    if user_id in user_states:
-        state = user_states[user_id]
+    state = session.user_state
+    if state is not None:
         if state == 'awaiting_nickname':
-            user_states[user_id] = {'step': 'awaiting_email', 'nickname': text.strip()}
+            session.user_state = {'step': 'awaiting_email', 'nickname': text.strip()}
             await message.reply("📧 Введіть вашу електронну пошту:")
             return
         elif isinstance(state, dict) and state.get('step') == 'awaiting_email':
@@ -356,162 +645,380 @@ async def handle_messages(message: Message):
             if not re.match(r'^[\w.-]+@[\w.-]+\.\w{2,}$', email):
                 await message.reply("❌ Невірний формат email. Спробуйте ще раз:")
                 return
-            await message.answer(
-                "✅ Все готово! Підтвердьте участь:",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="✅ Підтверджую участь", callback_data="confirm_participation")]
-                ])
-            )
-            user_states[user_id] = {"step": "confirming", "nickname": nickname, "email": email}
+            await message.answer("✅ Все готово! Підтвердьте участь:", reply_markup=CONFIRM_PARTICIPATION_KB)
+            session.user_state = {"step": "confirming", "nickname": nickname, "email": email}
             return
 
-    # Адмін-команди
-    if text == "📤 Список з бази PostgreSQL" and user_id in ADMIN_IDS:
-        await message.answer("🔄 Експортуємо список...")
-        export_func = export_db_to_excel(dp['db'])
-        file_path = await export_func()
-        await message.answer_document(FSInputFile(file_path))
-        return
-
-    elif text == "📊 Експорт логів" and user_id in ADMIN_IDS:
-        path = await export_logs_to_excel(dp['db'])
-        await message.answer_document(FSInputFile(path))
-        return
-
-    elif text == "📜 Умови":
-        await message.answer(
-            f"📜 Умови:\n1. Підписка на {CHANNEL_USERNAME}\n2. YouTube: {YOUTUBE_LINK}\n3. Twitch: {TWITCH_LINK}",
-            reply_markup=user_menu(user_id in ADMIN_IDS)
-        )
+    # Кнопки меню: один пошук у словнику, перевірка прав — лише для адмін-кнопок
+    route = MENU_ROUTES.get(text)
+    if route is not None:
+        handler, admin_only = route
+        if not admin_only or user_id in ADMIN_IDS:
+            # Кнопки меню обробляються всередині handle_messages — міряємо їх окремо
+            started = time.perf_counter()
+            try:
+                await handler(message, session)
+            finally:
+                HANDLER_LATENCY.observe(time.perf_counter() - started, f"handle_messages:{handler.__name__}")
+            return
 
-    # Основне меню
-    if text == "📜 Умови":
-        await message.answer(
-            f"📜 Умови:\n1. Підписка на {CHANNEL_USERNAME}\n2. YouTube: {YOUTUBE_LINK}\n3. Twitch: {TWITCH_LINK}",
-            reply_markup=user_menu(user_id in ADMIN_IDS)
-        )
-    elif text == "🎁 Призи":
-        await message.answer(
-            "🎁 Призовий фонд: бонуси для 3 учасників!",
-            reply_markup=user_menu(user_id in ADMIN_IDS)
-        )
-    elif text == "📍 Мій статус":
-        participated = await has_participated(dp['db'], user_id)
-        status = "✅ Ви берете участь!" if participated else "❌ Ви ще не брали участі."
-        await message.answer(status, reply_markup=user_menu(user_id in ADMIN_IDS))
-
-    elif text == "❓ FAQ":
-        await message.answer(
-            "ℹ️ Часті питання:\n- Як дізнатися чи я зареєстрований?\n- Як змінити нікнейм?\n- Як зв'язатися з підтримкою?",
-            reply_markup=user_menu(user_id in ADMIN_IDS)
-        )
-    elif text == "👥 Учасники" and user_id in ADMIN_IDS:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb.active
-        info = "\n".join(f"{r[1]} | {r[2]} | {r[4]} | {r[3]}" for r in ws.iter_rows(min_row=2, values_only=True))
-        await message.answer(f"👥 Список учасників:\n{info}")
-    elif text == "📊 Статистика" and user_id in ADMIN_IDS:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb.active
-        count = ws.max_row - 1
-        await message.answer(f"📊 Зареєстровано учасників: {count}")
-    elif text == "📥 Експорт Excel" and user_id in ADMIN_IDS:
-        await message.answer_document(FSInputFile(EXCEL_FILE))
-    elif text == "📣 Розсилка" and user_id in ADMIN_IDS:
-        admin_states[user_id] = "awaiting_broadcast"
-        await message.answer("✉️ Введіть текст для розсилки.")
-    elif text == "🕒 Планувати розсилку" and user_id in ADMIN_IDS:
-        admin_states[user_id] = "awaiting_schedule"
-        await message.answer("🕒 Введіть дату, час (YYYY-MM-DD HH:MM) та текст:")
-    elif text == "⛔ Забанені" and user_id in ADMIN_IDS:
-        banned_list = "\n".join(map(str, banned_users)) or "✅ Список порожній."
-        await message.answer(f"🚫 Забанені:\n{banned_list}")
-    elif text == "↩️ Повернутись":
-        admin_states.pop(user_id, None)  # сбросим состояние, если что-то активное
-        await message.answer("🔙 Повертаємося:", reply_markup=user_menu(user_id in ADMIN_IDS))
-    # Запуск ручної розсилки
-    elif user_id in admin_states and admin_states[user_id] == "awaiting_broadcast":
-        broadcast_buffer[user_id] = {"text": text.strip()}
-        await confirm_broadcast_manual(user_id)
-        del admin_states[user_id]
+    # Запуск ручної розсилки: текст, медіа або альбом
+    # (решта повідомлень альбому приходить без тексту і вже без стану адміна)
+    if session.admin_state == "awaiting_broadcast" or (
+        text is None and album_collector.collecting(message.media_group_id)
+    ):
+        session.admin_state = None
+        media = extract_media(message)
+        if media is not None and message.media_group_id is not None:
+            album_collector.add(
+                message.media_group_id, message.message_id, media,
+                lambda items: start_background(confirm_album_broadcast(user_id, items))
+            )
+            return
+        if media is None and not text:
+            await message.answer("⚠️ Надішліть текст, фото, відео, документ або альбом.")
+            return
+        session.broadcast = media or text_payload(text.strip())
+        await confirm_broadcast_manual(session)
     # Запланована розсилка
-    elif user_id in admin_states and admin_states[user_id] == "awaiting_schedule":
+    elif session.admin_state == "awaiting_schedule":
         try:
-            date_str, time_str, content = text.split(" ", 2)
+            media = extract_media(message)
+            date_str, time_str, content = (text or message.caption or "").split(" ", 2)
             run_dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-            scheduler.add_job(
-                schedule_broadcast,
-                trigger=DateTrigger(run_date=run_dt),
-                args=[content]
+            if run_dt <= datetime.now():
+                await message.answer("❌ Час розсилки вже минув.")
+                return
+            payload = None
+            if media is not None:
+                # Дата й час ідуть на початку підпису — у розсилку потрапляє лише решта
+                payload = await dp['media'].remember(trim_caption(media, len(date_str) + len(time_str) + 2))
+            job = await dp['jobs'].schedule(user_id, describe(payload, content), run_dt, payload)
+            if dp.get('scheduler') is not None:
+                dp['scheduler'].wake()
+            await message.answer(
+                f"🕒 Розсилку #{job.id} заплановано на {run_dt:%Y-%m-%d %H:%M}\n"
+                "Список: /scheduled, скасування: /cancel_broadcast <id>"
             )
-            await message.answer(f"🕒 Розсилку заплановано на {run_dt}")
         except Exception as e:
             await message.answer(f"❌ Помилка: {e}")
         finally:
-            del admin_states[user_id]
+            session.admin_state = None
 
 
-@router.message(F.text == "📊 Експорт логів")
-async def export_logs(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
-        return
-    await message.answer("🔄 Експорт логів...")
+# Основне меню
+@menu_button("📜 Умови")
+async def show_conditions(message: Message, session: UserSession):
+    await message.answer(
+        f"📜 Умови:\n1. Підписка на {CHANNEL_USERNAME}\n2. YouTube: {YOUTUBE_LINK}\n3. Twitch: {TWITCH_LINK}",
+        reply_markup=user_menu(message.from_user.id in ADMIN_IDS)
+    )
+
+
+@menu_button("🎁 Призи")
+async def show_prizes(message: Message, session: UserSession):
+    await message.answer(
+        "🎁 Призовий фонд: бонуси для 3 учасників!",
+        reply_markup=user_menu(message.from_user.id in ADMIN_IDS)
+    )
+
+
+@menu_button("📍 Мій статус")
+async def show_status(message: Message, session: UserSession):
+    user_id = message.from_user.id
+    participated = await participant_cache.get(user_id)
+    status = "✅ Ви берете участь!" if participated else "❌ Ви ще не брали участі."
+    await message.answer(status, reply_markup=user_menu(user_id in ADMIN_IDS))
+
+
+@menu_button("❓ FAQ")
+async def show_faq(message: Message, session: UserSession):
+    await message.answer(
+        "ℹ️ Часті питання:\n- Як дізнатися чи я зареєстрований?\n- Як змінити нікнейм?\n- Як зв'язатися з підтримкою?",
+        reply_markup=user_menu(message.from_user.id in ADMIN_IDS)
+    )
+
+
+@menu_button("↩️ Повернутись")
+async def back_from_admin_panel(message: Message, session: UserSession):
+    session.admin_state = None  # сбросим состояние, если что-то активное
+    await message.answer("🔙 Повертаємося:", reply_markup=user_menu(message.from_user.id in ADMIN_IDS))
+
+
+# Адмін-команди
+@menu_button("📤 Список з бази PostgreSQL", admin_only=True)
+async def export_participants_db(message: Message, session: UserSession):
+    await message.answer("🔄 Експортуємо список...")
+    export_func = export_db_to_excel(dp['db'])
+    file_path = await export_func()
+    await message.answer_document(FSInputFile(file_path))
+
+
+@menu_button("📊 Експорт логів", admin_only=True)
+async def export_logs(message: Message, session: UserSession):
+    reports = await dp['jobs'].recent_reports()
+    summary = "\n".join(
+        f"#{r['id']} {r['created_at']:%d.%m %H:%M}: ✅ {r['sent']} / ❌ {r['failed']} з {r['total']}"
+        + (f" ({r['errors']})" if r['errors'] else "")
+        for r in reports
+    )
+    await message.answer(f"🔄 Експорт логів...\n{summary}" if summary else "🔄 Експорт логів...")
     path = await export_logs_to_excel(dp['db'])
     await message.answer_document(FSInputFile(path))
 
 
-async def confirm_broadcast_manual(user_id: int):
-    data = broadcast_buffer.pop(user_id, None)
-    if not data:
+@menu_button("👥 Учасники", admin_only=True)
+async def show_participants(message: Message, session: UserSession):
+    if worker_shard is None:
+        info = await blocking_pool.run(participants_summary)
+    else:
+        info = participants_summary(await fetch_participants(dp['db']))
+    await message.answer(f"👥 Список учасників:\n{info}")
+
+
+@menu_button("📊 Статистика", admin_only=True)
+async def show_statistics(message: Message, session: UserSession):
+    pool_stats = blocking_pool.stats()
+    cache_stats = participant_cache.stats()
+    await message.answer(
+        f"📊 Зареєстровано учасників: {await count_participants(dp['db'])}\n"
+        f"⚙️ Пул задач: {pool_stats['running']} виконується, {pool_stats['queued']} у черзі, "
+        f"{pool_stats['completed']} виконано, {pool_stats['rejected']} відхилено, "
+        f"сер. {pool_stats['avg_ms']} мс\n"
+        f"💾 Черга запису в БД: {len(participant_writer)} учасників, {len(log_writer)} логів\n"
+        f"📍 Кеш статусу: {cache_stats['hits']} влучань, {cache_stats['misses']} промахів "
+        f"({cache_stats['hit_rate']:.0%})"
+    )
+
+
+@menu_button("📥 Експорт Excel", admin_only=True)
+async def export_participants_excel(message: Message, session: UserSession):
+    if worker_shard is None:
+        path = await blocking_pool.run(participants_store.export_excel, EXCEL_FILE)
+    else:
+        path = await export_db_to_excel(dp['db'])()
+    await message.answer_document(FSInputFile(path))
+
+
+@menu_button("📣 Розсилка", admin_only=True)
+async def start_broadcast_input(message: Message, session: UserSession):
+    session.admin_state = "awaiting_broadcast"
+    await message.answer("✉️ Надішліть текст, фото, відео, документ або альбом для розсилки.")
+
+
+@menu_button("🕒 Планувати розсилку", admin_only=True)
+async def start_schedule_input(message: Message, session: UserSession):
+    session.admin_state = "awaiting_schedule"
+    await message.answer("🕒 Введіть дату, час (YYYY-MM-DD HH:MM) та текст (або надішліть медіа з ними в підписі):")
+
+
+@menu_button("⛔ Забанені", admin_only=True)
+async def show_banned(message: Message, session: UserSession):
+    if not len(ban_list):
+        await message.answer("🚫 Забанені:\n✅ Список порожній.")
+        return
+    shown = [str(i) for i, _ in zip(ban_list, range(BANNED_PREVIEW))]
+    more = f"\n… та ще {len(ban_list) - len(shown)}" if len(ban_list) > len(shown) else ""
+    await message.answer(f"🚫 Забанені ({len(ban_list)}):\n" + "\n".join(shown) + more)
+
+
+async def confirm_broadcast_manual(session: UserSession):
+    user_id = session.user_id
+    payload = session.broadcast
+    session.broadcast = None
+    if not payload:
         await bot.send_message(user_id, "⚠️ Текст не знайдено.")
         return
-    msg = data["text"]
-    # Отримуємо список учасників з PostgreSQL
-    async with dp['db'].acquire() as conn:
-        rows = await conn.fetch("SELECT telegram_id FROM participants")
-    count, failed = 0, []
-    for r in rows:
-        tid = r["telegram_id"]
-        try:
-            await bot.send_message(tid, msg)
-            count += 1
-            await asyncio.sleep(0.05)
-        except Exception:
-            failed.append(tid)
-    # Логування результатів розсилки
-    await log_broadcast(dp['db'], msg, count, failed)
-    await bot.send_message(user_id, f"✅ Розсилка: {count} успішно, {len(failed)} помилок.")
+    await create_broadcast(user_id, payload)
 
 
-# Main
-async def main():
-    pool = await asyncpg.create_pool(
+async def confirm_album_broadcast(user_id: int, items: list[dict]):
+    try:
+        await create_broadcast(user_id, album_payload(items))
+    except Exception as e:
+        logging.error(f"Не вдалося створити розсилку альбому: {e}")
+        await bot.send_message(user_id, f"❌ Помилка розсилки альбому: {e}")
+
+
+async def create_broadcast(admin_id: int, payload: dict):
+    if payload["kind"] == "text":
+        message, payload = payload["text"], None
+    else:
+        # Файл уже в Telegram: далі кожному отримувачу йде лише file_id
+        payload = await dp['media'].remember(payload)
+        message = describe(payload)
+    # Створюємо задачу розсилки зі знімком отримувачів з PostgreSQL
+    job = await dp['jobs'].create(admin_id, message, payload)
+    start_broadcast_job(job)
+
+
+def start_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def start_broadcast_job(job: BroadcastJob):
+    # Розсилка йде у фоні, щоб не блокувати обробку інших оновлень
+    start_background(run_broadcast(job))
+
+
+async def run_broadcast(job: BroadcastJob):
+    resumed = " (відновлено)" if job.cursor else ""
+    progress = await bot.send_message(job.admin_id, f"📣 Розсилка #{job.id}{resumed}: {job.cursor}/{job.total}")
+
+    payload = job.payload or text_payload(job.message)
+
+    async def send(chat_id: int):
+        try:
+            await send_payload(bot, chat_id, payload)
+        except Exception as e:
+            BROADCAST_ERRORS.inc(type(e).__name__)
+            raise
+        BROADCAST_SENT.inc()
+
+    async def report(stats):
+        await bot.edit_message_text(
+            f"📣 Розсилка #{job.id}: {stats.done}/{stats.total} "
+            f"(✅ {stats.sent}, ❌ {stats.failed_count}, {stats.rate:.1f} повід./с)",
+            chat_id=job.admin_id,
+            message_id=progress.message_id
+        )
+
+    try:
+        stats = await run_job(dp['jobs'], broadcast_engine, job, send, on_progress=report)
+    except Exception as e:
+        await notify_admins(f"❌ Помилка розсилки #{job.id}:\n{e}")
+        return
+    # Логування результатів розсилки
+    await log_broadcast(job, stats)
+    await bot.send_message(job.admin_id, f"✅ Розсилка: {stats.sent} успішно, {stats.failed_count} помилок.")
+
+
+# Ініціалізація ресурсів процесу: спільна для polling та для кожного webhook-воркера
+async def on_startup(resume_jobs: bool = True, metrics_port: int = METRICS_PORT,
+                     record_path: str = RECORD_UPDATES, journal_path: str = JOURNAL_FILE,
+                     shard: int | None = None):
+    global worker_shard
+    started = time.monotonic()
+    worker_shard = shard
+    # Старий Excel імпортує лише один воркер, інакше учасники задвоїлися б між журналами
+    await blocking_pool.run(open_journal, shard_path(journal_path, shard), EXCEL_FILE if not shard else None)
+    for writer in (participant_writer, log_writer):
+        writer.spill_path = shard_path(writer.spill_path, shard)
+        writer.dead_letter_path = shard_path(writer.dead_letter_path, shard)
+    pool = await Database(
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX,
+        acquire_timeout=DB_ACQUIRE_TIMEOUT,
+        command_timeout=DB_COMMAND_TIMEOUT or None,
+        statement_cache_size=DB_STATEMENT_CACHE,
         user=DATABASE_USER,
         password=DATABASE_PASSWORD,
         database=DATABASE_NAME,
         host=DATABASE_HOST,
         port=DATABASE_PORT
-    )
-    global redis_client
-    redis_client = redis.Redis(host='localhost', port=6379, db=0)
+    ).connect()
+    global redis_client, metrics_runner, update_recorder
+    redis_client = InstrumentedRedis.from_url(REDIS_URL)
+    subscription_cache.redis = redis_client
+    participant_cache.redis = redis_client
+    rate_limiter.redis = redis_client
+    if STATE_STORAGE == "redis":
+        state_middleware.storage = RedisStateStorage(redis_client, STATE_TTL, flush_delay=STATE_FLUSH_DELAY)
     dp['db'] = pool
-    # Ініціалізуємо participants_set із БД для перевірки дублів
-    rows = await pool.fetch("SELECT telegram_id FROM participants")
-    for r in rows:
-        participants_set.add(r['telegram_id'])
+    watch_pool(pool)
+    if metrics_port:
+        metrics_runner = await start_metrics_server(METRICS_HOST, metrics_port)
+    if LOOP_LAG_THRESHOLD:
+        loop_watchdog.start()
+    if record_path:
+        update_recorder = UpdateRecorder(record_path, Anonymiser(BUTTON_TEXTS), executor=blocking_pool)
+        dp.update.outer_middleware(update_recorder)
+        logging.info(f"Оновлення записуються у {record_path}")
+    dp['jobs'] = BroadcastJobStore(pool)
+    await dp['jobs'].ensure_schema()
+    dp['media'] = MediaCache(pool)
+    await dp['media'].ensure_schema()
+    ban_list.pool = pool
+    ban_list.redis = redis_client
+    await ban_list.ensure_schema()
+    await ban_list.load()
+    ban_list.start_sync()
+    await ensure_participant_constraints(pool)
+    # Записувачі стартують лише після міграцій: вони одразу дописують spill
+    # у broadcast_logs/participants, колонки яких додає ensure_schema
+    for writer in (participant_writer, log_writer):
+        writer.pool = pool
+        writer.start()
+    # Індекс унікальності доповнюється учасниками з БД у фоні, не затримуючи старт
+    start_background(warm_up_participant_index(pool))
 
     dp.include_router(router)
-    scheduler.start()
-    await dp.start_polling(bot)
+    logging.info(f"Бот готовий обробляти оновлення за {time.monotonic() - started:.2f} с")
+    # Продовжуємо незавершені розсилки з останнього збереженого курсора
+    # (у режимі webhook — лише в одному воркері)
+    if resume_jobs:
+        for job in await dp['jobs'].unfinished():
+            logging.info(f"Відновлюємо розсилку #{job.id} з позиції {job.cursor}/{job.total}")
+            start_broadcast_job(job)
+        # Заплановані розсилки запускає той самий процес, що й відновлює незавершені
+        dp['scheduler'] = BroadcastScheduler(
+            dp['jobs'], start_broadcast_job, SCHEDULE_PREPARE_AHEAD, SCHEDULE_POLL_SECONDS
+        )
+        dp['scheduler'].start()
 
 
-async def is_flooding(user_id: int, limit_seconds: int = 2) -> bool:
-    key = f"user:{user_id}:flood"
-    exists = await redis_client.exists(key)
-    if exists:
-        return True
-    await redis_client.set(key, "1", ex=limit_seconds)
-    return False
+async def warm_up_participant_index(pool):
+    try:
+        await warm_up_index(pool, participant_index, executor=blocking_pool)
+    except Exception as e:
+        # Перевірки й далі йтимуть у БД — бот працює, лише повільніше
+        logging.error(f"Не вдалося прогріти індекс учасників: {e}")
+        await notify_admins(f"⚠️ Індекс учасників не прогріто, перевірки дублікатів ідуть у БД:\n{e}")
+
+
+async def on_shutdown():
+    await loop_watchdog.close()
+    if dp.get('scheduler') is not None:
+        await dp['scheduler'].close()
+    for task in list(background_tasks):
+        task.cancel()
+    await ban_list.close()
+    if update_recorder is not None:
+        await update_recorder.close()
+    # Дописуємо чергу до закриття пулу; незаписане лишається у spill-файлі
+    for writer in (participant_writer, log_writer):
+        await writer.close()
+    await dp['db'].close()
+    # Відкладені записи станів — до закриття клієнта Redis
+    try:
+        await state_middleware.storage.close()
+    except Exception as e:
+        logging.error(f"Не вдалося записати стан користувачів у Redis: {e}")
+    await redis_client.aclose()
+    await bot.session.close()
+    blocking_pool.shutdown()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
+
+# Main
+async def main():
+    await on_startup()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(
+            bot, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+            WEBHOOK_WORKERS, REDIS_URL, WEBHOOK_WORKER_CONCURRENCY, admin_ids=ADMIN_IDS
+        )
+    else:
+        asyncio.run(main())
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from array import array
+
+from aiogram import BaseMiddleware
+
+from compact import IntSet
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS banned_users (
+    telegram_id BIGINT PRIMARY KEY,
+    reason TEXT,
+    banned_by BIGINT,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+"""
+CHANNEL = "bans"
+
+
+# Список банів: джерело істини — PostgreSQL, перевірка — за локальною копією
+# в IntSet, тож на оновлення немає жодного запиту ні до БД, ні до Redis.
+# Зміни розходяться між процесами через Redis pub/sub ("+id,id" / "-id,id"),
+# а періодичне перечитування з БД підбирає те, що загубилося під час розриву.
+class BanList:
+    def __init__(self, pool=None, redis_client=None, channel: str = CHANNEL, resync_interval: float = 300):
+        self.pool = pool
+        self.redis = redis_client
+        self.channel = channel
+        self.resync_interval = resync_interval
+        self._ids = IntSet()
+        self._listener = None
+
+    def __contains__(self, telegram_id: int) -> bool:
+        return telegram_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    async def ensure_schema(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute(SCHEMA)
+
+    async def load(self):
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT telegram_id FROM banned_users ORDER BY telegram_id")
+        # ORDER BY по первинному ключу: масив уже відсортований і без повторів
+        self._ids = IntSet.from_sorted(array("q", (r["telegram_id"] for r in rows)))
+
+    async def ban(self, ids, reason: str | None = None, banned_by: int | None = None) -> int:
+        ids = sorted(set(ids))
+        if not ids:
+            return 0
+        if self.pool is not None:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    INSERT INTO banned_users (telegram_id, reason, banned_by)
+                    SELECT unnest($1::bigint[]), $2, $3
+                    ON CONFLICT DO NOTHING
+                    RETURNING telegram_id
+                    """,
+                    ids, reason, banned_by
+                )
+            added = len(rows)
+        else:
+            added = sum(1 for i in ids if i not in self._ids)
+        self._ids.update(ids)
+        await self._publish("+", ids)
+        return added
+
+    async def unban(self, ids) -> int:
+        ids = sorted(set(ids))
+        if not ids:
+            return 0
+        if self.pool is not None:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(
+                    "DELETE FROM banned_users WHERE telegram_id = ANY($1::bigint[]) RETURNING telegram_id", ids
+                )
+            removed = len(rows)
+        else:
+            removed = sum(1 for i in ids if i in self._ids)
+        for i in ids:
+            self._ids.discard(i)
+        await self._publish("-", ids)
+        return removed
+
+    async def _publish(self, op: str, ids: list[int]):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.publish(self.channel, op + ",".join(map(str, ids)))
+        except Exception as e:
+            logging.warning(f"Не вдалося розіслати зміну банів іншим процесам: {e}")
+
+    def apply(self, message):
+        if isinstance(message, bytes):
+            message = message.decode()
+        op, payload = message[0], message[1:]
+        ids = [int(i) for i in payload.split(",") if i]
+        if op == "+":
+            self._ids.update(ids)
+        elif op == "-":
+            for i in ids:
+                self._ids.discard(i)
+
+    def start_sync(self):
+        if self.redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen(), name="ban-list-sync")
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Після (пере)підключення перечитуємо список: поки нас не було, повідомлення губилися.
+                # Далі — раз на resync_interval від останнього читання, навіть якщо повідомлення йдуть безперервно
+                if self.pool is not None:
+                    await self.load()
+                loaded = time.monotonic()
+                while True:
+                    timeout = max(0.0, loaded + self.resync_interval - time.monotonic())
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+                    if message is not None:
+                        self.apply(message["data"])
+                    if time.monotonic() - loaded >= self.resync_interval:
+                        if self.pool is not None:
+                            await self.load()
+                        loaded = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Синхронізація банів перервана, перепідключаємось: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.aclose()
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+# Стоїть першим на message та callback_query: забанені користувачі не доходять
+# ні до антифлуду, ні до хендлерів. Адміністраторів бан не зачіпає.
+class BanMiddleware(BaseMiddleware):
+    def __init__(self, ban_list: BanList, exempt_ids=()):
+        self.ban_list = ban_list
+        self.exempt_ids = exempt_ids
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None and user.id in self.ban_list and user.id not in self.exempt_ids:
+            return None
+        return await handler(event, data)
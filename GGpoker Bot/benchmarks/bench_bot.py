@@ -0,0 +1,204 @@
+# Наскрізний бенчмарк: справжні dp/router бота проти локального фейкового
+# Bot API (HTTP) і замінників PostgreSQL/Redis у пам'яті. Для кожної кількості
+# учасників міряє оновлення/с і p50/p99 часу обробки оновлення, швидкість
+# розсилки (повідомлень/с) та час експорту учасників.
+# Запуск: python benchmarks/bench_bot.py [--sizes 1000,10000,100000,1000000]
+#         [--updates 5000] [--concurrency 100] [--latency-ms 0] [--throttle 0]
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("API_TOKEN", "123456:bench")
+os.environ.setdefault("CHANNEL_USERNAME", "@bench")
+os.environ["STATE_STORAGE"] = "memory"
+os.environ["METRICS_PORT"] = "0"
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+import BotGGpokerMain as app
+from broadcast import BroadcastEngine, PerChatLimiter, TokenBucket
+from broadcast_jobs import BroadcastJob, run_job
+from media import send_payload, text_payload
+from metrics import BotApiMetrics
+from state_storage import RedisStateStorage
+
+from fake_bot_api import FakeBotApi
+from standins import BASE_ID, MemoryJobStore, MemoryPool, MemoryRedis
+
+# Суміш оновлень: команда /start, кнопки меню (з них «Мій статус» іде в кеш/БД),
+# перевірка підписки (callback → getChatMember) та довільний текст
+MIX = ["/start", "📜 Умови", "🎁 Призи", "📍 Мій статус", "❓ FAQ", "participate", "просто текст"]
+
+
+def make_update(update_id: int, user_id: int, kind: str) -> Update:
+    user = {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"}
+    message = {
+        "message_id": update_id, "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"}, "from": user, "text": kind,
+    }
+    if kind == "participate":
+        data = {"callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": "bench", "data": kind, "message": message,
+        }}
+    else:
+        data = {"message": message}
+    return Update.model_validate({"update_id": update_id, **data}, context={"bot": app.bot})
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def bench_updates(participants: int, count: int, concurrency: int) -> dict:
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        # Кожне оновлення — від нового користувача, щоб не впиратися в антифлуд;
+        # непарні (поки вистачає учасників) — від зареєстрованих
+        user_id = BASE_ID + i if i % 2 and i < participants else BASE_ID + participants + i
+        async with slots:
+            update = make_update(i, user_id, MIX[i % len(MIX)])
+            started = time.perf_counter()
+            try:
+                await app.dp.feed_update(app.bot, update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(1, count + 1)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "updates_per_s": count / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+async def bench_broadcast(recipients: int, rate: float, concurrency: int) -> dict:
+    job = BroadcastJob(id=1, admin_id=0, message="bench", total=recipients)
+    engine = BroadcastEngine(TokenBucket(rate), PerChatLimiter(), concurrency=concurrency)
+    payload = text_payload(job.message)
+
+    async def send(chat_id: int):
+        await send_payload(app.bot, chat_id, payload)
+
+    started = time.perf_counter()
+    stats = await run_job(MemoryJobStore(recipients), engine, job, send)
+    elapsed = time.perf_counter() - started
+    return {"messages_per_s": stats.sent / elapsed, "failed": stats.failed_count, "throttled": stats.throttled}
+
+
+async def bench_export(directory: str, fmt: str) -> dict:
+    app.EXPORT_DIR = directory
+    app.EXPORT_FORMAT = fmt
+    started = time.perf_counter()
+    path = await app.export_db_to_excel(app.dp['db'])()
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {"export_s": elapsed, "export_mb": size / 1e6}
+
+
+# Бот з усіма middleware та кешами, але з фейковим Bot API і Redis у пам'яті
+async def start_bot(args) -> tuple[FakeBotApi, MemoryRedis]:
+    api = FakeBotApi(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                     throttle=args.throttle, retry_after=args.retry_after)
+    base_url = await api.start()
+    # Та сама сесія, що й у бойовому режимі, лише з іншою адресою Bot API
+    await app.bot.session.close()
+    app.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    app.bot.session.middleware(BotApiMetrics())
+
+    redis_client = MemoryRedis(latency=args.redis_ms / 1000)
+    for component in (app.subscription_cache, app.participant_cache, app.rate_limiter):
+        component.redis = redis_client
+    app.state_middleware.storage = RedisStateStorage(redis_client)
+    app.dp.include_router(app.router)
+    # Журнал учасників — у тимчасовому каталозі, а не поруч із кодом
+    app.open_journal(os.path.join(tempfile.mkdtemp(prefix="bench-journal-"), "participants.jsonl"))
+    # Рядок логу на кожне оновлення міряв би термінал, а не бота
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    return api, redis_client
+
+
+async def stop_bot(api: FakeBotApi):
+    await app.bot.session.close()
+    await api.close()
+    app.blocking_pool.shutdown()
+    shutil.rmtree(os.path.dirname(app.participants_store.path), ignore_errors=True)
+
+
+def add_environment_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--throttle", type=float, default=0, help="частка відповідей 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--redis-ms", type=float, default=0)
+    parser.add_argument("--db-ms", type=float, default=0)
+
+
+async def main(args):
+    api, redis_client = await start_bot(args)
+    # Прогрів: pydantic будує схеми моделей при першому використанні
+    app.dp['db'] = MemoryPool()
+    await bench_updates(0, len(MIX) * 20, args.concurrency)
+
+    print(f"Bot API: затримка {args.latency_ms} мс (+до {args.jitter_ms}), 429: {args.throttle:.0%}; "
+          f"Redis {args.redis_ms} мс, БД {args.db_ms} мс; паралельно {args.concurrency}")
+    header = (f"{'учасників':>10} {'онов./с':>9} {'p50 мс':>8} {'p99 мс':>8} {'помилок':>8} "
+              f"{'розсилка/с':>11} {'експорт с':>10} {'МБ':>7}")
+    print(header)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            app.dp['db'] = MemoryPool(size, latency=args.db_ms / 1000)
+            # Кожен розмір — з чистими кешами, інакше «Мій статус» не дійде до БД
+            app.participant_cache._local.clear()
+            redis_client._data.clear()
+            updates = await bench_updates(size, args.updates, args.concurrency)
+            recipients = min(size, args.broadcast_max)
+            broadcast = await bench_broadcast(recipients, args.broadcast_rate, args.broadcast_concurrency)
+            export = await bench_export(directory, args.format) if not args.skip_export else {}
+            print(
+                f"{size:>10} {updates['updates_per_s']:>9.0f} {updates['p50_ms']:>8.2f} {updates['p99_ms']:>8.2f} "
+                f"{updates['errors']:>8} {broadcast['messages_per_s']:>11.0f} "
+                f"{export.get('export_s', 0):>10.2f} {export.get('export_mb', 0):>7.1f}"
+                + (f"  (розсилка на {recipients})" if recipients < size else "")
+            )
+    print(f"Запитів до Bot API: {sum(api.requests.values())}, із них 429: {api.throttled}")
+    await stop_bot(api)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--updates", type=int, default=5000)
+    add_environment_args(parser)
+    # Реальний ліміт Telegram (~30/с) тут не цікавий: міряємо стелю самого конвеєра
+    parser.add_argument("--broadcast-rate", type=float, default=100_000)
+    parser.add_argument("--broadcast-concurrency", type=int, default=app.BROADCAST_CONCURRENCY)
+    parser.add_argument("--broadcast-max", type=int, default=100_000)
+    parser.add_argument("--format", default="csv.gz", choices=["xlsx", "csv.gz"])
+    parser.add_argument("--skip-export", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,89 @@
+# Пам'ять на одного відстежуваного користувача для станів у процесі:
+# set[int] / set[str] проти IntSet, індекс унікальності, сховище станів, антифлуд.
+# Запуск: python benchmarks/bench_memory.py [кількість користувачів]
+import asyncio
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compact import IntSet
+from participants_store import UniquenessIndex
+from rate_limit import LocalLimiter
+from state_storage import MemoryStateStorage
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+BASE_ID = 5_000_000_000
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, (after - before) / USERS
+
+
+def ids():
+    return range(BASE_ID, BASE_ID + USERS)
+
+
+def build_index():
+    index = UniquenessIndex()
+    for i in ids():
+        index.add(i, f"Player_{i}", f"player{i}@mail.com")
+    return index
+
+
+def build_legacy_index():
+    return (
+        {i for i in ids()},
+        {f"player_{i}" for i in ids()},
+        {f"player{i}@mail.com" for i in ids()},
+    )
+
+
+def build_state():
+    storage = MemoryStateStorage(ttl=3600, max_users=USERS)
+
+    async def fill():
+        for i in ids():
+            session = await storage.load(i)
+            session.user_state = {"step": "awaiting_email", "nickname": f"Player_{i}"}
+            await storage.save(session)
+
+    asyncio.run(fill())
+    return storage
+
+
+def build_legacy_state():
+    return {i: {"step": "awaiting_email", "nickname": f"Player_{i}"} for i in ids()}
+
+
+def build_limiter():
+    limiter = LocalLimiter(USERS)
+    for i in ids():
+        limiter.hit(f"message:{i}", 2)
+    return limiter
+
+
+def main():
+    rows = [
+        ("banned_users: set[int]", lambda: set(ids())),
+        ("banned_users: IntSet", lambda: IntSet(ids())),
+        ("індекс учасників: 3 × set", build_legacy_index),
+        ("індекс учасників: UniquenessIndex", build_index),
+        ("стан діалогу: dict (старий user_states)", build_legacy_state),
+        ("стан діалогу: MemoryStateStorage", build_state),
+        ("антифлуд: LocalLimiter", build_limiter),
+    ]
+    print(f"Користувачів: {USERS}")
+    for name, build in rows:
+        _, per_user = measure(build)
+        print(f"{name:<42} {per_user:8.1f} байт/користувача")
+
+
+if __name__ == "__main__":
+    main()
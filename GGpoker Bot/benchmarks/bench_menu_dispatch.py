@@ -0,0 +1,91 @@
+# Мікробенчмарк вибору гілки handle_messages: старий ланцюжок if/elif
+# (з побудовою клавіатури на кожну відповідь) проти таблиці MENU_ROUTES
+# з готовими клавіатурами. Запуск: python benchmarks/bench_menu_dispatch.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("API_TOKEN", "123456:bench")
+
+import BotGGpokerMain as app
+
+ADMIN_IDS = {1}
+LABELS = [
+    "📜 Умови", "🎁 Призи", "📍 Мій статус", "❓ FAQ", "👥 Учасники", "📊 Статистика",
+    "📥 Експорт Excel", "📣 Розсилка", "🕒 Планувати розсилку", "⛔ Забанені", "↩️ Повернутись",
+    "📤 Список з бази PostgreSQL", "📊 Експорт логів", "просто текст",
+]
+
+
+# Копія порядку перевірок зі старого handle_messages
+def legacy_dispatch(text, user_id):
+    picked = None
+    if text == "📤 Список з бази PostgreSQL" and user_id in ADMIN_IDS:
+        return "export_db"
+    elif text == "📊 Експорт логів" and user_id in ADMIN_IDS:
+        return "export_logs"
+    elif text == "📜 Умови":
+        app.build_user_menu(user_id in ADMIN_IDS)
+        picked = "conditions"
+    if text == "📜 Умови":
+        app.build_user_menu(user_id in ADMIN_IDS)
+        picked = "conditions"
+    elif text == "🎁 Призи":
+        app.build_user_menu(user_id in ADMIN_IDS)
+        picked = "prizes"
+    elif text == "📍 Мій статус":
+        app.build_user_menu(user_id in ADMIN_IDS)
+        picked = "status"
+    elif text == "❓ FAQ":
+        app.build_user_menu(user_id in ADMIN_IDS)
+        picked = "faq"
+    elif text == "👥 Учасники" and user_id in ADMIN_IDS:
+        picked = "participants"
+    elif text == "📊 Статистика" and user_id in ADMIN_IDS:
+        picked = "stats"
+    elif text == "📥 Експорт Excel" and user_id in ADMIN_IDS:
+        picked = "excel"
+    elif text == "📣 Розсилка" and user_id in ADMIN_IDS:
+        picked = "broadcast"
+    elif text == "🕒 Планувати розсилку" and user_id in ADMIN_IDS:
+        picked = "schedule"
+    elif text == "⛔ Забанені" and user_id in ADMIN_IDS:
+        picked = "banned"
+    elif text == "↩️ Повернутись":
+        app.build_user_menu(user_id in ADMIN_IDS)
+        picked = "back"
+    return picked
+
+
+USER_MENU_REPLIES = {"📜 Умови", "🎁 Призи", "📍 Мій статус", "❓ FAQ", "↩️ Повернутись"}
+
+
+def table_dispatch(text, user_id):
+    route = app.MENU_ROUTES.get(text)
+    if route is None:
+        return None
+    handler, admin_only = route
+    if admin_only and user_id not in ADMIN_IDS:
+        return None
+    if text in USER_MENU_REPLIES:
+        app.user_menu(user_id in ADMIN_IDS)
+    return handler
+
+
+def per_update_us(fn, number=20000):
+    def run():
+        for text in LABELS:
+            fn(text, 1)
+            fn(text, 2)
+    seconds = min(timeit.repeat(run, number=number // len(LABELS), repeat=5))
+    calls = (number // len(LABELS)) * len(LABELS) * 2
+    return seconds / calls * 1e6
+
+
+if __name__ == "__main__":
+    before = per_update_us(legacy_dispatch)
+    after = per_update_us(table_dispatch)
+    print(f"if/elif + побудова клавіатури: {before:8.3f} мкс/оновлення")
+    print(f"MENU_ROUTES + готові клавіатури: {after:8.3f} мкс/оновлення")
+    print(f"прискорення: x{before / after:.1f}")
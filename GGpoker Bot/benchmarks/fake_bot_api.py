@@ -0,0 +1,87 @@
+# Локальний сервер, що відповідає як Telegram Bot API: бот ходить до нього
+# справжнім HTTP через aiohttp-сесію aiogram. Затримка відповіді та частка
+# відповідей 429 (Too Many Requests) налаштовуються.
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+REPLY_PREFIX = 40
+MESSAGE_METHODS = {
+    "sendmessage", "editmessagetext", "sendphoto", "sendvideo", "senddocument", "sendanimation", "copymessage",
+}
+
+
+class FakeBotApi:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, throttle: float = 0.0,
+                 retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = Counter()
+        # Тексти відповідей бота (перші REPLY_PREFIX символів) — видно, чим закінчився сценарій
+        self.replies = Counter()
+        self.throttled = 0
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self.base_url = None
+
+    def _message(self, chat_id, text=None) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+            "text": text or "",
+        }
+
+    def _result(self, method: str, params: dict):
+        if method in MESSAGE_METHODS:
+            return self._message(params.get("chat_id"), params.get("text"))
+        if method == "sendmediagroup":
+            media = json.loads(params.get("media") or "[]")
+            return [self._message(params.get("chat_id")) for _ in media]
+        if method == "getchatmember":
+            user_id = int(params.get("user_id") or 0)
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": "User"}}
+        if method == "getme":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        return True
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.requests[method] += 1
+        if params.get("text"):
+            self.replies[params["text"][:REPLY_PREFIX].replace("\n", " ")] += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.throttle and self.random.random() < self.throttle:
+            self.throttled += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
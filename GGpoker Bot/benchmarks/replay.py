@@ -0,0 +1,238 @@
+# Відтворення записаного потоку оновлень (RECORD_UPDATES, див. update_recorder.py)
+# або синтетичного сплеску реєстрацій проти справжніх dp/router бота з фейковим
+# Bot API та замінниками PostgreSQL/Redis. Оновлення одного користувача йдуть
+# строго по черзі, різних — паралельно (як у воркері webhook).
+# Звіт: пропускна здатність, помилки, час і затримка старту за кроками
+# сценарію реєстрації, воронка та стани, у яких користувачі застрягли.
+# Запуск: python benchmarks/replay.py updates.rec.gz [updates.rec.gz.1 ...] [--speedup 10] [--clones 5]
+#         python benchmarks/replay.py --synthetic 5000 --duration 600 --speedup 20
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Бот створює журнал учасників і Excel-файли в поточному каталозі
+START_DIR = os.getcwd()
+WORKDIR = tempfile.mkdtemp(prefix="replay-")
+os.chdir(WORKDIR)
+
+from aiogram.types import Update
+
+from bench_bot import add_environment_args, app, percentile, start_bot, stop_bot
+from compact import IntSet
+from standins import MemoryPool
+from update_recorder import CALLBACK, EMAIL_RE, MESSAGE, read_recording
+from webhook import UserOrderedDispatcher
+
+PARTICIPATE_TEXT = "🎉 Взяти участь у розігарші"
+# Кроки сценарію реєстрації в порядку проходження
+FUNNEL = ["participate_command", "check_subscription", "nickname", "email", "confirm_participation"]
+CALLBACK_STEPS = {"participate": "check_subscription", "confirm_participation": "confirm_participation"}
+
+
+# Сплеск запуску розіграшу: users користувачів приходять рівномірно за duration
+# секунд і проходять реєстрацію з паузами «на подумати»; частина — з чужим ніком
+def synthetic_registrations(users: int, duration: float, duplicates: float = 0.0, seed: int = 0) -> list[list]:
+    rnd = random.Random(seed)
+    events = []
+    for user in range(users):
+        owner = rnd.randrange(user) if user and rnd.random() < duplicates else user
+        steps = [
+            (MESSAGE, "/start", 0), (MESSAGE, PARTICIPATE_TEXT, 4), (CALLBACK, "participate", 8),
+            (MESSAGE, f"nick{owner}", 10), (MESSAGE, f"user{owner}@example.com", 12),
+            (CALLBACK, "confirm_participation", 4),
+        ]
+        at = rnd.uniform(0, duration)
+        for kind, value, think in steps:
+            at += think * rnd.uniform(0.6, 1.4)
+            events.append([int(at * 1000), user + 1, kind, value])
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+# Копія k запису: інший користувач з іншим ніком та email (k = 0 — оригінал)
+def clone_event(event: list, k: int, clones: int) -> list:
+    at, user_id, kind, value = event
+    if k and kind == MESSAGE and value and value not in app.BUTTON_TEXTS and not value.startswith("/"):
+        value = value.replace("@", f".{k}@", 1) if EMAIL_RE.match(value) else f"{value}.{k}"
+    return [at, user_id * clones + k, kind, value]
+
+
+def make_update(update_id: int, user_id: int, kind: str, value: str | None) -> Update:
+    user = {"id": user_id, "is_bot": False, "first_name": "User"}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": {"id": user_id, "type": "private"},
+               "from": user, "text": value}
+    if kind == CALLBACK:
+        data = {"callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": "replay", "data": value, "message": message,
+        }}
+    else:
+        data = {"message": message}
+    return Update.model_validate({"update_id": update_id, **data}, context={"bot": app.bot})
+
+
+def step_of(kind: str, value: str | None, state) -> str:
+    if kind == CALLBACK:
+        return CALLBACK_STEPS.get(value, f"callback:{value}")
+    if value == PARTICIPATE_TEXT:
+        return "participate_command"
+    if state == "awaiting_nickname":
+        return "nickname"
+    if isinstance(state, dict) and state.get("step") == "awaiting_email":
+        return "email"
+    if value and value.startswith("/"):
+        return value
+    return "menu" if value in app.BUTTON_TEXTS else "text"
+
+
+def state_name(state) -> str | None:
+    if state is None:
+        return None
+    return state if isinstance(state, str) else state.get("step", "?")
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies = []
+        self.lags = []
+        self.errors = Counter()
+        self.users = set()
+
+
+async def replay(events: list[list], speedup: float, concurrency: int) -> tuple[dict, float]:
+    steps: dict[str, StepStats] = defaultdict(StepStats)
+    loop = asyncio.get_running_loop()
+    storage = app.state_middleware.storage
+
+    async def handle(item):
+        update_id, scheduled, (_, user_id, kind, value) = item
+        step = step_of(kind, value, (await storage.load(user_id)).user_state)
+        stats = steps[step]
+        started = loop.time()
+        stats.lags.append(started - scheduled)
+        try:
+            await app.dp.feed_update(app.bot, make_update(update_id, user_id, kind, value))
+        except Exception as e:
+            stats.errors[type(e).__name__] += 1
+        stats.latencies.append(loop.time() - started)
+        stats.users.add(user_id)
+
+    dispatcher = UserOrderedDispatcher(handle, concurrency)
+    first = events[0][0]
+    began = loop.time()
+    for update_id, event in enumerate(events, start=1):
+        scheduled = began + (event[0] - first) / 1000 / speedup
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Якщо всі слоти зайняті, submit чекає — це й видно як затримку старту
+        await dispatcher.submit(event[1], (update_id, scheduled, event))
+    await dispatcher.drain()
+    return steps, loop.time() - began
+
+
+def report(steps: dict, elapsed: float, events: list[list], speedup: float):
+    users = {e[1] for e in events}
+    recorded = (events[-1][0] - events[0][0]) / 1000
+    total_errors = sum(sum(s.errors.values()) for s in steps.values())
+    print(f"Подій: {len(events)}, користувачів: {len(users)}, запис: {recorded:.0f} с, прискорення x{speedup:g}")
+    print(f"Відтворено за {elapsed:.1f} с: {len(events) / elapsed:.0f} подій/с, помилок: {total_errors}")
+    print(f"\n{'крок':<24} {'подій':>7} {'помилок':>8} {'p50 мс':>8} {'p99 мс':>8} {'затримка p99 мс':>16}")
+    order = FUNNEL + sorted(set(steps) - set(FUNNEL))
+    for name in order:
+        stats = steps.get(name)
+        if stats is None:
+            continue
+        latencies, lags = sorted(stats.latencies), sorted(stats.lags)
+        print(f"{name:<24} {len(latencies):>7} {sum(stats.errors.values()):>8} "
+              f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{max(0.0, percentile(lags, 0.99)) * 1000:>16.1f}")
+        for error, count in stats.errors.most_common(3):
+            print(f"{'':<24}   {error}: {count}")
+
+    print("\nВоронка реєстрації (унікальні користувачі):")
+    for name in FUNNEL:
+        print(f"  {name:<24} {len(steps[name].users) if name in steps else 0:>7}")
+    print(f"  {'зареєстровано':<24} {len(app.participants_store):>7}")
+    print(f"  {'забанено (дублікати)':<24} {len(app.ban_list):>7}")
+    return users
+
+
+async def stalled_states(users) -> Counter:
+    storage = app.state_middleware.storage
+    stalled = Counter()
+    for user_id in users:
+        name = state_name((await storage.load(user_id)).user_state)
+        if name is not None:
+            stalled[name] += 1
+    return stalled
+
+
+async def main(args):
+    if args.synthetic:
+        events = synthetic_registrations(args.synthetic, args.duration, args.duplicates)
+    else:
+        events = read_recording([os.path.join(START_DIR, p) for p in args.recordings])
+    if not events:
+        print("Немає подій для відтворення")
+        return
+    if args.clones > 1:
+        events = sorted((clone_event(e, k, args.clones) for e in events for k in range(args.clones)),
+                        key=lambda e: e[0])
+
+    api, _ = await start_bot(args)
+    pool = MemoryPool(latency=args.db_ms / 1000)
+    app.dp['db'] = pool
+    app.participant_writer.pool = pool
+    app.participant_writer.start()
+    app.participant_index.load(IntSet(), IntSet(), IntSet())
+    # Антифлуд рахує справжні секунди — при прискоренні стискаємо й його інтервали
+    app.rate_limit_middleware.limits = {k: v / args.speedup for k, v in app.rate_limit_middleware.limits.items()}
+
+    steps, elapsed = await replay(events, args.speedup, args.concurrency)
+    await app.participant_writer.flush()
+    # Фонові завершення реєстрацій (відповідь після DB_CONFIRM_TIMEOUT)
+    if app.background_tasks:
+        await asyncio.gather(*app.background_tasks, return_exceptions=True)
+
+    users = report(steps, elapsed, events, args.speedup)
+    stalled = await stalled_states(users)
+    print("\nЗастрягли (стан наприкінці прогону):" + ("" if stalled else " немає"))
+    for name, count in stalled.most_common():
+        print(f"  {name:<24} {count:>7}")
+    print(f"\nЗапитів до Bot API: {sum(api.requests.values())}, із них 429: {api.throttled}")
+    print("Найчастіші відповіді бота:")
+    for text, count in api.replies.most_common(args.top_replies):
+        print(f"  {count:>7}  {text}")
+
+    await app.participant_writer.close()
+    await stop_bot(api)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recordings", nargs="*")
+    parser.add_argument("--synthetic", type=int, default=0, help="згенерувати реєстрації стількох користувачів")
+    parser.add_argument("--duration", type=float, default=600, help="тривалість синтетичного сплеску, с")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="частка синтетичних дублікатів ніку")
+    parser.add_argument("--speedup", type=float, default=1.0)
+    parser.add_argument("--clones", type=int, default=1, help="скільки разів розмножити кожного користувача")
+    parser.add_argument("--top-replies", type=int, default=10)
+    add_environment_args(parser)
+    args = parser.parse_args()
+    if not args.recordings and not args.synthetic:
+        parser.error("вкажіть файли запису або --synthetic N")
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
@@ -0,0 +1,226 @@
+# Замінники PostgreSQL і Redis у пам'яті процесу для бенчмарків. Вони підтримують
+# лише ті запити й команди, якими користуються виміряні шляхи бота, і можуть
+# додавати штучну мережеву затримку. Учасники не зберігаються списком:
+# рядок з номером i генерується на льоту, тож 1М учасників не займає пам'яті.
+import asyncio
+import time
+from datetime import datetime
+
+BASE_ID = 5_000_000_000
+
+
+def participant_row(i: int) -> tuple:
+    tid = BASE_ID + i
+    return (tid, f"@user{i}", f"User {i}", datetime(2024, 1, 1), f"Player_{i}", f"player{i}@mail.com")
+
+
+class _Transaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class MemoryCursor:
+    def __init__(self, rows):
+        self._rows = rows
+
+    async def fetch(self, n: int) -> list[tuple]:
+        return [row for _, row in zip(range(n), self._rows)]
+
+
+class MemoryConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self._staging = []
+
+    async def _delay(self):
+        if self.pool.latency:
+            await asyncio.sleep(self.pool.latency)
+
+    def transaction(self):
+        return _Transaction()
+
+    async def fetchval(self, query: str, *args):
+        await self._delay()
+        if "FROM participants WHERE telegram_id" in query:
+            return 1 if self.pool.has(args[0]) else None
+        raise NotImplementedError(query)
+
+    async def execute(self, query: str, *args):
+        await self._delay()
+        return "OK"
+
+    async def copy_records_to_table(self, table: str, records, columns):
+        await self._delay()
+        if table != "participants_staging":
+            raise NotImplementedError(table)
+        self._staging = list(records)
+
+    # INSERT ... SELECT FROM participants_staging ON CONFLICT DO NOTHING RETURNING:
+    # ті самі унікальні ключі, що й у PostgreSQL (ID, нікнейм і email без регістру)
+    async def fetch(self, query: str, *args):
+        await self._delay()
+        if "FROM participants_staging" not in query:
+            raise NotImplementedError(query)
+        inserted = []
+        for tid, _, _, _, nickname, email in self._staging:
+            keys = (tid, nickname.strip().lower(), email.strip().lower())
+            if self.pool.has(tid) or keys[1] in self.pool.nicknames or keys[2] in self.pool.emails:
+                continue
+            self.pool.registered.add(tid)
+            self.pool.nicknames.add(keys[1])
+            self.pool.emails.add(keys[2])
+            inserted.append({"telegram_id": tid, "nickname": nickname, "email": email})
+        self._staging = []
+        return inserted
+
+    async def cursor(self, query: str, *args):
+        if "FROM participants" in query:
+            return MemoryCursor(participant_row(i) for i in range(self.pool.participants))
+        raise NotImplementedError(query)
+
+
+class _Acquire:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        self.pool.in_use += 1
+        return MemoryConnection(self.pool)
+
+    async def __aexit__(self, *exc):
+        self.pool.in_use -= 1
+        return False
+
+
+class MemoryPool:
+    def __init__(self, participants: int = 0, latency: float = 0.0, max_size: int = 10):
+        self.participants = participants
+        self.latency = latency
+        self.max_size = max_size
+        self.in_use = 0
+        # Учасники, зареєстровані під час прогону (згенеровані — лише діапазоном ID)
+        self.registered: set[int] = set()
+        self.nicknames: set[str] = set()
+        self.emails: set[str] = set()
+
+    def has(self, telegram_id: int) -> bool:
+        return BASE_ID <= telegram_id < BASE_ID + self.participants or telegram_id in self.registered
+
+    def acquire(self):
+        return _Acquire(self)
+
+    def get_size(self):
+        return self.max_size
+
+    def get_idle_size(self):
+        return self.max_size - self.in_use
+
+    def get_max_size(self):
+        return self.max_size
+
+    async def close(self):
+        pass
+
+
+class _Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def set(self, *args, **kwargs):
+        self.ops.append(("set", args, kwargs))
+        return self
+
+    def delete(self, *args):
+        self.ops.append(("delete", args, {}))
+        return self
+
+    def mget(self, keys):
+        self.ops.append(("mget", keys, {}))
+        return self
+
+    async def execute(self):
+        await self.redis._delay()
+        return [self.redis._apply(op, args, kwargs) for op, args, kwargs in self.ops]
+
+
+class MemoryRedis:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._data: dict[str, tuple[bytes, float | None]] = {}
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _apply(self, op, args, kwargs):
+        if op == "set":
+            key, value = args
+            if kwargs.get("nx") and self._get(key) is not None:
+                return None
+            ttl = kwargs.get("ex") or (kwargs["px"] / 1000 if kwargs.get("px") else None)
+            raw = value if isinstance(value, bytes) else str(value).encode()
+            self._data[key] = (raw, time.monotonic() + ttl if ttl else None)
+            return True
+        if op == "delete":
+            return sum(self._data.pop(key, None) is not None for key in args)
+        if op == "mget":
+            return [self._get(key) for key in args]
+        raise NotImplementedError(op)
+
+    async def get(self, key):
+        await self._delay()
+        return self._get(key)
+
+    async def mget(self, keys):
+        await self._delay()
+        return [self._get(key) for key in keys]
+
+    async def set(self, key, value, **kwargs):
+        await self._delay()
+        return self._apply("set", (key, value), kwargs)
+
+    async def delete(self, *keys):
+        await self._delay()
+        return self._apply("delete", keys, {})
+
+    async def publish(self, channel, message):
+        await self._delay()
+        return 0
+
+    def pipeline(self, transaction: bool = True):
+        return _Pipeline(self)
+
+    async def aclose(self):
+        pass
+
+
+# Задача розсилки на count отримувачів (учасники 0..count-1), без PostgreSQL
+class MemoryJobStore:
+    def __init__(self, count: int):
+        self.count = count
+
+    async def next_batch(self, job, size):
+        start = job.cursor
+        return [(i + 1, BASE_ID + i) for i in range(start, min(start + size, self.count))]
+
+    async def checkpoint(self, job, cursor, sent, failed, deliveries=()):
+        job.cursor = cursor
+        job.success_count += sent
+        job.failed_count += len(failed)
+
+    async def finish(self, job, status="done"):
+        job.status = status
@@ -0,0 +1,98 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolOverloaded(Exception):
+    pass
+
+
+# Окремий пул для блокуючих операцій (файли, Excel, CPU-робота), щоб у циклі
+# подій лишалася тільки асинхронна робота. Кількість задач у черзі обмежена:
+# якщо місця немає довше за queue_timeout — піднімаємо PoolOverloaded.
+class BlockingPool:
+    def __init__(self, max_workers: int = 4, max_queue: int = 100, queue_timeout: float = 10.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking")
+        self._slots = None
+        self._slots_loop = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.running = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_slots(self):
+        # Семафор створюємо ліниво, вже всередині запущеного циклу подій
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+            self._slots_loop = loop
+        return self._slots
+
+    @property
+    def pending(self) -> int:
+        return self.submitted - self.completed - self.failed
+
+    @property
+    def queued(self) -> int:
+        return max(self.pending - self.running, 0)
+
+    def _timed(self, fn, *args, **kwargs):
+        with self._lock:
+            self.running += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.running -= 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    async def run(self, fn, *args, **kwargs):
+        slots = self._get_slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PoolOverloaded(f"черга блокуючих задач заповнена ({self.pending})")
+        self.submitted += 1
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._timed, fn, *args, **kwargs)
+        try:
+            result = await loop.run_in_executor(self._executor, call)
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            slots.release()
+
+    def stats(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "workers": self.max_workers,
+            "queue_limit": self.max_queue,
+            "running": self.running,
+            "queued": self.queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds / done * 1000, 2) if done else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+# Ліміти Telegram Bot API: ~30 повідомлень/с на бота та 1 повідомлення/с в один чат
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+MAX_ATTEMPTS = 5
+# 429 не витрачає спроби; натомість на одного отримувача є спільний бюджет
+# очікування (секунди retry_after), після якого він вважається недоставленим
+MAX_THROTTLE_WAIT = 600
+
+
+# Глобальний token-bucket: один на весь процес, спільний для всіх розсилок
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    # Після 429 пригальмовуємо всіх відправників, а не лише того, хто отримав помилку
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+# Мінімальний інтервал між повідомленнями в один і той самий чат
+class PerChatLimiter:
+    def __init__(self, interval: float = PER_CHAT_INTERVAL, max_tracked: int = 10_000):
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self._last: dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        last = self._last.get(chat_id)
+        if last is not None and now - last < self.interval:
+            await asyncio.sleep(self.interval - (now - last))
+            now = time.monotonic()
+        self._last[chat_id] = now
+        if len(self._last) > self.max_tracked:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        self._last = {cid: t for cid, t in self._last.items() if now - t < self.interval}
+
+
+@dataclass
+class BroadcastStats:
+    total: int
+    sent: int = 0
+    failed: list[int] = field(default_factory=list)
+    throttled: int = 0
+    # Скільки доставок було зроблено до поточного запуску (при відновленні задачі)
+    base: int = 0
+    # Помилки, зафіксовані до поточного запуску (самі ID — у таблиці доставок)
+    failed_base: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    # Результати по кожному отримувачу (chat_id, клас помилки або None, час);
+    # збираються лише якщо список задано, і вичищаються тим, хто їх зберігає
+    results: list | None = None
+
+    @property
+    def failed_count(self) -> int:
+        return self.failed_base + len(self.failed)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed_count
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return (self.done - self.base) / elapsed if elapsed > 0 else 0.0
+
+
+class BroadcastEngine:
+    def __init__(self, pacer: TokenBucket, chat_limiter: PerChatLimiter | None = None,
+                 concurrency: int = 20, progress_interval: float = 5.0,
+                 max_throttle_wait: float = MAX_THROTTLE_WAIT):
+        self.pacer = pacer
+        self.chat_limiter = chat_limiter or PerChatLimiter()
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.max_throttle_wait = max_throttle_wait
+
+    # send(chat_id) — корутина, що надсилає одне повідомлення одному отримувачу
+    async def run(self, recipients, send, on_progress=None, stats: BroadcastStats | None = None) -> BroadcastStats:
+        recipients = list(recipients)
+        if stats is None:
+            stats = BroadcastStats(total=len(recipients))
+        queue = iter(recipients)
+
+        async def worker():
+            for chat_id in queue:
+                error = await self._deliver(chat_id, send, stats)
+                if error is None:
+                    stats.sent += 1
+                else:
+                    stats.failed.append(chat_id)
+                if stats.results is not None:
+                    stats.results.append((chat_id, error, datetime.now()))
+
+        reporter = None
+        if on_progress is not None:
+            reporter = asyncio.create_task(self._report(stats, on_progress))
+        try:
+            workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(recipients)) or 1)]
+            await asyncio.gather(*workers)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+                try:
+                    await reporter
+                except asyncio.CancelledError:
+                    pass
+        return stats
+
+    # Повертає None, якщо доставлено, або назву класу останньої помилки
+    async def _deliver(self, chat_id: int, send, stats: BroadcastStats) -> str | None:
+        attempt = 0
+        throttle_wait = 0.0
+        error = None
+        while attempt < MAX_ATTEMPTS:
+            await self.pacer.acquire()
+            await self.chat_limiter.wait(chat_id)
+            try:
+                await send(chat_id)
+                return None
+            except TelegramRetryAfter as e:
+                # 429 не рахується як помилка користувача: гальмуємо всю розсилку і пробуємо знову,
+                # поки не вичерпано бюджет очікування (не менше секунди за кожну 429)
+                stats.throttled += 1
+                self.pacer.pause(e.retry_after)
+                throttle_wait += max(e.retry_after, 1)
+                if throttle_wait > self.max_throttle_wait:
+                    logging.info(f"Розсилка: {chat_id} не отримав повідомлення через ліміти Telegram")
+                    return type(e).__name__
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                error = type(e).__name__
+                logging.warning(f"Розсилка: тимчасова помилка для {chat_id}: {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                logging.info(f"Розсилка: не вдалося надіслати {chat_id}: {e}")
+                return type(e).__name__
+        return error
+
+    async def _report(self, stats: BroadcastStats, on_progress):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await on_progress(stats)
+            except Exception as e:
+                logging.warning(f"Розсилка: не вдалося оновити прогрес: {e}")
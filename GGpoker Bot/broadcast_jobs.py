@@ -0,0 +1,376 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from broadcast import BroadcastEngine, BroadcastStats
+from database import Query
+from media import dump_payload, load_payload
+
+# Розсилка зберігається як задача: знімок отримувачів робиться один раз,
+# а курсор доставки фіксується в БД після кожної пачки.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    admin_id BIGINT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    total INTEGER NOT NULL DEFAULT 0,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    success_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS broadcast_job_recipients (
+    job_id BIGINT NOT NULL REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS broadcast_jobs_status_idx ON broadcast_jobs (status) WHERE status = 'running';
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS failed_count INTEGER NOT NULL DEFAULT 0;
+-- Одноразово переносимо лічильник зі старого масиву failed_ids (ID тепер у broadcast_deliveries)
+-- і видаляємо колонку: на наступних стартах переносити вже нічого.
+-- Блокування — щоб воркери, які стартують одночасно, не переносили двічі
+DO $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('broadcast_jobs.failed_ids'));
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_schema = current_schema() AND table_name = 'broadcast_jobs'
+                 AND column_name = 'failed_ids') THEN
+        UPDATE broadcast_jobs SET failed_count = failed_count + cardinality(failed_ids)
+        WHERE cardinality(failed_ids) > 0;
+        ALTER TABLE broadcast_jobs DROP COLUMN failed_ids;
+    END IF;
+END $$;
+
+-- Результат доставки кожному отримувачу: завантажується COPY разом із чекпоінтом пачки
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    job_id BIGINT NOT NULL REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+    telegram_id BIGINT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    delivered_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS broadcast_deliveries_job_idx ON broadcast_deliveries (job_id, status, error);
+CREATE INDEX IF NOT EXISTS broadcast_deliveries_failed_idx ON broadcast_deliveries (job_id, telegram_id)
+    WHERE status = 'failed';
+
+CREATE OR REPLACE VIEW broadcast_delivery_summary AS
+SELECT job_id,
+       count(*) FILTER (WHERE status = 'sent') AS sent,
+       count(*) FILTER (WHERE status = 'failed') AS failed,
+       min(delivered_at) AS first_delivery,
+       max(delivered_at) AS last_delivery
+FROM broadcast_deliveries
+GROUP BY job_id;
+
+CREATE OR REPLACE VIEW broadcast_delivery_errors AS
+SELECT job_id, error, count(*) AS failures
+FROM broadcast_deliveries
+WHERE status = 'failed'
+GROUP BY job_id, error;
+
+-- Заплановані розсилки: scheduled → prepared (знімок отримувачів готовий) → running
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS scheduled_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS broadcast_jobs_scheduled_idx ON broadcast_jobs (scheduled_at)
+    WHERE status IN ('scheduled', 'prepared');
+
+-- Медіа-розсилки: що саме надсилати (file_id, підписи, альбом); NULL — звичайний текст
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS payload JSONB;
+
+ALTER TABLE IF EXISTS broadcast_logs
+    ADD COLUMN IF NOT EXISTS job_id BIGINT,
+    ADD COLUMN IF NOT EXISTS failed_count INTEGER;
+"""
+
+DELIVERY_COLUMNS = ["job_id", "telegram_id", "status", "error", "delivered_at"]
+
+# Гарячі запити розсилки: по одному на кожну пачку отримувачів
+NEXT_BATCH = Query("broadcast_next_batch", """
+    SELECT seq, telegram_id FROM broadcast_job_recipients
+    WHERE job_id = $1 AND seq > $2 ORDER BY seq LIMIT $3
+""")
+CHECKPOINT = Query("broadcast_checkpoint", """
+    UPDATE broadcast_jobs
+    SET cursor = $2, success_count = success_count + $3,
+        failed_count = failed_count + $4, updated_at = now()
+    WHERE id = $1
+""")
+
+# Звіт по розсилках для «📊 Експорт логів»: агрегати з представлень, без розбору тексту
+REPORT_QUERY = """
+SELECT j.id, j.created_at, j.message, j.status, j.total,
+       coalesce(s.sent, 0) AS sent, coalesce(s.failed, 0) AS failed,
+       s.first_delivery, s.last_delivery, e.errors
+FROM broadcast_jobs j
+LEFT JOIN broadcast_delivery_summary s ON s.job_id = j.id
+LEFT JOIN (
+    SELECT job_id, string_agg(coalesce(error, '?') || ': ' || failures, ', ' ORDER BY failures DESC) AS errors
+    FROM broadcast_delivery_errors
+    GROUP BY job_id
+) e ON e.job_id = j.id
+ORDER BY j.id DESC
+"""
+REPORT_HEADER = ["job_id", "created_at", "message", "status", "total", "sent", "failed",
+                 "first_delivery", "last_delivery", "errors"]
+
+CHECKPOINT_BATCH = 500
+
+
+@dataclass
+class BroadcastJob:
+    id: int
+    admin_id: int
+    message: str
+    total: int = 0
+    cursor: int = 0
+    success_count: int = 0
+    failed_count: int = 0
+    status: str = "running"
+    scheduled_at: datetime | None = None
+    payload: dict | None = None
+
+
+def _job_from_row(row) -> BroadcastJob:
+    return BroadcastJob(
+        id=row["id"],
+        admin_id=row["admin_id"],
+        message=row["message"],
+        total=row["total"],
+        cursor=row["cursor"],
+        success_count=row["success_count"],
+        failed_count=row["failed_count"],
+        status=row["status"],
+        scheduled_at=row["scheduled_at"],
+        payload=load_payload(row["payload"]),
+    )
+
+
+class BroadcastJobStore:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def ensure_schema(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute(SCHEMA)
+
+    # Знімок отримувачів одним запитом на боці сервера
+    @staticmethod
+    async def _snapshot(conn, job_id: int) -> int:
+        status = await conn.execute(
+            """
+            INSERT INTO broadcast_job_recipients (job_id, seq, telegram_id)
+            SELECT $1, row_number() OVER (ORDER BY telegram_id), telegram_id FROM participants
+            """,
+            job_id
+        )
+        total = int(status.split()[-1])
+        await conn.execute("UPDATE broadcast_jobs SET total = $2 WHERE id = $1", job_id, total)
+        return total
+
+    async def create(self, admin_id: int, message: str, payload: dict | None = None) -> BroadcastJob:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                job_id = await conn.fetchval(
+                    "INSERT INTO broadcast_jobs (admin_id, message, payload) VALUES ($1, $2, $3::jsonb) RETURNING id",
+                    admin_id, message, dump_payload(payload)
+                )
+                total = await self._snapshot(conn, job_id)
+        return BroadcastJob(id=job_id, admin_id=admin_id, message=message, total=total, payload=payload)
+
+    async def schedule(self, admin_id: int, message: str, at: datetime, payload: dict | None = None) -> BroadcastJob:
+        async with self.pool.acquire() as conn:
+            job_id = await conn.fetchval(
+                """
+                INSERT INTO broadcast_jobs (admin_id, message, status, scheduled_at, payload)
+                VALUES ($1, $2, 'scheduled', $3, $4::jsonb) RETURNING id
+                """,
+                admin_id, message, at, dump_payload(payload)
+            )
+        return BroadcastJob(id=job_id, admin_id=admin_id, message=message, status="scheduled",
+                            scheduled_at=at, payload=payload)
+
+    async def scheduled(self) -> list[BroadcastJob]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT * FROM broadcast_jobs WHERE status IN ('scheduled', 'prepared') ORDER BY scheduled_at"
+            )
+        return [_job_from_row(r) for r in rows]
+
+    # Знімки для розсилок, час яких настане в межах until. Зміна статусу й знімок —
+    # одна транзакція, тож кілька процесів не зроблять знімок двічі.
+    async def prepare_due(self, until: datetime) -> list[int]:
+        prepared = []
+        async with self.pool.acquire() as conn:
+            ids = await conn.fetch(
+                "SELECT id FROM broadcast_jobs WHERE status = 'scheduled' AND scheduled_at <= $1 ORDER BY scheduled_at",
+                until
+            )
+            for r in ids:
+                async with conn.transaction():
+                    claimed = await conn.fetchval(
+                        "UPDATE broadcast_jobs SET status = 'prepared', updated_at = now() "
+                        "WHERE id = $1 AND status = 'scheduled' RETURNING id",
+                        r["id"]
+                    )
+                    if claimed is not None:
+                        await self._snapshot(conn, claimed)
+                        prepared.append(claimed)
+        return prepared
+
+    # Атомарно переводить готові розсилки, час яких настав, у running
+    async def claim_due(self, now: datetime) -> list[BroadcastJob]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                UPDATE broadcast_jobs SET status = 'running', updated_at = now()
+                WHERE status = 'prepared' AND scheduled_at <= $1
+                RETURNING *
+                """,
+                now
+            )
+        return sorted((_job_from_row(r) for r in rows), key=lambda j: j.scheduled_at)
+
+    # Найближча подія планувальника: знімок (за prepare_ahead до часу) або старт
+    async def next_event_at(self, prepare_ahead: timedelta) -> datetime | None:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(
+                """
+                SELECT min(CASE WHEN status = 'scheduled' THEN scheduled_at - $1::interval ELSE scheduled_at END)
+                FROM broadcast_jobs WHERE status IN ('scheduled', 'prepared')
+                """,
+                prepare_ahead
+            )
+
+    async def cancel(self, job_id: int) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                cancelled = await conn.fetchval(
+                    "UPDATE broadcast_jobs SET status = 'cancelled', updated_at = now() "
+                    "WHERE id = $1 AND status IN ('scheduled', 'prepared') RETURNING id",
+                    job_id
+                )
+                if cancelled is not None:
+                    await conn.execute("DELETE FROM broadcast_job_recipients WHERE job_id = $1", job_id)
+        return cancelled is not None
+
+    async def unfinished(self) -> list[BroadcastJob]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+        return [_job_from_row(r) for r in rows]
+
+    async def next_batch(self, job: BroadcastJob, size: int) -> list[tuple[int, int]]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(NEXT_BATCH, job.id, job.cursor, size)
+        return [(r["seq"], r["telegram_id"]) for r in rows]
+
+    # Курсор, лічильники та результати доставки пачки фіксуються однією транзакцією,
+    # тож після збою повторно надіслана пачка не дублює рядки в broadcast_deliveries
+    async def checkpoint(self, job: BroadcastJob, cursor: int, sent: int, failed: list[int],
+                         deliveries: list[tuple] = ()):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if deliveries:
+                    await conn.copy_records_to_table(
+                        "broadcast_deliveries",
+                        records=[
+                            (job.id, chat_id, "sent" if error is None else "failed", error, at)
+                            for chat_id, error, at in deliveries
+                        ],
+                        columns=DELIVERY_COLUMNS
+                    )
+                await conn.execute(CHECKPOINT, job.id, cursor, sent, len(failed))
+        job.cursor = cursor
+        job.success_count += sent
+        job.failed_count += len(failed)
+
+    async def recent_reports(self, limit: int = 5) -> list:
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(f"{REPORT_QUERY} LIMIT $1", limit)
+
+    async def finish(self, job: BroadcastJob, status: str = "done"):
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE broadcast_jobs SET status = $2, updated_at = now() WHERE id = $1",
+                job.id, status
+            )
+
+
+# Доставка задачі пачками від останнього курсора. Після збою повторно
+# може бути надіслано не більше однієї незафіксованої пачки.
+async def run_job(store: BroadcastJobStore, engine: BroadcastEngine, job: BroadcastJob, send,
+                  on_progress=None, batch_size: int = CHECKPOINT_BATCH) -> BroadcastStats:
+    stats = BroadcastStats(total=job.total, sent=job.success_count, failed_base=job.failed_count, results=[])
+    stats.base = stats.done
+    while True:
+        batch = await store.next_batch(job, batch_size)
+        if not batch:
+            break
+        sent_before, failed_before = stats.sent, len(stats.failed)
+        await engine.run([tid for _, tid in batch], send, on_progress=on_progress, stats=stats)
+        deliveries, stats.results = stats.results, []
+        await store.checkpoint(job, batch[-1][0], stats.sent - sent_before, stats.failed[failed_before:], deliveries)
+    await store.finish(job)
+    return stats
+
+
+# Планувальник розсилок поверх broadcast_jobs: задачі живуть у PostgreSQL, тож
+# переживають перезапуск. Знімок отримувачів робиться за prepare_ahead до старту,
+# а в потрібний момент задача запускається тим самим start_job, що й ручна розсилка.
+class BroadcastScheduler:
+    def __init__(self, store: BroadcastJobStore, start_job, prepare_ahead: float = 120,
+                 poll_interval: float = 5):
+        self.store = store
+        self.start_job = start_job
+        self.prepare_ahead = timedelta(seconds=prepare_ahead)
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="broadcast-scheduler")
+
+    # Нова задача в цьому процесі — перераховуємо час сну одразу (інші процеси
+    # дізнаються про неї з наступного опитування)
+    def wake(self):
+        self._wakeup.set()
+
+    async def tick(self, now: datetime | None = None):
+        now = now or datetime.now()
+        for job_id in await self.store.prepare_due(now + self.prepare_ahead):
+            logging.info(f"Заплановану розсилку #{job_id} підготовлено")
+        for job in await self.store.claim_due(now):
+            logging.info(f"Запускаємо заплановану розсилку #{job.id} ({job.total} отримувачів)")
+            self.start_job(job)
+
+    async def _sleep_time(self) -> float:
+        next_at = await self.store.next_event_at(self.prepare_ahead)
+        if next_at is None:
+            return self.poll_interval
+        return min(self.poll_interval, max((next_at - datetime.now()).total_seconds(), 0))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+                timeout = await self._sleep_time()
+            except Exception as e:
+                logging.error(f"Планувальник розсилок: {e}")
+                timeout = self.poll_interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
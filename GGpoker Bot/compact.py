@@ -0,0 +1,104 @@
+import hashlib
+from array import array
+from bisect import bisect_left
+from heapq import merge
+
+# Компактні структури для станів, що ростуть разом з аудиторією.
+# Python set[int] коштує ~60-70 байт на елемент; тут — 8 байт в array('q')
+# плюс невеликий буфер змін, який періодично зливається в масив.
+
+
+def hash64(value: str) -> int:
+    # 64-бітний відбиток рядка: 8 байт замість окремого str-об'єкта в set
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def sort_unique(values: array, run: int = 1 << 16) -> array:
+    # Сортування з дедуплікацією без set і list на всі значення: масив сортується
+    # на місці шматками по run елементів, далі шматки зливаються в новий масив.
+    # Пік — 16 байт на елемент (вхід + результат) плюс один шматок у list
+    n = len(values)
+    for start in range(0, n, run):
+        values[start:start + run] = array(values.typecode, sorted(values[start:start + run]))
+
+    def chunk(start):
+        return (values[i] for i in range(start, min(start + run, n)))
+
+    result = array(values.typecode)
+    last = None
+    for value in merge(*(chunk(start) for start in range(0, n, run))):
+        if value != last:
+            result.append(value)
+            last = value
+    return result
+
+
+class IntSet:
+    __slots__ = ("_base", "_added", "_removed", "_min_merge")
+
+    def __init__(self, values=(), min_merge: int = 4096):
+        self._base = array("q", sorted(set(values)))
+        self._added = set()
+        self._removed = set()
+        self._min_merge = min_merge
+
+    # Масив має бути вже відсортованим і без повторів (наприклад, з COPY ... ORDER BY)
+    @classmethod
+    def from_sorted(cls, values: array, min_merge: int = 4096) -> "IntSet":
+        result = cls(min_merge=min_merge)
+        result._base = values
+        return result
+
+    def _in_base(self, value: int) -> bool:
+        i = bisect_left(self._base, value)
+        return i < len(self._base) and self._base[i] == value
+
+    def __contains__(self, value) -> bool:
+        if value in self._added:
+            return True
+        if value in self._removed:
+            return False
+        return self._in_base(value)
+
+    def add(self, value: int):
+        if value in self._removed:
+            self._removed.discard(value)
+        elif not self._in_base(value):
+            self._added.add(value)
+            self._maybe_merge()
+
+    def discard(self, value: int):
+        if value in self._added:
+            self._added.discard(value)
+        elif self._in_base(value):
+            self._removed.add(value)
+            self._maybe_merge()
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def _maybe_merge(self):
+        # Поріг росте з розміром множини, тож злиття амортизовано O(1) на елемент
+        if len(self._added) + len(self._removed) >= max(self._min_merge, len(self._base) >> 3):
+            self.compact()
+
+    def compact(self):
+        removed = self._removed
+        base = (v for v in self._base if v not in removed) if removed else self._base
+        self._base = array("q", merge(base, sorted(self._added)))
+        self._added = set()
+        self._removed = set()
+
+    def __len__(self):
+        return len(self._base) - len(self._removed) + len(self._added)
+
+    def __iter__(self):
+        removed = self._removed
+        return merge((v for v in self._base if v not in removed), sorted(self._added))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def nbytes(self) -> int:
+        return self._base.itemsize * len(self._base)
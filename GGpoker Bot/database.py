@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import re
+import time
+from functools import lru_cache
+
+import asyncpg
+
+from metrics import DB_ACQUIRE_TIMEOUTS, DB_ACQUIRE_WAIT, DB_QUERY_ERRORS, DB_QUERY_LATENCY, DB_QUERY_ROWS
+
+# Доступ до PostgreSQL: пул з явними розмірами та тайм-аутами, час, рядки й
+# помилки кожного запиту в метриках, черга на з'єднання (насичення пулу).
+# Сховища (BroadcastJobStore, BanList, записувачі, експорт) отримують Database
+# замість asyncpg.Pool — інтерфейс acquire() той самий.
+#
+# Гарячі запити оголошуються як Query — рядок SQL з іменем для метрик.
+# Готування операторів лишається за кешем asyncpg (statement_cache_size):
+# він прив'язаний до з'єднання, а не до одного acquire, тож гарячий запит
+# готується на з'єднанні один раз і переживає повернення з'єднання в пул.
+# Власні PreparedStatement тут не зберігаються: asyncpg забороняє їх
+# використовувати після release (InterfaceError). Решта запитів — звичайні
+# рядки; мітка в метриках — «дієслово таблиця».
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)", re.IGNORECASE)
+_ROWS_RE = re.compile(r"(\d+)$")
+
+
+class Query(str):
+    def __new__(cls, name: str, sql: str):
+        query = super().__new__(cls, sql)
+        query.name = name
+        return query
+
+
+@lru_cache(maxsize=512)
+def _label(sql: str) -> str:
+    words = sql.split(None, 1)
+    if not words:
+        return "?"
+    # Скидання стану з'єднання під час повернення в пул (Connection.reset)
+    if "pg_advisory_unlock_all" in sql:
+        return "reset"
+    match = _TABLE_RE.search(sql)
+    verb = words[0].lower()
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+def query_label(query) -> str:
+    return query.name if isinstance(query, Query) else _label(query)
+
+
+def _status_rows(status) -> int:
+    match = _ROWS_RE.search(status or "")
+    return int(match.group(1)) if match else 0
+
+
+class TimedConnection(asyncpg.Connection):
+    async def _timed(self, label: str, call, rows):
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except Exception as e:
+            DB_QUERY_ERRORS.inc(label, type(e).__name__)
+            raise
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - started, label)
+        DB_QUERY_ROWS.inc(label, amount=rows(result))
+        return result
+
+    async def execute(self, query: str, *args, timeout=None) -> str:
+        return await self._timed(
+            query_label(query), lambda: super(TimedConnection, self).execute(query, *args, timeout=timeout),
+            _status_rows
+        )
+
+    async def executemany(self, command: str, args, *, timeout=None):
+        args = list(args)
+        return await self._timed(
+            query_label(command), lambda: super(TimedConnection, self).executemany(command, args, timeout=timeout),
+            lambda _: len(args)
+        )
+
+    async def fetch(self, query, *args, timeout=None, record_class=None) -> list:
+        return await self._timed(
+            query_label(query),
+            lambda: super(TimedConnection, self).fetch(query, *args, timeout=timeout, record_class=record_class),
+            len
+        )
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        return await self._timed(
+            query_label(query),
+            lambda: super(TimedConnection, self).fetchval(query, *args, column=column, timeout=timeout),
+            lambda value: int(value is not None)
+        )
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        return await self._timed(
+            query_label(query),
+            lambda: super(TimedConnection, self).fetchrow(query, *args, timeout=timeout, record_class=record_class),
+            lambda row: int(row is not None)
+        )
+
+    async def copy_records_to_table(self, table_name, *, records, **kwargs):
+        records = list(records)
+        return await self._timed(
+            f"copy {table_name}",
+            lambda: super(TimedConnection, self).copy_records_to_table(table_name, records=records, **kwargs),
+            lambda _: len(records)
+        )
+
+    async def copy_from_query(self, query, *args, output, **kwargs):
+        return await self._timed(
+            query_label(query), lambda: super(TimedConnection, self).copy_from_query(query, *args, output=output, **kwargs),
+            _status_rows
+        )
+
+
+class _Acquire:
+    def __init__(self, db):
+        self.db = db
+        self.conn = None
+
+    async def __aenter__(self):
+        self.conn = await self.db._acquire()
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        await self.db.pool.release(self.conn)
+        return False
+
+
+class Database:
+    def __init__(self, min_size: int = 2, max_size: int = 10, acquire_timeout: float = 10,
+                 command_timeout: float | None = None, statement_cache_size: int = 100,
+                 max_inactive_lifetime: float = 300, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.command_timeout = command_timeout
+        self.statement_cache_size = statement_cache_size
+        self.max_inactive_lifetime = max_inactive_lifetime
+        self.connect_kwargs = connect_kwargs
+        self.pool = None
+        # Скільки корутин зараз чекають на вільне з'єднання
+        self.waiting = 0
+
+    async def connect(self):
+        self.pool = await asyncpg.create_pool(
+            min_size=self.min_size,
+            max_size=self.max_size,
+            command_timeout=self.command_timeout,
+            statement_cache_size=self.statement_cache_size,
+            max_inactive_connection_lifetime=self.max_inactive_lifetime,
+            connection_class=TimedConnection,
+            **self.connect_kwargs
+        )
+        return self
+
+    async def _acquire(self):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            DB_ACQUIRE_TIMEOUTS.inc()
+            logging.warning(f"Немає вільного з'єднання PostgreSQL за {self.acquire_timeout} с: {self.stats()}")
+            raise
+        finally:
+            self.waiting -= 1
+        DB_ACQUIRE_WAIT.observe(time.perf_counter() - started)
+        return conn
+
+    def acquire(self):
+        return _Acquire(self)
+
+    def get_size(self):
+        return self.pool.get_size()
+
+    def get_idle_size(self):
+        return self.pool.get_idle_size()
+
+    def get_max_size(self):
+        return self.pool.get_max_size()
+
+    # Знімок насичення пулу (те саме, що bot_db_pool_connections у метриках)
+    def stats(self) -> dict:
+        size, idle = self.get_size(), self.get_idle_size()
+        return {"size": size, "in_use": size - idle, "idle": idle, "max": self.get_max_size(),
+                "waiting": self.waiting}
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
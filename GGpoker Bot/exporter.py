@@ -0,0 +1,83 @@
+import asyncio
+import csv
+import gzip
+import os
+from datetime import datetime
+
+from openpyxl import Workbook
+
+EXPORT_CHUNK = 5000
+# Обмеження Excel на кількість рядків в аркуші (разом із заголовком)
+XLSX_MAX_ROWS = 1_048_576
+
+
+# Write-only книга openpyxl: рядки одразу скидаються у тимчасовий файл,
+# а коли аркуш заповнено — починаємо наступний
+class XlsxWriter:
+    extension = "xlsx"
+
+    def __init__(self, path: str, header: list[str], title: str):
+        self.path = path
+        self.header = header
+        self.title = title
+        self.wb = Workbook(write_only=True)
+        self.sheets = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheets += 1
+        self.ws = self.wb.create_sheet(self.title if self.sheets == 1 else f"{self.title} {self.sheets}")
+        self.ws.append(self.header)
+        self.rows_in_sheet = 1
+
+    def write(self, rows):
+        for row in rows:
+            if self.rows_in_sheet >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self.ws.append(list(row))
+            self.rows_in_sheet += 1
+
+    def close(self):
+        self.wb.save(self.path)
+
+
+class GzipCsvWriter:
+    extension = "csv.gz"
+
+    def __init__(self, path: str, header: list[str], title: str):
+        self.path = path
+        self.file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self.csv = csv.writer(self.file)
+        self.csv.writerow(header)
+
+    def write(self, rows):
+        self.csv.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+WRITERS = {"xlsx": XlsxWriter, "csv.gz": GzipCsvWriter}
+
+
+# Потоковий експорт: серверний курсор asyncpg віддає рядки пачками, кожна пачка
+# записується у файл у пулі блокуючих задач. У пам'яті одночасно лише одна пачка.
+async def stream_export(pool, query: str, header: list[str], directory: str, prefix: str,
+                        fmt: str = "xlsx", chunk: int = EXPORT_CHUNK, executor=None) -> str:
+    run = executor.run if executor is not None else asyncio.to_thread
+    writer_cls = WRITERS[fmt]
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{writer_cls.extension}")
+    writer = await run(writer_cls, filename, header, prefix)
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(query)
+                while True:
+                    rows = await cursor.fetch(chunk)
+                    if not rows:
+                        break
+                    await run(writer.write, [tuple(r) for r in rows])
+    finally:
+        await run(writer.close)
+    return filename
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from metrics import LOOP_LAG, LOOP_STALLS
+
+# Сторож циклу подій. Задача-«серцебиття» прокидається кожні interval секунд
+# і записує запізнення в метрику; окремий потік перевіряє, чи серцебиття не
+# застрягло. Якщо цикл не відповідає довше за threshold, потік знімає стек
+# потоку циклу (тобто саме той код, що зараз блокує) і оновлення, яке він
+# обробляє, та одразу пише їх у лог. Після відновлення зависання рахується
+# в метриці, а адміністраторам раз на digest_interval іде зведення.
+# Поки цикл здоровий, ціна — одне пробудження задачі та потоку за interval.
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STACK_LIMIT = 12
+
+
+def _describe_update(update) -> str:
+    event = getattr(update, "event", None)
+    user = getattr(event, "from_user", None)
+    detail = getattr(event, "text", None) or getattr(event, "data", None) or ""
+    return (f"#{update.update_id} {update.event_type} від {user.id if user else '?'}"
+            + (f": {detail[:40]!r}" if detail else ""))
+
+
+# Стек заблокованого потоку: місце блокування — найглибший кадр коду бота
+# (а не бібліотеки), оновлення — з кадру Dispatcher.feed_update, якщо він є
+def capture(frame) -> dict:
+    stack = traceback.extract_stack(frame)
+    site = None
+    for entry in reversed(stack):
+        if entry.filename.startswith(PROJECT_DIR) and entry.filename != __file__:
+            site = entry
+            break
+    site = site or stack[-1]
+    update = None
+    while frame is not None:
+        if frame.f_code.co_name == "feed_update" and "update" in frame.f_locals:
+            update = _describe_update(frame.f_locals["update"])
+            break
+        frame = frame.f_back
+    return {
+        "site": f"{os.path.basename(site.filename)}:{site.lineno} {site.name}",
+        "update": update,
+        "stack": "".join(traceback.format_list(stack[-STACK_LIMIT:])),
+    }
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.5, interval: float = 0.1, digest_interval: float = 300,
+                 on_digest=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.digest_interval = digest_interval
+        self.on_digest = on_digest
+        self.stalls = 0
+        self._beat = time.monotonic()
+        # Зависання, яке зараз триває (заповнює потік-сторож, завершує цикл)
+        self._stall = None
+        self._pending: list[dict] = []
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def _heartbeat(self):
+        last_digest = time.monotonic() - self.digest_interval
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - expected))
+            self._beat = now
+            stall = self._stall
+            if stall is not None:
+                self._stall = None
+                self._finish(stall, now)
+            if self._pending and now - last_digest >= self.digest_interval:
+                last_digest = now
+                await self._send_digest()
+
+    def _watch(self):
+        captured = None
+        while not self._stop.wait(self.interval / 2):
+            beat = self._beat
+            if beat == captured:
+                continue
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            captured = beat
+            stall = capture(frame)
+            stall["started"] = beat + self.interval
+            self._stall = stall
+            logging.warning(
+                f"Цикл подій заблоковано понад {blocked:.2f} с: {stall['site']}"
+                + (f"\nОновлення: {stall['update']}" if stall["update"] else "")
+                + f"\n{stall['stack']}"
+            )
+
+    def _finish(self, stall: dict, now: float):
+        stall["duration"] = now - stall["started"]
+        self.stalls += 1
+        LOOP_STALLS.inc(stall["site"])
+        logging.warning(f"Цикл подій розблоковано через {stall['duration']:.2f} с ({stall['site']})")
+        self._pending.append(stall)
+
+    def digest(self) -> str:
+        by_site = defaultdict(list)
+        for stall in self._pending:
+            by_site[stall["site"]].append(stall)
+        lines = [f"🐢 Блокування циклу подій: {len(self._pending)}"]
+        for site, stalls in sorted(by_site.items(), key=lambda item: -len(item[1])):
+            worst = max(stalls, key=lambda s: s["duration"])
+            lines.append(f"• {site} — {len(stalls)} раз(и), макс. {worst['duration']:.2f} с")
+            if worst["update"]:
+                lines.append(f"  {worst['update']}")
+        return "\n".join(lines)
+
+    async def _send_digest(self):
+        text = self.digest()
+        self._pending = []
+        if self.on_digest is None:
+            return
+        try:
+            await self.on_digest(text)
+        except Exception as e:
+            logging.error(f"Не вдалося надіслати зведення блокувань: {e}")
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
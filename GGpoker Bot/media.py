@@ -0,0 +1,170 @@
+import asyncio
+import json
+
+from aiogram.types import (
+    Message, MessageEntity, InputMediaPhoto, InputMediaVideo, InputMediaDocument
+)
+
+# Медіа-розсилки. Файл ніколи не завантажується повторно: адмін надсилає його
+# боту один раз, а далі кожному отримувачу йде лише file_id. Опис розсилки
+# (payload) зберігається в задачі, тож відновлена чи запланована розсилка
+# теж обходиться без повторного завантаження.
+MEDIA_KINDS = ("photo", "video", "document", "animation")
+ALBUM_KINDS = {"photo": InputMediaPhoto, "video": InputMediaVideo, "document": InputMediaDocument}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast_media (
+    file_unique_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    last_used_at TIMESTAMP NOT NULL DEFAULT now()
+);
+"""
+
+
+def _entities(entities) -> list[dict] | None:
+    if not entities:
+        return None
+    return [e.model_dump(exclude_none=True) for e in entities]
+
+
+# Один медіафайл із повідомлення адміністратора (None — у повідомленні немає медіа)
+def extract_media(message: Message) -> dict | None:
+    for kind in MEDIA_KINDS:
+        media = getattr(message, kind, None)
+        if not media:
+            continue
+        # Для фото Telegram надсилає кілька розмірів — беремо найбільший
+        if kind == "photo":
+            media = media[-1]
+        return {
+            "kind": kind,
+            "file_id": media.file_id,
+            "file_unique_id": media.file_unique_id,
+            "caption": message.caption,
+            "caption_entities": _entities(message.caption_entities),
+        }
+    return None
+
+
+# Прибирає з підпису перші n символів (напр. дату запланованої розсилки),
+# зсуваючи форматування; сутності, що зачіпали прибрану частину, відкидаються
+def trim_caption(item: dict, n: int) -> dict:
+    caption = item.get("caption") or ""
+    # Зсуви сутностей Telegram рахує в UTF-16
+    shift = len(caption[:n].encode("utf-16-le")) // 2
+    entities = [
+        {**e, "offset": e["offset"] - shift}
+        for e in item.get("caption_entities") or ()
+        if e["offset"] >= shift
+    ]
+    return {**item, "caption": caption[n:] or None, "caption_entities": entities or None}
+
+
+def text_payload(text: str) -> dict:
+    return {"kind": "text", "text": text}
+
+
+def album_payload(items: list[dict]) -> dict:
+    return {"kind": "album", "items": items}
+
+
+def describe(payload: dict | None, message: str = "") -> str:
+    if not payload or payload["kind"] == "text":
+        return message
+    if payload["kind"] == "album":
+        return f"[альбом × {len(payload['items'])}] {payload['items'][0].get('caption') or ''}".strip()
+    return f"[{payload['kind']}] {payload.get('caption') or ''}".strip()
+
+
+def _caption_kwargs(item: dict) -> dict:
+    entities = item.get("caption_entities")
+    return {
+        "caption": item.get("caption"),
+        "caption_entities": [MessageEntity(**e) for e in entities] if entities else None,
+    }
+
+
+# Надсилання одного payload одному отримувачу — лише за file_id
+async def send_payload(bot, chat_id: int, payload: dict):
+    kind = payload["kind"]
+    if kind == "text":
+        return await bot.send_message(chat_id, payload["text"])
+    if kind == "album":
+        media = [ALBUM_KINDS[item["kind"]](media=item["file_id"], **_caption_kwargs(item)) for item in payload["items"]]
+        return await bot.send_media_group(chat_id, media)
+    sender = getattr(bot, f"send_{kind}")
+    return await sender(chat_id, payload["file_id"], **_caption_kwargs(payload))
+
+
+# Постійний кеш file_id за file_unique_id: той самий файл, надісланий адміном
+# повторно, розсилається за вже перевіреним file_id
+class MediaCache:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def ensure_schema(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute(SCHEMA)
+
+    async def remember(self, payload: dict) -> dict:
+        items = payload["items"] if payload["kind"] == "album" else [payload]
+        media = [item for item in items if item["kind"] in MEDIA_KINDS]
+        if not media:
+            return payload
+        # Один файл двічі в альбомі — один рядок, інакше ON CONFLICT DO UPDATE не спрацює
+        unique = {m["file_unique_id"]: m for m in media}
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                INSERT INTO broadcast_media (file_unique_id, kind, file_id, uses)
+                SELECT u.file_unique_id, u.kind, u.file_id, 1
+                FROM unnest($1::text[], $2::text[], $3::text[]) AS u(file_unique_id, kind, file_id)
+                ON CONFLICT (file_unique_id) DO UPDATE
+                SET uses = broadcast_media.uses + 1, last_used_at = now()
+                RETURNING file_unique_id, file_id
+                """,
+                list(unique), [m["kind"] for m in unique.values()], [m["file_id"] for m in unique.values()]
+            )
+        cached = {r["file_unique_id"]: r["file_id"] for r in rows}
+        for item in media:
+            item["file_id"] = cached.get(item["file_unique_id"], item["file_id"])
+        return payload
+
+
+def dump_payload(payload: dict | None) -> str | None:
+    return json.dumps(payload, ensure_ascii=False) if payload is not None else None
+
+
+def load_payload(raw) -> dict | None:
+    if raw is None or isinstance(raw, dict):
+        return raw
+    return json.loads(raw)
+
+
+# Альбом приходить окремими повідомленнями з одним media_group_id. Збираємо їх,
+# доки не мине delay секунд після останнього, і віддаємо разом у on_complete.
+class AlbumCollector:
+    def __init__(self, delay: float = 1.0):
+        self.delay = delay
+        self._albums: dict[str, list] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+
+    def collecting(self, media_group_id: str | None) -> bool:
+        return media_group_id is not None and media_group_id in self._albums
+
+    def add(self, media_group_id: str, message_id: int, item: dict, on_complete):
+        self._albums.setdefault(media_group_id, []).append((message_id, item))
+        timer = self._timers.pop(media_group_id, None)
+        if timer is not None:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timers[media_group_id] = loop.call_later(self.delay, self._complete, media_group_id, on_complete)
+
+    def _complete(self, media_group_id: str, on_complete):
+        self._timers.pop(media_group_id, None)
+        items = [item for _, item in sorted(self._albums.pop(media_group_id, []), key=lambda x: x[0])]
+        if items:
+            on_complete(items)
@@ -0,0 +1,233 @@
+import bisect
+import time
+
+import redis.asyncio as redis
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+# Метрики процесу у текстовому форматі Prometheus. Без зовнішніх залежностей:
+# лічильник — це словник «мітки → значення», гістограма — список кошиків,
+# тож запис метрики в гарячому шляху коштує один пошук у словнику та bisect.
+# Сервер (aiohttp) слухає лише локальний порт і віддає все на GET /metrics.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+LOOP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        registry.register(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+
+
+# Значення або задається явно, або читається функцією під час збору метрик
+# (розмір пулу, довжина черги) — тоді гарячий шлях його взагалі не торкається
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), registry: Registry = REGISTRY):
+        super().__init__(name, help, labels, registry)
+        self._function = None
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    # function() повертає число (без міток) або словник «кортеж міток → число»
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            values = self._function()
+            self._values = values if isinstance(values, dict) else {(): values}
+        yield from super().samples()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS,
+                 registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # мітки → [лічильники кошиків (+Inf останній), сума]
+        self._series: dict[tuple, list] = {}
+        registry.register(self)
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Час обробки оновлення хендлером", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Винятки в хендлерах", ("handler", "error"))
+API_LATENCY = Histogram("bot_api_request_seconds", "Час запиту до Bot API", ("method",))
+API_ERRORS = Counter("bot_api_errors_total", "Помилки запитів до Bot API", ("method", "error"))
+BROADCAST_SENT = Counter("bot_broadcast_sent_total", "Доставлені повідомлення розсилок")
+BROADCAST_ERRORS = Counter("bot_broadcast_errors_total", "Невдалі спроби доставки розсилок", ("error",))
+REDIS_LATENCY = Histogram("bot_redis_command_seconds", "Час команди Redis", ("command",), REDIS_BUCKETS)
+DB_POOL = Gauge("bot_db_pool_connections", "З'єднання пулу PostgreSQL", ("state",))
+DB_ACQUIRE_WAIT = Histogram("bot_db_pool_acquire_seconds", "Очікування вільного з'єднання пулу", buckets=DB_BUCKETS)
+DB_ACQUIRE_TIMEOUTS = Counter("bot_db_pool_acquire_timeouts_total", "Не дочекалися з'єднання пулу")
+DB_QUERY_LATENCY = Histogram("bot_db_query_seconds", "Час запиту PostgreSQL", ("query",), DB_BUCKETS)
+DB_QUERY_ROWS = Counter("bot_db_query_rows_total", "Рядки, повернені або змінені запитами", ("query",))
+DB_QUERY_ERRORS = Counter("bot_db_query_errors_total", "Помилки запитів PostgreSQL", ("query", "error"))
+LOOP_LAG = Histogram("bot_event_loop_lag_seconds", "Запізнення циклу подій", buckets=LOOP_BUCKETS)
+LOOP_STALLS = Counter("bot_event_loop_stalls_total", "Блокування циклу подій понад поріг", ("site",))
+
+
+def watch_pool(pool, gauge: Gauge = DB_POOL):
+    def usage():
+        size, idle = pool.get_size(), pool.get_idle_size()
+        return {("in_use",): size - idle, ("idle",): idle, ("max",): pool.get_max_size(),
+                ("waiting",): getattr(pool, "waiting", 0)}
+    gauge.set_function(usage)
+
+
+# Внутрішній middleware (message / callback_query): час і помилки за іменем хендлера
+class MetricsMiddleware(BaseMiddleware):
+    def __init__(self, latency: Histogram = HANDLER_LATENCY, errors: Counter = HANDLER_ERRORS):
+        self.latency = latency
+        self.errors = errors
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started, name)
+
+
+# Middleware сесії бота: кожен виклик Bot API (і з хендлерів, і з розсилок)
+class BotApiMetrics(BaseRequestMiddleware):
+    def __init__(self, latency: Histogram = API_LATENCY, errors: Counter = API_ERRORS):
+        self.latency = latency
+        self.errors = errors
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started, name)
+
+
+# Клієнт Redis, що міряє кожну одиночну команду і кожен pipeline цілком
+# (мітка PIPELINE або MULTI для транзакції; pub/sub іде повз)
+class InstrumentedRedis(redis.Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.observe(time.perf_counter() - started, str(args[0]).upper())
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> "InstrumentedPipeline":
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        command = "MULTI" if self.is_transaction or self.explicit_transaction else "PIPELINE"
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_LATENCY.observe(time.perf_counter() - started, command)
+
+
+async def start_server(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    async def handle(request: web.Request):
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
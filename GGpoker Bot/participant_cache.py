@@ -0,0 +1,18 @@
+from ttl_cache import TTLCache
+
+
+# Кеш «чи бере користувач участь» поверх запиту до PostgreSQL (read-through).
+# Спільний для процесів через Redis; без Redis — локальний LRU з тим самим TTL.
+# Позитивна відповідь живе довго й оновлюється явно при реєстрації/видаленні
+# (set/invalidate), негативна — недовго. Одночасні промахи одного
+# користувача — один запит у БД.
+class ParticipantCache(TTLCache):
+    def __init__(self, loader, redis_client=None, positive_ttl: int = 3600, negative_ttl: int = 30,
+                 prefix: str = "part", local_size: int = 100_000):
+        super().__init__(loader, prefix, redis_client, positive_ttl, negative_ttl, local_size, label="кеш учасників")
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        total = self.hits + self.misses
+        stats["hit_rate"] = round(self.hits / total, 3) if total else 0.0
+        return stats
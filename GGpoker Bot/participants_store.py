@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+
+import asyncpg
+from openpyxl import Workbook, load_workbook
+
+from compact import IntSet, hash64, sort_unique
+from database import Query
+
+EXCEL_HEADER = ["Telegram ID", "Username", "Full Name", "Дата участі", "GGPoker Нік", "Email"]
+FIELDS = ["telegram_id", "username", "full_name", "joined_at", "nickname", "email"]
+
+# Ті самі правила нормалізації, що й в унікальних індексах PostgreSQL нижче
+PARTICIPANT_CONSTRAINTS = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS participants_nickname_norm_key ON participants (lower(btrim(nickname)))",
+    "CREATE UNIQUE INDEX IF NOT EXISTS participants_email_norm_key ON participants (lower(btrim(email)))",
+]
+
+
+def normalize_nickname(nickname: str) -> str:
+    return (nickname or "").strip().lower()
+
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def nickname_key(nickname: str) -> int:
+    return hash64(normalize_nickname(nickname))
+
+
+def email_key(email: str) -> int:
+    return hash64(normalize_email(email))
+
+
+async def ensure_participant_constraints(pool):
+    async with pool.acquire() as conn:
+        for sql in PARTICIPANT_CONSTRAINTS:
+            try:
+                await conn.execute(sql)
+            except asyncpg.UniqueViolationError as e:
+                logging.warning(f"Не вдалося створити унікальний індекс, у таблиці вже є дублікати: {e}")
+
+
+# Єдиний індекс унікальності учасників: Telegram ID, нікнейм та email.
+# Перевірка і резервування — одна операція під замком, тож дві одночасні
+# реєстрації з однаковим ніком не можуть пройти обидві. Нікнейми та email
+# зберігаються як 64-бітні відбитки в компактних IntSet.
+class UniquenessIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = IntSet()
+        self._nicknames = IntSet()
+        self._emails = IntSet()
+        # Поки індекс не завантажено з БД, він знає лише учасників із журналу
+        self.ready = threading.Event()
+
+    def __contains__(self, telegram_id: int):
+        return telegram_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def is_duplicate(self, telegram_id: int, nickname: str, email: str | None = None) -> bool:
+        return (
+            telegram_id in self._ids
+            or nickname_key(nickname) in self._nicknames
+            or (email is not None and email_key(email) in self._emails)
+        )
+
+    def reserve(self, telegram_id: int, nickname: str, email: str) -> bool:
+        with self._lock:
+            if self.is_duplicate(telegram_id, nickname, email):
+                return False
+            self._add(telegram_id, nickname, email)
+            return True
+
+    def add(self, telegram_id: int, nickname: str, email: str):
+        with self._lock:
+            self._add(telegram_id, nickname, email)
+
+    def _add(self, telegram_id: int, nickname: str, email: str):
+        self._ids.add(telegram_id)
+        self._nicknames.add(nickname_key(nickname))
+        if email:
+            self._emails.add(email_key(email))
+
+    def release(self, telegram_id: int, nickname: str, email: str):
+        with self._lock:
+            self._ids.discard(telegram_id)
+            self._nicknames.discard(nickname_key(nickname))
+            if email:
+                self._emails.discard(email_key(email))
+
+    # Підміна вмісту завантаженим з БД; те, що журнал додав за час прогріву, зберігається
+    def load(self, ids: IntSet, nicknames: IntSet, emails: IntSet):
+        with self._lock:
+            ids.update(self._ids)
+            nicknames.update(self._nicknames)
+            emails.update(self._emails)
+            for values in (ids, nicknames, emails):
+                values.compact()
+            self._ids, self._nicknames, self._emails = ids, nicknames, emails
+            self.ready.set()
+
+    def nbytes(self) -> int:
+        return self._ids.nbytes() + self._nicknames.nbytes() + self._emails.nbytes()
+
+
+# Потоковий розбір COPY ... (FORMAT binary) з (telegram_id, nickname, email):
+# у пам'ять одразу потрапляють 8-байтові ID та відбитки, а не рядки asyncpg.Record
+class ParticipantCopyReader:
+    SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._header_done = False
+        self.ids = array("q")
+        self.nicknames = array("q")
+        self.emails = array("q")
+        self.rows = 0
+
+    def feed(self, chunk: bytes):
+        buf = self._buf
+        buf += chunk
+        pos = 0
+        if not self._header_done:
+            if len(buf) < 19:
+                return
+            if bytes(buf[:11]) != self.SIGNATURE:
+                raise ValueError("Невідомий формат COPY")
+            pos = 19 + _INT32(buf, 15)[0]
+            if len(buf) < pos:
+                return
+            self._header_done = True
+        size = len(buf)
+        while size - pos >= 2:
+            if _INT16(buf, pos)[0] == -1:
+                pos += 2
+                break
+            # Кортеж: int16 кількість полів, далі для кожного int32 довжина (-1 = NULL) і байти
+            p = pos + 2
+            fields = []
+            while len(fields) < 3:
+                if size - p < 4:
+                    break
+                length = _INT32(buf, p)[0]
+                p += 4
+                if length == -1:
+                    fields.append(None)
+                    continue
+                if size - p < length:
+                    break
+                fields.append(buf[p:p + length])
+                p += length
+            if len(fields) < 3:
+                break
+            self._add_row(*fields)
+            pos = p
+        del buf[:pos]
+
+    def _add_row(self, telegram_id, nickname, email):
+        self.ids.append(int.from_bytes(telegram_id, "big", signed=True))
+        if nickname is not None:
+            self.nicknames.append(nickname_key(nickname.decode("utf-8")))
+        if email:
+            self.emails.append(email_key(email.decode("utf-8")))
+        self.rows += 1
+
+
+_INT16 = struct.Struct(">h").unpack_from
+_INT32 = struct.Struct(">i").unpack_from
+
+
+def _build_sets(reader: ParticipantCopyReader) -> list[IntSet]:
+    sets = []
+    for name in ("ids", "nicknames", "emails"):
+        sets.append(IntSet.from_sorted(sort_unique(getattr(reader, name))))
+        # Сирий масив звільняємо до сортування наступного
+        setattr(reader, name, None)
+    return sets
+
+
+# Прогрів індексу у фоні: бот обробляє оновлення одразу після старту,
+# а до завершення прогріву перевірки дублікатів ідуть у БД (participant_exists)
+async def warm_up_index(pool, index: UniquenessIndex, executor=None) -> int:
+    started = time.monotonic()
+    reader = ParticipantCopyReader()
+
+    async def output(chunk):
+        reader.feed(chunk)
+
+    async with pool.acquire() as conn:
+        await conn.copy_from_query(
+            "SELECT telegram_id, nickname, email FROM participants", output=output, format="binary"
+        )
+    run = executor.run if executor is not None else asyncio.to_thread
+    # Сортування мільйонів значень — поза циклом подій
+    index.load(*await run(_build_sets, reader))
+    logging.info(
+        f"Індекс учасників прогріто за {time.monotonic() - started:.2f} с: "
+        f"{reader.rows} рядків, {index.nbytes() / 1024:.0f} КБ"
+    )
+    return reader.rows
+
+
+# Гарячі запити: «📍 Мій статус» (за кешем) та перевірка дублікатів до прогріву індексу
+PARTICIPANT_BY_ID = Query("participant_by_id", "SELECT 1 FROM participants WHERE telegram_id = $1")
+PARTICIPANT_EXISTS = Query("participant_exists", """
+    SELECT 1 FROM participants
+    WHERE telegram_id = $1 OR lower(btrim(nickname)) = $2 OR lower(btrim(email)) = $3
+    LIMIT 1
+""")
+
+
+async def has_participated(pool, telegram_id: int) -> bool:
+    async with pool.acquire() as conn:
+        return await conn.fetchval(PARTICIPANT_BY_ID, telegram_id) is not None
+
+
+# Кількість і список учасників — з PostgreSQL: у режимі webhook кожен воркер
+# бачить лише власний журнал
+async def count_participants(pool) -> int:
+    async with pool.acquire() as conn:
+        return await conn.fetchval("SELECT count(*) FROM participants")
+
+
+async def fetch_participants(pool) -> list:
+    async with pool.acquire() as conn:
+        return await conn.fetch(
+            "SELECT username, full_name, nickname, joined_at FROM participants ORDER BY joined_at"
+        )
+
+
+async def participant_exists(pool, telegram_id: int, nickname: str, email: str) -> bool:
+    async with pool.acquire() as conn:
+        found = await conn.fetchval(
+            PARTICIPANT_EXISTS, telegram_id, normalize_nickname(nickname), normalize_email(email)
+        )
+    return found is not None
+
+
+# Журнал реєстрацій: один JSON-рядок на учасника, тільки дописування в кінець.
+# Кожен запис — один write() в O_APPEND-дескриптор та fsync, тож після збою
+# у файлі може лишитися хіба що обірваний останній рядок, який ми відкидаємо.
+# Скасований запис позначається окремим рядком-«надгробком» з його зміщенням.
+class ParticipantJournal:
+    def __init__(self, path: str, legacy_excel: str | None = None, index: UniquenessIndex | None = None):
+        self.path = path
+        self.index = index if index is not None else UniquenessIndex()
+        self._lock = threading.Lock()
+        self._removed = set()
+        # telegram_id → (зміщення живого запису, нікнейм, email): надгробок пишемо без читання файлу
+        self._live = {}
+        self._count = 0
+        if not os.path.exists(path) and legacy_excel and os.path.exists(legacy_excel):
+            self._import_excel(legacy_excel)
+        self._load()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _import_excel(self, excel_path: str):
+        # Одноразове перенесення учасників зі старого participants.xlsx
+        wb = load_workbook(excel_path, read_only=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for row in wb.active.iter_rows(min_row=2, values_only=True):
+                if row[0] is None:
+                    continue
+                f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        wb.close()
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "removed" in record:
+                    self._removed.add(record["removed"])
+                    self._live.pop(record["telegram_id"], None)
+                    self.index.release(record["telegram_id"], record["nickname"], record.get("email"))
+                    self._count -= 1
+                else:
+                    self._live[record["telegram_id"]] = (valid_size, record["nickname"], record.get("email"))
+                    self.index.add(record["telegram_id"], record["nickname"], record.get("email"))
+                    self._count += 1
+                valid_size += len(line)
+        if valid_size != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, telegram_id: int):
+        return telegram_id in self.index
+
+    def _write(self, record: dict) -> int:
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        os.write(self._fd, line)
+        os.fsync(self._fd)
+        return os.lseek(self._fd, 0, os.SEEK_CUR) - len(line)
+
+    # Повертає False, якщо такий Telegram ID, нікнейм чи email уже зайняті
+    def add(self, record: dict) -> bool:
+        if not self.index.reserve(record["telegram_id"], record["nickname"], record["email"]):
+            return False
+        try:
+            with self._lock:
+                offset = self._write(record)
+                self._live[record["telegram_id"]] = (offset, record["nickname"], record["email"])
+                self._count += 1
+        except OSError:
+            self.index.release(record["telegram_id"], record["nickname"], record["email"])
+            raise
+        return True
+
+    # Скасування живого запису учасника: один дописаний надгробок, без читання журналу
+    def remove(self, telegram_id: int) -> bool:
+        with self._lock:
+            live = self._live.get(telegram_id)
+            if live is None:
+                return False
+            offset, nickname, email = live
+            self._write({"removed": offset, "telegram_id": telegram_id, "nickname": nickname, "email": email})
+            del self._live[telegram_id]
+            self._removed.add(offset)
+            self._count -= 1
+        self.index.release(telegram_id, nickname, email)
+        return True
+
+    def _live_records(self):
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                start, offset = offset, offset + len(line)
+                if not line.endswith(b"\n") or start in self._removed:
+                    continue
+                record = json.loads(line)
+                if "removed" not in record:
+                    yield start, record
+
+    def rows(self):
+        for _, record in self._live_records():
+            yield record
+
+    # participants.xlsx будується лише на запит адміністратора
+    def export_excel(self, excel_path: str) -> str:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Participants")
+        ws.append(EXCEL_HEADER)
+        for record in self.rows():
+            ws.append([record.get(k) for k in FIELDS])
+        tmp = excel_path + ".tmp"
+        wb.save(tmp)
+        os.replace(tmp, excel_path)
+        return excel_path
+
+    def close(self):
+        os.close(self._fd)
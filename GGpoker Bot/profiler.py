@@ -0,0 +1,152 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Профілювання працюючого бота на вимогу адміністратора. Одночасно — лише
+# одна сесія, і вона завжди зупиняється сама після заданої тривалості.
+#   sample   — окремий потік кожні interval секунд знімає стеки всіх потоків
+#              (цикл подій із хендлерами й розсилками, пул блокуючих задач);
+#              результат — collapsed stacks для flamegraph.pl / speedscope.
+#              Ціна — обхід кількох десятків кадрів за вибірку, код бота не змінюється.
+#   cprofile — детермінований cProfile на потоці циклу подій (сповільнює бота
+#              приблизно вдвічі, тому тривалість обмежена); результат — звіт pstats.
+KINDS = ("sample", "cprofile")
+PSTATS_LINES = 80
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingSession:
+    kind = "sample"
+    extension = "collapsed.txt"
+
+    def __init__(self, interval: float = 0.005, max_stacks: int = 50_000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self.dropped = 0
+        self._stacks: Counter = Counter()
+        self._names: dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._names = {t.ident: t.name for t in threading.enumerate()}
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                key = (thread_id, tuple(reversed(codes)))
+                # Обмеження пам'яті: нові унікальні стеки понад ліміт не зберігаємо
+                if key in self._stacks or len(self._stacks) < self.max_stacks:
+                    self._stacks[key] += 1
+                else:
+                    self.dropped += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # Формат collapsed stacks: «потік;корінь;...;лист кількість»
+    def result(self) -> bytes:
+        lines = []
+        for (thread_id, codes), count in self._stacks.most_common():
+            thread = self._names.get(thread_id, f"thread-{thread_id}")
+            lines.append(";".join([thread, *map(_frame_name, codes)]) + f" {count}")
+        return ("\n".join(lines) + "\n").encode()
+
+    def summary(self) -> str:
+        return f"{self.samples} вибірок, {len(self._stacks)} унікальних стеків" + (
+            f", {self.dropped} відкинуто" if self.dropped else "")
+
+
+class CProfileSession:
+    kind = "cprofile"
+    extension = "pstats.txt"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    # Викликається з потоку циклу подій: cProfile бачить усі його задачі
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def result(self) -> bytes:
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(PSTATS_LINES)
+        out.write("\n")
+        stats.sort_stats("tottime").print_stats(PSTATS_LINES)
+        return out.getvalue().encode()
+
+    def summary(self) -> str:
+        return f"{len(pstats.Stats(self.profile).stats)} функцій"
+
+
+class Profiler:
+    def __init__(self, max_duration: float = 120, sample_interval: float = 0.005, executor=None):
+        self.max_duration = max_duration
+        self.sample_interval = sample_interval
+        self.executor = executor
+        self.session = None
+        self._stopped = None
+
+    @property
+    def active(self) -> bool:
+        return self.session is not None
+
+    # Повертає (ім'я файлу, вміст, підсумок); тривалість обрізається до max_duration
+    async def run(self, kind: str, seconds: float) -> tuple[str, bytes, str]:
+        if kind not in KINDS:
+            raise ValueError(f"Невідомий тип профілювання: {kind}")
+        if self.active:
+            raise RuntimeError("Профілювання вже триває")
+        seconds = max(0.1, min(seconds, self.max_duration))
+        session = SamplingSession(self.sample_interval) if kind == "sample" else CProfileSession()
+        self.session = session
+        self._stopped = asyncio.Event()
+        started = time.monotonic()
+        session.start()
+        try:
+            try:
+                await asyncio.wait_for(self._stopped.wait(), seconds)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            session.stop()
+            self.session = None
+        elapsed = time.monotonic() - started
+        run = self.executor.run if self.executor is not None else asyncio.to_thread
+        data = await run(session.result)
+        filename = f"profile_{kind}_{datetime.now():%Y%m%d_%H%M%S}.{session.extension}"
+        return filename, data, f"{elapsed:.1f} с, {session.summary()}"
+
+    def stop(self) -> bool:
+        if not self.active:
+            return False
+        self._stopped.set()
+        return True
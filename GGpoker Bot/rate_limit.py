@@ -0,0 +1,104 @@
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+
+# Локальний запасний лімітер на випадок недоступності Redis:
+# обмежений за розміром LRU (ключ → момент, до якого діє блокування)
+class LocalLimiter:
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._until = OrderedDict()
+
+    def hit(self, key: str, seconds: float) -> bool:
+        now = time.monotonic()
+        until = self._until.get(key)
+        if until is not None and until > now:
+            return False
+        self._until[key] = now + seconds
+        self._until.move_to_end(key)
+        if len(self._until) > self.max_size:
+            self._until.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self._until)
+
+
+# Один атомарний SET NX PX на подію: ключ встановився — подію пропускаємо,
+# ключ уже існує — користувач пише занадто часто.
+class RateLimiter:
+    def __init__(self, redis_client=None, local_size: int = 100_000, prefix: str = "rl"):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.local = LocalLimiter(local_size)
+        self._redis_down_logged = 0.0
+
+    def _redis_failed(self, e: Exception):
+        now = time.monotonic()
+        if now - self._redis_down_logged > 60:
+            self._redis_down_logged = now
+            logging.warning(f"Redis недоступний, антифлуд працює локально: {e}")
+
+    async def hit(self, key: str, seconds: float) -> bool:
+        if self.redis is not None:
+            try:
+                return bool(await self.redis.set(f"{self.prefix}:{key}", 1, nx=True, px=int(seconds * 1000)))
+            except Exception as e:
+                self._redis_failed(e)
+        return self.local.hit(key, seconds)
+
+    # SET NX разом із читанням стану користувача в одному pipeline сховища
+    # (RedisStateStorage.load_with): один round trip на подію замість двох.
+    # Повертає (дозволено, сесія або None, якщо стан не прочитано)
+    async def hit_and_load(self, key: str, seconds: float, storage, user_id: int):
+        if self.redis is None or not hasattr(storage, "load_with"):
+            return await self.hit(key, seconds), None
+        try:
+            session, (allowed,) = await storage.load_with(
+                user_id, lambda pipe: pipe.set(f"{self.prefix}:{key}", 1, nx=True, px=int(seconds * 1000))
+            )
+            return bool(allowed), session
+        except Exception as e:
+            self._redis_failed(e)
+        return self.local.hit(key, seconds), None
+
+
+# Класи подій із власними лімітами: повідомлення, callback-кнопки та адміністратори
+def classify_event(event, user_id: int, admin_ids) -> str:
+    if user_id in admin_ids:
+        return "admin"
+    if isinstance(event, CallbackQuery):
+        return "callback"
+    return "message"
+
+
+# state — StateMiddleware, чий стан читається разом з антифлудом
+class RateLimitMiddleware(BaseMiddleware):
+    def __init__(self, limiter: RateLimiter, limits: dict[str, float], admin_ids, state=None):
+        self.limiter = limiter
+        self.limits = limits
+        self.admin_ids = admin_ids
+        self.state = state
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        kind = classify_event(event, user.id, self.admin_ids)
+        seconds = self.limits.get(kind)
+        if not seconds:
+            return await handler(event, data)
+        if self.state is None:
+            allowed = await self.limiter.hit(f"{kind}:{user.id}", seconds)
+        else:
+            allowed, session = await self.limiter.hit_and_load(f"{kind}:{user.id}", seconds, self.state.storage, user.id)
+            if session is not None:
+                data["session"] = session
+        if allowed:
+            return await handler(event, data)
+        # Middleware стоїть лише на message та callback_query — обидва мають answer()
+        await event.answer("⏳ Повільніше, будь ласка!")
@@ -0,0 +1,355 @@
+import asyncio
+import heapq
+import json
+import logging
+import time
+from array import array
+
+from aiogram import BaseMiddleware
+
+# Простори імен стану: реєстрація користувача, стан адмін-меню, чернетка розсилки
+NAMESPACES = ("user", "admin", "broadcast")
+
+
+# Стан одного користувача на час обробки оновлення. Зміни накопичуються
+# і записуються в сховище одним пакетом після завершення хендлера.
+class UserSession:
+    __slots__ = ("user_id", "_values", "_dirty")
+
+    def __init__(self, user_id: int, values: dict | None = None):
+        self.user_id = user_id
+        self._values = dict(values or {})
+        self._dirty = set()
+
+    def get(self, ns: str):
+        return self._values.get(ns)
+
+    def set(self, ns: str, value):
+        if self._values.get(ns) != value:
+            self._values[ns] = value
+            self._dirty.add(ns)
+
+    @property
+    def user_state(self):
+        return self.get("user")
+
+    @user_state.setter
+    def user_state(self, value):
+        self.set("user", value)
+
+    @property
+    def admin_state(self):
+        return self.get("admin")
+
+    @admin_state.setter
+    def admin_state(self, value):
+        self.set("admin", value)
+
+    @property
+    def broadcast(self):
+        return self.get("broadcast")
+
+    @broadcast.setter
+    def broadcast(self, value):
+        self.set("broadcast", value)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def changes(self) -> dict:
+        return {ns: self._values.get(ns) for ns in self._dirty}
+
+    def mark_saved(self):
+        self._dirty.clear()
+
+
+# Стан реєстрації ({"step", "nickname", "email"} або просто крок) розкладається
+# по слотах паралельних масивів: код кроку — 1 байт (назви кроків інтерновані
+# в таблицю, старший біт — «стан лише рядок кроку»), термін дії, нікнейм і email.
+# Решта (адмін-меню, чернетка розсилки, нестандартний стан) — в окремому dict:
+# таких користувачів одиниці.
+REGISTRATION_FIELDS = frozenset(("step", "nickname", "email"))
+_BARE = 0x80
+_MAX_STEPS = 0x7F
+
+
+# Стан у пам'яті процесу: TTL для покинутих діалогів (періодичне прибирання)
+# і обмеження кількості користувачів (витісняються ті, хто найдовше не писав)
+class MemoryStateStorage:
+    def __init__(self, ttl: int = 3600, max_users: int = 100_000, sweep_every: int = 1000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.sweep_every = sweep_every
+        self._slots: dict[int, int] = {}
+        self._free: list[int] = []
+        self._steps = array("B")
+        self._expires = array("d")
+        self._nicknames: list = []
+        self._emails: list = []
+        self._extra: dict[int, dict] = {}
+        self._step_names: list = [None]
+        self._step_codes: dict[str, int] = {}
+        self._writes = 0
+
+    def _intern(self, step) -> int:
+        code = self._step_codes.get(step)
+        if code is None:
+            if not isinstance(step, str) or len(self._step_names) > _MAX_STEPS:
+                return 0
+            code = self._step_codes[step] = len(self._step_names)
+            self._step_names.append(step)
+        return code
+
+    def _allocate(self, user_id: int) -> int:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._steps)
+            self._steps.append(0)
+            self._expires.append(0.0)
+            self._nicknames.append(None)
+            self._emails.append(None)
+        self._slots[user_id] = slot
+        return slot
+
+    def _release(self, user_id: int):
+        slot = self._slots.pop(user_id)
+        self._steps[slot] = 0
+        self._nicknames[slot] = self._emails[slot] = None
+        self._extra.pop(user_id, None)
+        self._free.append(slot)
+
+    def _set_extra(self, user_id: int, ns: str, value):
+        extra = self._extra.get(user_id)
+        if value is not None:
+            if extra is None:
+                extra = self._extra[user_id] = {}
+            extra[ns] = value
+        elif extra is not None:
+            extra.pop(ns, None)
+            if not extra:
+                del self._extra[user_id]
+
+    def _set_user(self, slot: int, user_id: int, value):
+        code = 0
+        if isinstance(value, str):
+            code = self._intern(value)
+            if code:
+                code |= _BARE
+        elif isinstance(value, dict) and "step" in value and value.keys() <= REGISTRATION_FIELDS:
+            code = self._intern(value["step"])
+        self._steps[slot] = code
+        registration = code and not code & _BARE
+        self._nicknames[slot] = value.get("nickname") if registration else None
+        self._emails[slot] = value.get("email") if registration else None
+        self._set_extra(user_id, "user", None if code else value)
+
+    def _get_user(self, slot: int):
+        code = self._steps[slot]
+        step = self._step_names[code & _MAX_STEPS]
+        if code & _BARE:
+            return step
+        value = {"step": step}
+        if self._nicknames[slot] is not None:
+            value["nickname"] = self._nicknames[slot]
+        if self._emails[slot] is not None:
+            value["email"] = self._emails[slot]
+        return value
+
+    async def load(self, user_id: int) -> UserSession:
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return UserSession(user_id)
+        if self._expires[slot] <= time.monotonic():
+            self._release(user_id)
+            return UserSession(user_id)
+        values = dict(self._extra.get(user_id, ()))
+        if self._steps[slot]:
+            values["user"] = self._get_user(slot)
+        return UserSession(user_id, values)
+
+    async def save(self, session: UserSession):
+        if not session.dirty:
+            return
+        user_id = session.user_id
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._allocate(user_id)
+        for ns, value in session.changes().items():
+            if ns == "user":
+                self._set_user(slot, user_id, value)
+            else:
+                self._set_extra(user_id, ns, value)
+        session.mark_saved()
+        if not self._steps[slot] and user_id not in self._extra:
+            self._release(user_id)
+            return
+        self._expires[slot] = time.monotonic() + self.ttl
+        self._writes += 1
+        if self._writes % self.sweep_every == 0:
+            self._sweep()
+        if len(self._slots) > self.max_users:
+            self._evict()
+
+    def _sweep(self):
+        now = time.monotonic()
+        expires = self._expires
+        for user_id in [u for u, slot in self._slots.items() if expires[slot] <= now]:
+            self._release(user_id)
+
+    def _evict(self):
+        self._sweep()
+        excess = len(self._slots) - self.max_users
+        if excess <= 0:
+            return
+        # З запасом у 10%, щоб не шукати найстаріших на кожному збереженні
+        excess += self.max_users // 10
+        expires, slots = self._expires, self._slots
+        for user_id in heapq.nsmallest(excess, slots, key=lambda u: expires[slots[u]]):
+            self._release(user_id)
+
+    def __len__(self):
+        return len(self._slots)
+
+    async def close(self):
+        pass
+
+
+# Стан у Redis: не більше одного round trip на оновлення. Зміни після хендлера
+# не пишуться окремо, а накопичуються і їдуть у наступному pipeline читання
+# (будь-якого користувача: у webhook-режимі всі оновлення користувача
+# обробляє один воркер). Якщо оновлень немає — дописуються через flush_delay.
+# load_with додає в той самий pipeline команди викликача (SET NX антифлуду).
+#
+# Вікно втрати: зміни, що ще не дійшли до Redis, живуть лише в пам'яті процесу.
+# Зупинка (SIGTERM/SIGINT, перезапуск воркера супервізором) дописує їх через
+# close(); аварійне падіння процесу втрачає зміни не старші за flush_delay —
+# користувач побачить попередній крок діалогу.
+class RedisStateStorage:
+    def __init__(self, redis_client, ttl: int = 3600, prefix: str = "fsm", flush_delay: float = 1.0):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.flush_delay = flush_delay
+        # (user_id, ns) → значення; None — видалити ключ
+        self._pending: dict[tuple[int, str], object] = {}
+        # Пачки, відправлені в pipeline, що ще не завершився (накладаються на прочитане)
+        self._inflight: list[dict] = []
+        self._flusher = None
+
+    def _key(self, ns: str, user_id: int) -> str:
+        return f"{self.prefix}:{ns}:{user_id}"
+
+    def _queue_writes(self, pipe, writes: dict) -> int:
+        for (user_id, ns), value in writes.items():
+            key = self._key(ns, user_id)
+            if value is None:
+                pipe.delete(key)
+            else:
+                pipe.set(key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+        return len(writes)
+
+    async def _execute(self, pipe, writes: dict) -> list:
+        self._inflight.append(writes)
+        try:
+            return await pipe.execute()
+        except Exception:
+            # Незаписане повертаємо в чергу, не затираючи новіших змін
+            for item, value in writes.items():
+                self._pending.setdefault(item, value)
+            raise
+        finally:
+            self._inflight.remove(writes)
+
+    # Повертає сесію та результати команд, доданих extra(pipe)
+    async def load_with(self, user_id: int, extra=None) -> tuple[UserSession, list]:
+        writes, self._pending = self._pending, {}
+        pipe = self.redis.pipeline(transaction=False)
+        queued = self._queue_writes(pipe, writes)
+        if extra is not None:
+            extra(pipe)
+        pipe.mget([self._key(ns, user_id) for ns in NAMESPACES])
+        results = await self._execute(pipe, writes)
+        values = {ns: json.loads(v) for ns, v in zip(NAMESPACES, results[-1]) if v is not None}
+        # Зміни, що ще не дійшли до Redis (в іншому pipeline або після відправки цього)
+        for batch in (*self._inflight, self._pending):
+            for ns in NAMESPACES:
+                if (user_id, ns) in batch:
+                    values[ns] = batch[(user_id, ns)]
+        values = {ns: value for ns, value in values.items() if value is not None}
+        return UserSession(user_id, values), results[queued:-1]
+
+    async def load(self, user_id: int) -> UserSession:
+        return (await self.load_with(user_id))[0]
+
+    async def save(self, session: UserSession):
+        if not session.dirty:
+            return
+        for ns, value in session.changes().items():
+            self._pending[(session.user_id, ns)] = value
+        session.mark_saved()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        delay = self.flush_delay
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Не вдалося записати стан користувачів у Redis: {e}")
+                delay = min(delay * 2, 30)
+            # Поки Redis недоступний, зміни лишаються в черзі й повторюються
+            if not self._pending:
+                return
+
+    async def flush(self):
+        if not self._pending:
+            return
+        writes, self._pending = self._pending, {}
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_writes(pipe, writes)
+        await self._execute(pipe, writes)
+
+    async def close(self):
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+
+
+# Завантажує стан перед хендлером (передається як аргумент session)
+# і зберігає зміни після нього
+class StateMiddleware(BaseMiddleware):
+    def __init__(self, storage):
+        self.storage = storage
+        self._down_logged = 0.0
+
+    def _storage_failed(self, e: Exception):
+        now = time.monotonic()
+        if now - self._down_logged > 60:
+            self._down_logged = now
+            logging.warning(f"Сховище станів недоступне, оновлення обробляються без стану: {e}")
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        # Сесію могла вже завантажити антифлуд-перевірка тим самим pipeline
+        session = data.get("session")
+        if session is None or session.user_id != user.id:
+            try:
+                session = await self.storage.load(user.id)
+            except Exception as e:
+                # Як і антифлуд: без сховища оновлення обробляється, але з порожнім станом
+                self._storage_failed(e)
+                session = UserSession(user.id)
+            data["session"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                await self.storage.save(session)
+            except Exception as e:
+                logging.error(f"Не вдалося зберегти стан користувача {user.id}: {e}")
@@ -0,0 +1,25 @@
+from ttl_cache import TTLCache
+
+SUBSCRIBED_STATUSES = ("member", "administrator", "creator")
+
+
+# Кеш статусу підписки на канал. Позитивний результат живе довше, негативний —
+# недовго, щоб користувач, який щойно підписався, не чекав. Одночасні перевірки
+# одного користувача зливаються в один запит get_chat_member (single-flight).
+# Без Redis не кешує: статус має бути спільним для всіх процесів.
+class SubscriptionCache(TTLCache):
+    def __init__(self, bot, channel: str, redis_client=None,
+                 positive_ttl: int = 600, negative_ttl: int = 20):
+        super().__init__(
+            self._load, f"sub:{channel}", redis_client, positive_ttl, negative_ttl,
+            local_size=0, label="кеш підписок"
+        )
+        self.bot = bot
+        self.channel = channel
+
+    async def _load(self, user_id: int) -> bool:
+        member = await self.bot.get_chat_member(self.channel, user_id)
+        return member.status in SUBSCRIBED_STATUSES
+
+    async def is_subscribed(self, user_id: int) -> bool:
+        return await self.get(user_id)
@@ -0,0 +1,91 @@
+import fnmatch
+
+import pytest
+
+
+class DummyPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def set(self, *args, **kwargs):
+        self.ops.append(("set", args, kwargs))
+
+    def delete(self, *args):
+        self.ops.append(("delete", args, {}))
+
+    def mget(self, keys):
+        self.ops.append(("mget", (keys,), {}))
+
+    async def execute(self):
+        self.redis._round_trip()
+        return [getattr(self.redis, f"_{op}")(*args, **kwargs) for op, args, kwargs in self.ops]
+
+
+class DummyRedis:
+    # Минимальная замена Redis в памяти. TTL запоминаем (ex в секундах или px в мс),
+    # но не соблюдаем; round_trips — сколько раз клиент ходил в Redis (pipeline — один раз);
+    # broken = True — каждый вызов падает, как при недоступном Redis
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.lists = {}
+        self.published = []
+        self.round_trips = 0
+        self.broken = False
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.broken:
+            raise ConnectionError("redis down")
+
+    def _set(self, key, value, ex=None, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        self.ttls[key] = ex if ex is not None else px
+        return True
+
+    def _delete(self, *keys):
+        return sum(self.data.pop(k, None) is not None for k in keys)
+
+    def _mget(self, keys):
+        return [self.data.get(k) for k in keys]
+
+    async def get(self, key):
+        self._round_trip()
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False, px=None):
+        self._round_trip()
+        return self._set(key, value, ex=ex, nx=nx, px=px)
+
+    async def delete(self, *keys):
+        self._round_trip()
+        return self._delete(*keys)
+
+    async def mget(self, keys):
+        self._round_trip()
+        return self._mget(keys)
+
+    async def scan_iter(self, match="*", count=None):
+        self._round_trip()
+        for key in list(self.data):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+    async def publish(self, channel, message):
+        self._round_trip()
+        self.published.append((channel, message))
+
+    async def rpush(self, key, value):
+        self._round_trip()
+        self.lists.setdefault(key, []).append(value)
+
+    def pipeline(self, transaction=True):
+        return DummyPipeline(self)
+
+
+@pytest.fixture
+def redis():
+    return DummyRedis()
@@ -0,0 +1,98 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from ban_list import BanList, BanMiddleware
+
+
+class DummyUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+@pytest.mark.asyncio
+async def test_bulk_ban_and_unban_are_published(redis):
+    bans = BanList(redis_client=redis)
+    assert await bans.ban([3, 1, 2, 1]) == 3
+    assert await bans.ban([2]) == 0
+    assert 1 in bans and 3 in bans and len(bans) == 3
+    assert await bans.unban([1, 5]) == 1
+    assert 1 not in bans
+    assert redis.published == [("bans", "+1,2,3"), ("bans", "+2"), ("bans", "-1,5")]
+
+
+def test_changes_from_other_process_are_applied():
+    bans = BanList()
+    bans.apply(b"+10,11,12")
+    bans.apply("-11")
+    assert list(bans) == [10, 12]
+
+
+class CountingPool:
+    def __init__(self, ids):
+        self.ids = ids
+        self.loads = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetch(self, query, *args):
+        self.loads += 1
+        return [{"telegram_id": i} for i in self.ids]
+
+
+class ChattyPubSub:
+    # Сообщение приходит раньше любого таймаута — get_message никогда не отдаёт None
+    async def subscribe(self, channel):
+        pass
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        await asyncio.sleep(0.01)
+        return {"data": b"+7"}
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_resync_runs_on_schedule_even_under_constant_messages(redis):
+    pool = CountingPool([1, 2])
+    redis.pubsub = ChattyPubSub
+    bans = BanList(pool, redis, resync_interval=0.1)
+    bans.start_sync()
+    await asyncio.sleep(0.35)
+    await bans.close()
+    # одно чтение при подключении и по одному на каждый истёкший интервал
+    assert 3 <= pool.loads <= 5
+    assert 1 in bans
+
+
+@pytest.mark.asyncio
+async def test_middleware_drops_banned_but_not_admins():
+    bans = BanList()
+    await bans.ban([1, 2])
+    middleware = BanMiddleware(bans, exempt_ids={2})
+    handled = []
+
+    async def handler(event, data):
+        handled.append(data["event_from_user"].id)
+        return "ok"
+
+    for user_id in (1, 2, 3):
+        await middleware(handler, None, {"event_from_user": DummyUser(user_id)})
+    assert handled == [2, 3]
+
+
+def test_parse_ban_command(monkeypatch):
+    monkeypatch.setenv("API_TOKEN", "123456:ABCdef")
+    import BotGGpokerMain as bot_module
+    assert bot_module.parse_ban_command("/ban 1, 2\n3 спам") == ([1, 2, 3], "спам")
+    assert bot_module.parse_ban_command("/unban") == ([], None)
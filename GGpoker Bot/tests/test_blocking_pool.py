@@ -0,0 +1,42 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+import threading
+import time
+import pytest
+
+from blocking_pool import BlockingPool, PoolOverloaded
+
+
+@pytest.mark.asyncio
+async def test_runs_off_event_loop_and_counts():
+    pool = BlockingPool(max_workers=2, max_queue=2)
+    loop_thread = threading.get_ident()
+    thread_id = await pool.run(threading.get_ident)
+    assert thread_id != loop_thread
+    with pytest.raises(ZeroDivisionError):
+        await pool.run(lambda: 1 / 0)
+    stats = pool.stats()
+    assert stats["completed"] == 1
+    assert stats["failed"] == 1
+    assert stats["queued"] == 0
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_queue_limit_rejects_when_full():
+    pool = BlockingPool(max_workers=1, max_queue=1, queue_timeout=0.05)
+    release = threading.Event()
+    # две задачи занимают поток и единственное место в очереди
+    busy = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    with pytest.raises(PoolOverloaded):
+        await pool.run(time.sleep, 0)
+    assert pool.stats()["rejected"] == 1
+    release.set()
+    await asyncio.gather(*busy)
+    pool.shutdown()
@@ -0,0 +1,195 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import time
+import pytest
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from broadcast import TokenBucket, PerChatLimiter, BroadcastEngine, BroadcastStats
+from datetime import datetime, timedelta
+
+from broadcast_jobs import BroadcastJob, BroadcastScheduler, run_job
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_sends():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        await bucket.acquire()
+    # 1 токен є одразу, ще 10 — по 20 мс
+    assert time.monotonic() - start >= 0.18
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_not_counted_as_failure():
+    calls = []
+
+    async def send(chat_id):
+        calls.append(chat_id)
+        if chat_id == 2 and calls.count(2) == 1:
+            raise TelegramRetryAfter(SendMessage(chat_id=2, text="x"), "flood", retry_after=0)
+        if chat_id == 3:
+            raise TelegramForbiddenError(SendMessage(chat_id=3, text="x"), "blocked")
+
+    engine = BroadcastEngine(TokenBucket(rate=1000), PerChatLimiter(interval=0), concurrency=4)
+    stats = await engine.run([1, 2, 3, 4], send)
+    assert stats.sent == 3
+    assert stats.failed == [3]
+    assert stats.throttled == 1
+    assert calls.count(2) == 2
+
+
+@pytest.mark.asyncio
+async def test_repeated_retry_after_does_not_use_up_attempts():
+    calls = []
+
+    async def send(chat_id):
+        calls.append(chat_id)
+        # Більше 429 підряд, ніж MAX_ATTEMPTS
+        if chat_id == 2 and calls.count(2) <= 8:
+            raise TelegramRetryAfter(SendMessage(chat_id=2, text="x"), "flood", retry_after=0)
+
+    engine = BroadcastEngine(TokenBucket(rate=1000), PerChatLimiter(interval=0), concurrency=2)
+    stats = await engine.run([1, 2, 3], send)
+    assert stats.sent == 3
+    assert stats.failed == []
+    assert stats.throttled == 8
+    assert calls.count(2) == 9
+
+
+@pytest.mark.asyncio
+async def test_retry_after_budget_is_limited():
+    async def send(chat_id):
+        raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text="x"), "flood", retry_after=0)
+
+    engine = BroadcastEngine(TokenBucket(rate=1000), PerChatLimiter(interval=0), max_throttle_wait=3)
+    stats = BroadcastStats(total=1, results=[])
+    await engine.run([7], send, stats=stats)
+    assert stats.failed == [7]
+    assert stats.throttled == 4
+    assert stats.results[0][1] == "TelegramRetryAfter"
+
+
+@pytest.mark.asyncio
+async def test_progress_is_reported():
+    reports = []
+
+    async def send(chat_id):
+        pass
+
+    async def on_progress(stats):
+        reports.append(stats.done)
+
+    engine = BroadcastEngine(TokenBucket(rate=100, capacity=1), PerChatLimiter(interval=0),
+                             concurrency=2, progress_interval=0.05)
+    stats = await engine.run(range(20), send, on_progress=on_progress)
+    assert stats.sent == 20
+    assert reports
+
+
+class MemoryJobStore:
+    # Замість PostgreSQL — список отримувачів у пам'яті
+    def __init__(self, recipients):
+        self.recipients = list(enumerate(recipients, start=1))
+        self.checkpoints = []
+        self.deliveries = []
+        self.finished = False
+
+    async def next_batch(self, job, size):
+        return [r for r in self.recipients if r[0] > job.cursor][:size]
+
+    async def checkpoint(self, job, cursor, sent, failed, deliveries=()):
+        self.checkpoints.append(cursor)
+        self.deliveries.extend(deliveries)
+        job.cursor = cursor
+        job.success_count += sent
+        job.failed_count += len(failed)
+
+    async def finish(self, job, status="done"):
+        self.finished = True
+
+
+@pytest.mark.asyncio
+async def test_job_resumes_from_checkpoint():
+    store = MemoryJobStore(range(100, 110))
+    # Перші 4 отримувачі вже були оброблені до перезапуску
+    job = BroadcastJob(id=1, admin_id=0, message="hi", total=10, cursor=4, success_count=4)
+    delivered = []
+
+    async def send(chat_id):
+        delivered.append(chat_id)
+
+    engine = BroadcastEngine(TokenBucket(rate=1000), PerChatLimiter(interval=0), concurrency=3)
+    stats = await run_job(store, engine, job, send, batch_size=4)
+    assert sorted(delivered) == list(range(104, 110))
+    assert store.checkpoints == [8, 10]
+    assert stats.sent == 10
+    assert store.finished
+
+
+@pytest.mark.asyncio
+async def test_job_records_result_per_recipient():
+    store = MemoryJobStore(range(1, 6))
+    job = BroadcastJob(id=1, admin_id=0, message="hi", total=5, failed_count=2)
+
+    async def send(chat_id):
+        if chat_id == 4:
+            raise TelegramForbiddenError(SendMessage(chat_id=4, text="x"), "blocked")
+
+    engine = BroadcastEngine(TokenBucket(rate=1000), PerChatLimiter(interval=0), concurrency=2)
+    stats = await run_job(store, engine, job, send, batch_size=2)
+    results = {chat_id: error for chat_id, error, _ in store.deliveries}
+    assert results == {1: None, 2: None, 3: None, 4: "TelegramForbiddenError", 5: None}
+    # попередні помилки задачі враховуються в лічильнику
+    assert stats.failed_count == 3
+    assert job.failed_count == 3
+    assert stats.results == []
+
+
+class MemoryScheduleStore:
+    # Запланированные задачи в памяти: scheduled → prepared → running
+    def __init__(self, jobs):
+        self.jobs = {j.id: j for j in jobs}
+        self.snapshots = []
+
+    async def prepare_due(self, until):
+        prepared = []
+        for job in self.jobs.values():
+            if job.status == "scheduled" and job.scheduled_at <= until:
+                job.status = "prepared"
+                job.total = 3
+                self.snapshots.append(job.id)
+                prepared.append(job.id)
+        return prepared
+
+    async def claim_due(self, now):
+        due = [j for j in self.jobs.values() if j.status == "prepared" and j.scheduled_at <= now]
+        for job in due:
+            job.status = "running"
+        return due
+
+
+@pytest.mark.asyncio
+async def test_scheduler_prepares_snapshot_ahead_and_starts_once():
+    at = datetime(2030, 1, 1, 12, 0)
+    store = MemoryScheduleStore([
+        BroadcastJob(id=1, admin_id=0, message="hi", status="scheduled", scheduled_at=at),
+        BroadcastJob(id=2, admin_id=0, message="later", status="scheduled", scheduled_at=at + timedelta(hours=1)),
+    ])
+    started = []
+    scheduler = BroadcastScheduler(store, lambda job: started.append(job.id), prepare_ahead=120)
+
+    await scheduler.tick(at - timedelta(minutes=5))
+    assert store.snapshots == [] and started == []
+    await scheduler.tick(at - timedelta(minutes=1))
+    # снимок уже готов, но отправка ещё не началась
+    assert store.snapshots == [1] and started == []
+    await scheduler.tick(at)
+    await scheduler.tick(at + timedelta(seconds=1))
+    assert started == [1]
+    assert store.jobs[2].status == "scheduled"
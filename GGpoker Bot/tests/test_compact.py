@@ -0,0 +1,110 @@
+import os
+import random
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+from array import array
+
+import pytest
+
+from compact import IntSet, hash64, sort_unique
+from state_storage import MemoryStateStorage
+
+
+def test_intset_matches_builtin_set():
+    rng = random.Random(1)
+    reference = set()
+    # маленький порог, чтобы слияния происходили часто
+    values = IntSet(min_merge=8)
+    for _ in range(5000):
+        v = rng.randrange(-500, 500)
+        if rng.random() < 0.6:
+            values.add(v)
+            reference.add(v)
+        else:
+            values.discard(v)
+            reference.discard(v)
+    assert len(values) == len(reference)
+    assert list(values) == sorted(reference)
+    assert all((v in values) == (v in reference) for v in range(-600, 600))
+
+
+def test_intset_compact_keeps_eight_bytes_per_item():
+    values = IntSet(range(1000))
+    values.add(5000)
+    values.discard(3)
+    values.compact()
+    assert values.nbytes() == 8 * 1000
+    assert 3 not in values and 5000 in values
+
+
+def test_sort_unique_merges_sorted_runs():
+    rng = random.Random(2)
+    raw = [rng.randrange(-1000, 1000) for _ in range(5000)]
+    # маленький run — много кусков для слияния
+    result = sort_unique(array("q", raw), run=64)
+    assert result.typecode == "q"
+    assert list(result) == sorted(set(raw))
+    assert list(sort_unique(array("q"))) == []
+
+
+def test_hash64_is_stable_signed_int():
+    assert hash64("nick") == hash64("nick")
+    assert hash64("nick") != hash64("nick2")
+    assert -2 ** 63 <= hash64("nick") < 2 ** 63
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_evicts_least_recently_used():
+    storage = MemoryStateStorage(ttl=60, max_users=2)
+    for user_id in (1, 2, 3):
+        session = await storage.load(user_id)
+        session.user_state = {"step": "awaiting_nickname"}
+        await storage.save(session)
+    assert len(storage) == 2
+    assert (await storage.load(1)).user_state is None
+    assert (await storage.load(3)).user_state == {"step": "awaiting_nickname"}
+
+    # очищенный стан не занимает места
+    session = await storage.load(3)
+    session.user_state = None
+    await storage.save(session)
+    assert len(storage) == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_round_trips_registration_state():
+    storage = MemoryStateStorage(ttl=60)
+    states = [
+        "awaiting_nickname",
+        {"step": "awaiting_email", "nickname": "Nick"},
+        {"step": "confirming", "nickname": "Nick", "email": "a@b.c"},
+        {"other": 1},
+    ]
+    for state in states:
+        session = await storage.load(1)
+        session.user_state = state
+        await storage.save(session)
+        assert (await storage.load(1)).user_state == state
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_sweeps_expired_users_without_reading_them():
+    storage = MemoryStateStorage(ttl=0.05, sweep_every=2)
+    session = await storage.load(1)
+    session.user_state = "awaiting_nickname"
+    await storage.save(session)
+    await asyncio.sleep(0.06)
+    for user_id in (2, 3):
+        session = await storage.load(user_id)
+        session.admin_state = "broadcast"
+        session.user_state = {"step": "awaiting_email", "nickname": "Nick"}
+        await storage.save(session)
+    # пользователь 1 не писал больше — его стан убран периодической чисткой
+    assert len(storage) == 2
+    session = await storage.load(3)
+    assert session.admin_state == "broadcast"
+    assert session.user_state == {"step": "awaiting_email", "nickname": "Nick"}
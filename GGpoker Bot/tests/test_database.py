@@ -0,0 +1,139 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+
+import asyncpg
+import pytest
+from asyncpg import connresource
+
+from broadcast_jobs import CHECKPOINT, NEXT_BATCH
+from database import Database, TimedConnection, query_label
+from metrics import DB_ACQUIRE_TIMEOUTS, DB_POOL, DB_QUERY_LATENCY, DB_QUERY_ROWS, watch_pool
+from participants_store import PARTICIPANT_BY_ID
+
+
+class GuardedStatement(connresource.ConnectionResource):
+    # Как PreparedStatement в asyncpg: после release соединения пользоваться нельзя
+    @connresource.guarded
+    async def fetchval(self, *args, column=0, timeout=None):
+        return 1
+
+
+class FakeProtocol:
+    def is_connected(self):
+        return True
+
+
+class FakeConnection(TimedConnection):
+    # Соединение без сервера: подменён только обмен с протоколом, остальное — asyncpg
+    def __init__(self):
+        self._aborted, self._protocol = False, FakeProtocol()
+        self._pool_release_ctr = 0
+        self._listeners, self._log_listeners = {}, set()
+        self._query_loggers = ()
+        self.calls = []
+
+    def __del__(self):
+        pass
+
+    async def prepare(self, query, **kwargs):
+        return GuardedStatement(self)
+
+    async def _execute(self, query, args, limit, timeout, *, return_status=False, **kwargs):
+        self.calls.append((str(query), args))
+        if return_status:
+            return [], b"UPDATE 1", False
+        return [(1,)]
+
+
+def test_query_labels():
+    assert query_label(PARTICIPANT_BY_ID) == "participant_by_id"
+    assert query_label("SELECT telegram_id FROM banned_users ORDER BY telegram_id") == "select banned_users"
+    assert query_label("  INSERT INTO broadcast_logs (a) VALUES ($1)") == "insert broadcast_logs"
+    assert query_label("UPDATE broadcast_jobs SET status = $2 WHERE id = $1") == "update broadcast_jobs"
+    assert query_label("CREATE TABLE IF NOT EXISTS media (x int)") == "create media"
+    assert query_label("SELECT pg_advisory_unlock_all(); CLOSE ALL; RESET ALL;") == "reset"
+
+
+def test_hot_queries_are_timed_and_survive_release_to_pool():
+    conn = FakeConnection()
+    before = DB_QUERY_LATENCY.count("participant_by_id")
+    rows_before = DB_QUERY_ROWS.value("participant_by_id")
+
+    async def main():
+        # Кожен acquire закінчується release: asyncpg збільшує _pool_release_ctr
+        for user_id in (1, 2, 3):
+            assert await conn.fetchval(PARTICIPANT_BY_ID, user_id) == 1
+            assert await conn.execute(CHECKPOINT, 7, 100, 90, 10) == "UPDATE 1"
+            assert await conn.fetch(NEXT_BATCH, 7, 100, 500) == [(1,)]
+            conn._on_release()
+
+    asyncio.run(main())
+    assert conn._pool_release_ctr == 3
+    assert [args for sql, args in conn.calls if sql == PARTICIPANT_BY_ID] == [(1,), (2,), (3,)]
+    assert DB_QUERY_LATENCY.count("participant_by_id") == before + 3
+    assert DB_QUERY_ROWS.value("participant_by_id") == rows_before + 3
+    assert DB_QUERY_ROWS.value("broadcast_checkpoint") >= 3
+
+
+def test_statement_kept_across_release_is_rejected_by_asyncpg():
+    # Чому TimedConnection не зберігає власних PreparedStatement між acquire
+    conn = FakeConnection()
+
+    async def main():
+        statement = await conn.prepare(PARTICIPANT_BY_ID)
+        assert await statement.fetchval(1) == 1
+        conn._on_release()
+        with pytest.raises(asyncpg.InterfaceError):
+            await statement.fetchval(1)
+
+    asyncio.run(main())
+
+
+class FakePool:
+    def __init__(self, size):
+        self.free = asyncio.Queue()
+        for i in range(size):
+            self.free.put_nowait(f"conn{i}")
+        self.size = size
+
+    async def acquire(self, timeout=None):
+        return await asyncio.wait_for(self.free.get(), timeout)
+
+    async def release(self, conn):
+        self.free.put_nowait(conn)
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return self.free.qsize()
+
+    def get_max_size(self):
+        return self.size
+
+
+def test_pool_saturation_is_visible():
+    db = Database(max_size=1, acquire_timeout=0.05)
+    timeouts = DB_ACQUIRE_TIMEOUTS.value()
+
+    async def main():
+        db.pool = FakePool(1)
+        watch_pool(db)
+        async with db.acquire():
+            waiter = asyncio.create_task(db.acquire().__aenter__())
+            await asyncio.sleep(0)
+            assert db.stats() == {"size": 1, "in_use": 1, "idle": 0, "max": 1, "waiting": 1}
+            assert 'bot_db_pool_connections{state="waiting"} 1' in "\n".join(DB_POOL.samples())
+            with pytest.raises(asyncio.TimeoutError):
+                await waiter
+        assert db.stats()["waiting"] == 0
+        async with db.acquire() as conn:
+            assert conn == "conn0"
+
+    asyncio.run(main())
+    assert DB_ACQUIRE_TIMEOUTS.value() == timeouts + 1
@@ -28,7 +28,10 @@ def isolate_participants(tmp_path, monkeypatch):
 
     monkeypatch.setenv("EXCEL_FILE", str(file))
     monkeypatch.setattr(bot_module, "EXCEL_FILE", str(file))
-    monkeypatch.setattr(bot_module, "participants_set", set())
+    index = bot_module.UniquenessIndex()
+    monkeypatch.setattr(bot_module, "participant_index", index)
+    monkeypatch.setattr(bot_module, "participants_store",
+                        bot_module.ParticipantJournal(str(tmp_path / "participants.jsonl"), index=index))
     return str(file)
 
 
@@ -44,12 +47,80 @@ def test_save_participant_and_duplicates(isolate_participants):
     user = DummyUser(123, "tester", "Test", "User")
     # первый вызов должен вернуть True
     assert bot_module.save_participant(user, "nick1", "a@b.com") is True
-    # проверяем, что запись появилась в Excel
+    # Excel формируется из журнала по запросу — проверяем, что запись в нём есть
+    bot_module.participants_store.export_excel(isolate_participants)
     wb = load_workbook(isolate_participants)
     data = list(wb.active.iter_rows(min_row=2, values_only=True))
     assert data[0][4] == "nick1"
     # второй вызов — дубликат
     assert bot_module.save_participant(user, "nick1", "a@b.com") is False
+    # тот же ник от другого пользователя — тоже дубликат
+    assert bot_module.save_participant(DummyUser(124, None, "Other"), "nick1", "c@d.com") is False
+    # ник и email сравниваются без учёта регистра и пробелов по краям
+    assert bot_module.save_participant(DummyUser(125, None, "Other"), " NICK1 ", "x@y.com") is False
+    assert bot_module.save_participant(DummyUser(126, None, "Other"), "nick2", "A@B.com ") is False
+
+
+def test_uniqueness_index_concurrent_reserve():
+    from concurrent.futures import ThreadPoolExecutor
+    index = bot_module.UniquenessIndex()
+    # десять одновременных подтверждений с одинаковым ником — проходит только одно
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(lambda i: index.reserve(i, "SameNick", f"{i}@mail.com"), range(10)))
+    assert results.count(True) == 1
+    index.release(results.index(True), "samenick", f"{results.index(True)}@mail.com")
+    assert index.reserve(42, "samenick", "42@mail.com") is True
+
+
+def test_journal_survives_restart_and_torn_write(tmp_path):
+    path = str(tmp_path / "participants.jsonl")
+    journal = bot_module.ParticipantJournal(path)
+    assert journal.add({"telegram_id": 1, "username": "@a", "full_name": "A",
+                        "joined_at": "2024-01-01 10:00", "nickname": "n1", "email": "a@b.com"})
+    journal.close()
+    # имитируем падение посреди записи второй строки
+    with open(path, "ab") as f:
+        f.write(b'{"telegram_id": 2, "nick')
+
+    reopened = bot_module.ParticipantJournal(path)
+    assert len(reopened) == 1
+    assert 1 in reopened
+    assert reopened.index.is_duplicate(99, "N1")
+    assert [r["telegram_id"] for r in reopened.rows()] == [1]
+
+    # отмена записи освобождает ник и переживает перезапуск
+    assert reopened.remove(1) is True
+    reopened.close()
+    again = bot_module.ParticipantJournal(path)
+    assert len(again) == 0
+    assert not again.index.is_duplicate(1, "n1", "a@b.com")
+    assert list(again.rows()) == []
+
+
+def test_journal_remove_writes_tombstone_without_rereading(tmp_path, monkeypatch):
+    path = str(tmp_path / "participants.jsonl")
+    journal = bot_module.ParticipantJournal(path)
+    for i in range(3):
+        assert journal.add({"telegram_id": i, "username": None, "full_name": "U",
+                            "joined_at": "2024-01-01 10:00", "nickname": f"n{i}", "email": f"{i}@b.com"})
+    # смещения известны из add(): remove не должен перечитывать журнал
+    monkeypatch.setattr(journal, "_live_records", lambda: pytest.fail("журнал перечитан"))
+    assert journal.remove(1) is True
+    assert journal.remove(1) is False
+    assert journal.remove(99) is False
+    monkeypatch.undo()
+    assert [r["telegram_id"] for r in journal.rows()] == [0, 2]
+    # повторная регистрация после отмены и отмена уже её
+    assert journal.add({"telegram_id": 1, "username": None, "full_name": "U",
+                        "joined_at": "2024-01-02 10:00", "nickname": "n1", "email": "1@b.com"})
+    journal.close()
+
+    reopened = bot_module.ParticipantJournal(path)
+    assert [r["joined_at"] for r in reopened.rows() if r["telegram_id"] == 1] == ["2024-01-02 10:00"]
+    assert reopened.remove(1) is True
+    assert [r["telegram_id"] for r in reopened.rows()] == [0, 2]
+    assert len(reopened) == 2
+    reopened.close()
 
 
 @pytest.mark.parametrize("email,valid", [
@@ -89,28 +160,93 @@ def test_support_and_admin_menu():
         assert exp in texts
 
 
+def test_menu_routes_table():
+    # клавиатуры строятся один раз и переиспользуются
+    assert bot_module.user_menu(True) is bot_module.user_menu(True)
+    assert bot_module.admin_menu() is bot_module.admin_menu()
+
+    admin_texts = [b.text for row in bot_module.admin_menu().keyboard for b in row]
+    for text in admin_texts:
+        handler, admin_only = bot_module.MENU_ROUTES[text]
+        assert admin_only == (text != "↩️ Повернутись")
+    assert bot_module.MENU_ROUTES["📜 Умови"][1] is False
+
+
+@pytest.mark.asyncio
+async def test_conditions_answered_once():
+    answers = []
+    user = DummyUser(3, None, "Cond")
+    msg = type("M", (), {"from_user": user, "text": "📜 Умови",
+                         "answer": lambda self, text, **kw: answers.append(text) or asyncio.sleep(0)})()
+    handler, _ = bot_module.MENU_ROUTES["📜 Умови"]
+    await handler(msg, bot_module.UserSession(user.id))
+    assert len(answers) == 1
+
+
+class DummyCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, n):
+        chunk, self.rows = self.rows[:n], self.rows[n:]
+        return chunk
+
+
+class DummyConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def transaction(self):
+        class Tx:
+            async def __aenter__(self):
+                pass
+            async def __aexit__(self, exc_type, exc, tb):
+                pass
+        return Tx()
+
+    async def cursor(self, _):
+        return DummyCursor(list(self.rows))
+
+
+class DummyPool:
+    def __init__(self, rows):
+        self.rows = rows
+
+    # acquire возвращает сразу контекст‑менеджер
+    def acquire(self):
+        rows = self.rows
+
+        class Ctx:
+            async def __aenter__(self):
+                return DummyConn(rows)
+            async def __aexit__(self, exc_type, exc, tb):
+                pass
+        return Ctx()
+
+
 @pytest.mark.asyncio
-async def test_export_db_to_excel(monkeypatch):
-    class DummyConn:
-        async def fetch(self, _):
-            return [(1, "@u", "Full", datetime.now(), "nick", "e@mail.com")]
-
-    class DummyPool:
-        # acquire возвращает сразу контекст‑менеджер
-        def acquire(self):
-            class Ctx:
-                async def __aenter__(self):
-                    return DummyConn()
-                async def __aexit__(self, exc_type, exc, tb):
-                    pass
-            return Ctx()
-
-    fn = bot_module.export_db_to_excel(DummyPool())
+async def test_export_db_to_excel(monkeypatch, tmp_path):
+    monkeypatch.setattr(bot_module, "EXPORT_DIR", str(tmp_path))
+    fn = bot_module.export_db_to_excel(DummyPool([(1, "@u", "Full", datetime.now(), "nick", "e@mail.com")]))
     path = await fn()
     assert path.endswith(".xlsx")
     assert os.path.exists(path)
 
 
+@pytest.mark.asyncio
+async def test_stream_export_chunks_to_gzip_csv(tmp_path):
+    import csv
+    import gzip
+    rows = [(i, f"nick{i}") for i in range(2500)]
+    path = await bot_module.stream_export(DummyPool(rows), "SELECT", ["id", "nick"],
+                                          str(tmp_path), "participants", "csv.gz", chunk=1000)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = list(csv.reader(f))
+    assert data[0] == ["id", "nick"]
+    assert len(data) == 2501
+    assert data[-1] == ["2499", "nick2499"]
+
+
 # --- HANDLER TESTS ---
 @pytest.mark.asyncio
 async def test_participate_and_full_registration_flow(monkeypatch):
@@ -144,28 +280,29 @@ async def test_participate_and_full_registration_flow(monkeypatch):
             self.answers.append(text)
 
     cb = DummyCallback()
-    await bot_module.check_subscription(cb)
-    assert bot_module.user_states[user.id] == "awaiting_nickname"
+    session = bot_module.UserSession(user.id)
+    await bot_module.check_subscription(cb, session)
+    assert session.user_state == "awaiting_nickname"
 
     # 3) Вводим никнейм и email через handle_messages
     dm2 = DummyMessage(); dm2.text = "my_nick"
-    await bot_module.handle_messages(dm2)
+    await bot_module.handle_messages(dm2, session)
     dm3 = DummyMessage(); dm3.text = "my@mail.com"
-    await bot_module.handle_messages(dm3)
-    # в user_states должен быть шаг confirming
-    assert bot_module.user_states[user.id]["step"] == "confirming"
+    await bot_module.handle_messages(dm3, session)
+    # в сессии должен быть шаг confirming
+    assert session.user_state["step"] == "confirming"
 
     # 4) Подтверждаем участие
     cb2 = DummyCallback(); cb2.data = "confirm_participation"; cb2.message = dm
     # Устанавливаем состояние вручную
-    bot_module.user_states[user.id] = {
+    session.user_state = {
         "step": "confirming",
         "nickname": "my_nick",
         "email": "my@mail.com",
     }
-    await bot_module.confirm_participation(cb2)
+    await bot_module.confirm_participation(cb2, session)
     # После подтверждения state должен удалиться
-    assert user.id not in bot_module.user_states
+    assert session.user_state is None
 
 
 @pytest.mark.asyncio
@@ -174,10 +311,11 @@ async def test_handle_spam_prevention():
     # Создаём два сообщения подряд
     class M: pass
     m = type("X", (object,), {"from_user": user, "text": "hi", "answer": lambda *a, **k: None})()
+    session = bot_module.UserSession(user.id)
     # Первый вызов — должен пройти
-    await bot_module.handle_messages(m)
+    await bot_module.handle_messages(m, session)
     # Второй незадолго — должен проигнорироваться, но без ошибок
-    await bot_module.handle_messages(m)
-    assert user.id not in bot_module.user_states
+    await bot_module.handle_messages(m, session)
+    assert session.user_state is None
 
 
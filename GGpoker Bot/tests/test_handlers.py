@@ -12,6 +12,7 @@ from datetime import datetime
 
 # Импортируем BotGGpokerMain как модуль бота
 import BotGGpokerMain as bot_module
+from rate_limit import LocalLimiter
 
 # Вспомогательная модель пользователя
 class DummyUser:
@@ -55,43 +56,66 @@ async def test_participate_and_full_registration_flow(monkeypatch):
             self.answers.append(text)
 
     cb = DummyCallback()
-    await bot_module.check_subscription(cb)
-    assert bot_module.user_states[user.id] == "awaiting_nickname"
+    session = bot_module.UserSession(user.id)
+    await bot_module.check_subscription(cb, session)
+    assert session.user_state == "awaiting_nickname"
 
     # 3) Шаг ввода никнейма и email
     dm2 = DummyMessage(); dm2.text = "my_nick"
-    await bot_module.handle_messages(dm2)
+    await bot_module.handle_messages(dm2, session)
     dm3 = DummyMessage(); dm3.text = "my@mail.com"
-    await bot_module.handle_messages(dm3)
-    assert bot_module.user_states[user.id]["step"] == "confirming"
+    await bot_module.handle_messages(dm3, session)
+    assert session.user_state["step"] == "confirming"
 
     # 4) Подтверждение участия
     cb2 = DummyCallback(); cb2.data = "confirm_participation"; cb2.message = dm
     # Устанавливаем состояние вручную, как будто пользователь нажал кнопку
-    bot_module.user_states[user.id] = {
+    session.user_state = {
         "step": "confirming",
         "nickname": "my_nick",
         "email": "my@mail.com",
     }
-    await bot_module.confirm_participation(cb2)
-    assert user.id not in bot_module.user_states
+    await bot_module.confirm_participation(cb2, session)
+    assert session.user_state is None
 
 @pytest.mark.asyncio
-async def test_handle_spam_prevention():
-    # Антиспам: два сообщения подряд должны пройти без ошибок, но второй игнорироваться
+async def test_handle_spam_prevention(monkeypatch):
+    # Антиспам: второе сообщение подряд не доходит до хендлера, пользователь получает предупреждение.
+    # Ведём апдейты через те же middleware бота, что и диспетчер: антифлуд → состояние → хендлер
     user = DummyUser(2, None, "Spam")
-    class M: pass
+    middleware = bot_module.rate_limit_middleware
+    monkeypatch.setitem(middleware.limits, "message", 60)
+    monkeypatch.setattr(middleware.limiter, "local", LocalLimiter())
+    state = bot_module.state_middleware
 
-    m = type("X", (object,), {
-        "from_user": user,
-        "text": "hi",
-        "answer": lambda *a, **k: None
-    })()
+    session = await state.storage.load(user.id)
+    session.user_state = "awaiting_nickname"
+    await state.storage.save(session)
 
-    # Первый вызов — обрабатывается
-    await bot_module.handle_messages(m)
-    # Второй почти сразу — просто ничего не делает (но и не падает)
-    await bot_module.handle_messages(m)
+    answers, replies, calls = [], [], []
 
-    # Состояние пользователя не меняется
-    assert user.id not in bot_module.user_states
+    class DummyMessage:
+        def __init__(self, text):
+            self.from_user = user
+            self.text = text
+        async def answer(self, text, **kwargs):
+            answers.append(text)
+        async def reply(self, text, **kwargs):
+            replies.append(text)
+
+    async def handle(event, data):
+        calls.append(event.text)
+        return await bot_module.handle_messages(event, data["session"])
+
+    async def feed(message):
+        return await middleware(lambda event, data: state(handle, event, data), message, {"event_from_user": user})
+
+    await feed(DummyMessage("my_nick"))
+    await feed(DummyMessage("my_nick_again"))
+
+    # Хендлер вызван один раз, второе сообщение погашено антифлудом
+    assert calls == ["my_nick"]
+    assert replies == ["📧 Введіть вашу електронну пошту:"]
+    assert answers == ["⏳ Повільніше, будь ласка!"]
+    session = await state.storage.load(user.id)
+    assert session.user_state == {"step": "awaiting_email", "nickname": "my_nick"}
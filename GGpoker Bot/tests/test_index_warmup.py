@@ -0,0 +1,80 @@
+import os
+import struct
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import pytest
+
+from participants_store import ParticipantCopyReader, UniquenessIndex, warm_up_index
+
+
+def copy_binary(rows):
+    # Формат COPY ... (FORMAT binary): заголовок, кортежі, маркер кінця
+    out = bytearray(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+    for telegram_id, nickname, email in rows:
+        out += struct.pack(">h", 3)
+        out += struct.pack(">iq", 8, telegram_id)
+        for value in (nickname, email):
+            if value is None:
+                out += struct.pack(">i", -1)
+            else:
+                data = value.encode("utf-8")
+                out += struct.pack(">i", len(data)) + data
+    out += struct.pack(">h", -1)
+    return bytes(out)
+
+
+ROWS = [(5_000_000_001, " Nick ", "A@Mail.com"), (2, "Ірина", None), (3, "third", "")]
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 4096])
+def test_copy_reader_handles_any_chunking(chunk):
+    payload = copy_binary(ROWS)
+    reader = ParticipantCopyReader()
+    for i in range(0, len(payload), chunk):
+        reader.feed(payload[i:i + chunk])
+    assert reader.rows == 3
+    assert list(reader.ids) == [5_000_000_001, 2, 3]
+    assert len(reader.nicknames) == 3 and len(reader.emails) == 1
+
+
+class DummyConn:
+    def __init__(self, payload):
+        self.payload = payload
+
+    async def copy_from_query(self, query, output, format):
+        assert format == "binary"
+        for i in range(0, len(self.payload), 10):
+            await output(self.payload[i:i + 10])
+
+
+class DummyPool:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def acquire(self):
+        pool = self
+
+        class Ctx:
+            async def __aenter__(self):
+                return DummyConn(pool.payload)
+
+            async def __aexit__(self, exc_type, exc, tb):
+                return False
+        return Ctx()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_keeps_entries_added_during_warm_up():
+    index = UniquenessIndex()
+    # учасник із журналу, зареєстрований до завершения прогрева
+    index.add(99, "fresh", "fresh@mail.com")
+    assert not index.ready.is_set()
+    assert await warm_up_index(DummyPool(copy_binary(ROWS)), index) == 3
+    assert index.ready.is_set()
+    assert index.is_duplicate(7, "nick", "x@y.z")
+    assert index.is_duplicate(7, "x", "a@mail.com")
+    assert 99 in index and 5_000_000_001 in index
+    assert not index.is_duplicate(7, "other", "other@mail.com")
@@ -0,0 +1,66 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+import time
+from datetime import datetime
+
+from aiogram.types import Chat, Message, Update, User
+
+from loop_watchdog import LoopWatchdog
+from metrics import LOOP_LAG, LOOP_STALLS
+
+
+def blocking_export():
+    # Імітація load_workbook / wb.save прямо в циклі подій
+    time.sleep(0.3)
+
+
+async def feed_update(update):
+    blocking_export()
+
+
+def test_watchdog_captures_blocking_frame_and_update():
+    digests = []
+
+    async def on_digest(text):
+        digests.append(text)
+
+    update = Update(update_id=77, message=Message(
+        message_id=1, date=datetime.now(), chat=Chat(id=5, type="private"),
+        from_user=User(id=5, is_bot=False, first_name="x"), text="📥 Експорт Excel",
+    ))
+
+    async def scenario():
+        watchdog = LoopWatchdog(threshold=0.1, interval=0.02, digest_interval=0, on_digest=on_digest)
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        await feed_update(update)
+        await asyncio.sleep(0.1)
+        await watchdog.close()
+        return watchdog
+
+    before = LOOP_LAG.count()
+    watchdog = asyncio.run(scenario())
+    assert watchdog.stalls == 1
+    assert LOOP_LAG.count() > before
+    assert len(digests) == 1
+    # Місце блокування — функція бота, а не time.sleep усередині неї
+    assert "test_loop_watchdog.py:" in digests[0] and "blocking_export" in digests[0]
+    assert "#77 message від 5" in digests[0]
+    assert any("blocking_export" in labels[0] for labels in LOOP_STALLS._values)
+
+
+def test_healthy_loop_has_no_stalls():
+    async def scenario():
+        watchdog = LoopWatchdog(threshold=0.2, interval=0.01, digest_interval=0, on_digest=None)
+        watchdog.start()
+        for _ in range(20):
+            await asyncio.sleep(0.005)
+        await watchdog.close()
+        return watchdog
+
+    assert asyncio.run(scenario()).stalls == 0
@@ -0,0 +1,97 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+from datetime import datetime
+
+from aiogram.types import Chat, Message, MessageEntity, PhotoSize, Document
+
+from media import (
+    AlbumCollector, extract_media, send_payload, text_payload, album_payload,
+    describe, trim_caption, dump_payload, load_payload
+)
+
+
+def make_message(message_id=1, **kwargs):
+    return Message(message_id=message_id, date=datetime.now(), chat=Chat(id=1, type="private"), **kwargs)
+
+
+def photo(file_id, unique_id, width):
+    return PhotoSize(file_id=file_id, file_unique_id=unique_id, width=width, height=width)
+
+
+class DummyBot:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        async def method(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return method
+
+
+def test_extract_media_takes_largest_photo():
+    message = make_message(
+        photo=[photo("small", "u1", 90), photo("big", "u2", 1280)],
+        caption="Турнір!",
+        caption_entities=[MessageEntity(type="bold", offset=0, length=6)],
+    )
+    media = extract_media(message)
+    assert media["kind"] == "photo"
+    assert media["file_id"] == "big"
+    assert media["file_unique_id"] == "u2"
+    assert media["caption_entities"] == [{"type": "bold", "offset": 0, "length": 6}]
+    # Payload переживає збереження в JSONB
+    assert load_payload(dump_payload(media)) == media
+
+
+def test_extract_media_without_media():
+    assert extract_media(make_message(text="hello")) is None
+
+
+def test_send_payload_uses_only_file_id():
+    bot = DummyBot()
+    doc = make_message(document=Document(file_id="doc-id", file_unique_id="d1"), caption="Правила")
+    asyncio.run(send_payload(bot, 42, extract_media(doc)))
+    asyncio.run(send_payload(bot, 42, text_payload("привіт")))
+    items = [extract_media(make_message(i, photo=[photo(f"p{i}", f"u{i}", 100)])) for i in range(2)]
+    asyncio.run(send_payload(bot, 42, album_payload(items)))
+
+    (name, args, kwargs), (name2, args2, _), (name3, args3, _) = bot.calls
+    assert name == "send_document" and args == (42, "doc-id") and kwargs["caption"] == "Правила"
+    assert name2 == "send_message" and args2 == (42, "привіт")
+    assert name3 == "send_media_group"
+    assert [m.media for m in args3[1]] == ["p0", "p1"]
+
+
+def test_trim_caption_shifts_entities():
+    item = {
+        "kind": "photo", "file_id": "f", "file_unique_id": "u",
+        "caption": "2030-01-01 10:00 Старт о 🕙",
+        "caption_entities": [
+            {"type": "bold", "offset": 0, "length": 10},
+            {"type": "italic", "offset": 17, "length": 5},
+        ],
+    }
+    trimmed = trim_caption(item, 17)
+    assert trimmed["caption"] == "Старт о 🕙"
+    assert trimmed["caption_entities"] == [{"type": "italic", "offset": 0, "length": 5}]
+    assert describe(trimmed) == "[photo] Старт о 🕙"
+
+
+def test_album_collector_orders_and_groups():
+    async def scenario():
+        collector = AlbumCollector(delay=0.01)
+        done = []
+        # Повідомлення альбому можуть прийти не по порядку
+        for message_id in (3, 1, 2):
+            collector.add("g1", message_id, {"n": message_id}, done.append)
+        assert collector.collecting("g1")
+        await asyncio.sleep(0.05)
+        assert done == [[{"n": 1}, {"n": 2}, {"n": 3}]]
+        assert not collector.collecting("g1")
+
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import redis.asyncio.client
+
+from metrics import (
+    Registry, Counter, Gauge, Histogram, MetricsMiddleware, BotApiMetrics, InstrumentedRedis, REDIS_LATENCY,
+)
+from state_storage import RedisStateStorage, NAMESPACES
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    calls = Counter("calls_total", "Виклики", ("method",), registry=registry)
+    pool = Gauge("pool", "Пул", ("state",), registry=registry)
+    latency = Histogram("latency_seconds", "Час", ("handler",), buckets=(0.1, 1.0), registry=registry)
+
+    calls.inc("sendMessage")
+    calls.inc("sendMessage")
+    calls.inc('we"ird')
+    pool.set_function(lambda: {("idle",): 3, ("in_use",): 7})
+    latency.observe(0.05, "welcome_user")
+    latency.observe(0.5, "welcome_user")
+    latency.observe(5, "welcome_user")
+
+    text = registry.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{method="sendMessage"} 2' in text
+    assert 'calls_total{method="we\\"ird"} 1' in text
+    assert 'pool{state="in_use"} 7' in text
+    # Кошики гістограми кумулятивні, останній — +Inf
+    assert 'latency_seconds_bucket{handler="welcome_user",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{handler="welcome_user",le="1"} 2' in text
+    assert 'latency_seconds_bucket{handler="welcome_user",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{handler="welcome_user"} 3' in text
+    assert 'latency_seconds_sum{handler="welcome_user"} 5.55' in text
+    assert text.endswith("\n")
+
+
+def test_middleware_records_handler_and_errors():
+    registry = Registry()
+    latency = Histogram("h", "h", ("handler",), registry=registry)
+    errors = Counter("e", "e", ("handler", "error"), registry=registry)
+    middleware = MetricsMiddleware(latency, errors)
+
+    async def check_subscription(event, data):
+        raise ValueError("boom")
+
+    data = {"handler": SimpleNamespace(callback=check_subscription)}
+    with pytest.raises(ValueError):
+        asyncio.run(middleware(check_subscription, None, data))
+    assert latency.count("check_subscription") == 1
+    assert errors.value("check_subscription", "ValueError") == 1
+
+
+def test_bot_api_metrics_by_method():
+    registry = Registry()
+    latency = Histogram("a", "a", ("method",), registry=registry)
+    errors = Counter("b", "b", ("method", "error"), registry=registry)
+    middleware = BotApiMetrics(latency, errors)
+
+    class TelegramForbiddenError(Exception):
+        pass
+
+    async def ok(bot, method):
+        return "ok"
+
+    async def forbidden(bot, method):
+        raise TelegramForbiddenError()
+
+    method = SimpleNamespace(__api_method__="sendMessage")
+    assert asyncio.run(middleware(ok, None, method)) == "ok"
+    with pytest.raises(TelegramForbiddenError):
+        asyncio.run(middleware(forbidden, None, method))
+    assert latency.count("sendMessage") == 2
+    assert errors.value("sendMessage", "TelegramForbiddenError") == 1
+
+
+def test_pipelined_state_load_is_timed(monkeypatch):
+    # Сеть не нужна: подменяем отправку pipeline у базового класса redis-py
+    sent = []
+
+    async def execute(pipe, raise_on_error=True):
+        sent.append([args[0] for args, _ in pipe.command_stack])
+        return [[None] * len(NAMESPACES)]
+
+    monkeypatch.setattr(redis.asyncio.client.Pipeline, "execute", execute)
+    client = InstrumentedRedis()
+    storage = RedisStateStorage(client)
+    before = REDIS_LATENCY.count("PIPELINE")
+
+    session = asyncio.run(storage.load(42))
+
+    assert session.user_id == 42
+    assert sent == [["MGET"]]
+    assert REDIS_LATENCY.count("PIPELINE") == before + 1
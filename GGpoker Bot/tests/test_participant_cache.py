@@ -0,0 +1,66 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+import pytest
+
+from participant_cache import ParticipantCache
+
+
+class DummyDb:
+    def __init__(self, participants=()):
+        self.participants = set(participants)
+        self.queries = 0
+        self.delay = 0
+
+    async def load(self, user_id):
+        self.queries += 1
+        await asyncio.sleep(self.delay)
+        return user_id in self.participants
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("with_redis", [False, True])
+async def test_repeated_status_checks_hit_cache(with_redis, redis):
+    redis = redis if with_redis else None
+    db = DummyDb({1})
+    cache = ParticipantCache(db.load, redis_client=redis, positive_ttl=60, negative_ttl=5)
+    for _ in range(5):
+        assert await cache.get(1) is True
+        assert await cache.get(2) is False
+    assert db.queries == 2
+    assert cache.stats()["hits"] == 8
+    assert cache.stats()["misses"] == 2
+    if redis is not None:
+        assert redis.ttls == {"part:1": 60, "part:2": 5}
+
+
+@pytest.mark.asyncio
+async def test_registration_updates_cached_negative_answer():
+    db = DummyDb()
+    cache = ParticipantCache(db.load)
+    assert await cache.get(1) is False
+    db.participants.add(1)
+    await cache.set(1, True)
+    assert await cache.get(1) is True
+    await cache.invalidate(1)
+    db.participants.discard(1)
+    assert await cache.get(1) is False
+    assert db.queries == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_db_answer_does_not_override_registration():
+    db = DummyDb()
+    db.delay = 0.05
+    cache = ParticipantCache(db.load)
+    pending = asyncio.create_task(cache.get(1))
+    await asyncio.sleep(0.01)
+    # регистрация зафиксирована, пока ответ из БД ещё в пути
+    await cache.set(1, True)
+    assert await pending is False
+    assert await cache.get(1) is True
+    assert db.queries == 1
@@ -0,0 +1,91 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+import time
+
+import pytest
+
+from blocking_pool import BlockingPool
+from profiler import Profiler
+
+
+def busy_handler(seconds):
+    # Імітація важкої обробки оновлення в циклі подій
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(1000))
+
+
+async def fake_broadcast(stop):
+    while not stop.is_set():
+        busy_handler(0.01)
+        await asyncio.sleep(0)
+
+
+def test_sampling_collects_collapsed_stacks_and_stops_by_itself():
+    profiler = Profiler(max_duration=0.3, sample_interval=0.002)
+
+    async def main():
+        stop = asyncio.Event()
+        task = asyncio.create_task(fake_broadcast(stop))
+        started = time.monotonic()
+        # Запитано 60 с, але сесія обрізається до max_duration
+        result = await profiler.run("sample", 60)
+        elapsed = time.monotonic() - started
+        stop.set()
+        await task
+        return result, elapsed
+
+    (filename, data, summary), elapsed = asyncio.run(main())
+    assert elapsed < 2
+    assert filename.startswith("profile_sample_") and filename.endswith(".collapsed.txt")
+    assert not profiler.active
+    lines = data.decode().splitlines()
+    # Кожен рядок — «кадр;кадр;... кількість», корінь — ім'я потоку
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+    busy = [line for line in lines if "fake_broadcast" in line and "busy_handler" in line]
+    assert busy
+    assert busy[0].startswith("MainThread;")
+    assert not any("profiler-sampler" in line for line in lines)
+    assert "вибірок" in summary
+
+
+def test_cprofile_covers_background_tasks_and_can_be_stopped_early():
+    pool = BlockingPool(1, 5)
+    profiler = Profiler(max_duration=30, executor=pool)
+
+    async def main():
+        stop = asyncio.Event()
+        task = asyncio.create_task(fake_broadcast(stop))
+        session = asyncio.create_task(profiler.run("cprofile", 30))
+        await asyncio.sleep(0.2)
+        assert profiler.active
+        # Друга сесія одночасно не запускається
+        with pytest.raises(RuntimeError):
+            await profiler.run("sample", 1)
+        assert profiler.stop()
+        result = await asyncio.wait_for(session, 5)
+        stop.set()
+        await task
+        return result
+
+    try:
+        filename, data, summary = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    text = data.decode()
+    assert filename.endswith(".pstats.txt")
+    assert "busy_handler" in text and "fake_broadcast" in text
+    assert "cumulative" in text
+    assert not profiler.stop()
+
+
+def test_unknown_kind_is_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(Profiler().run("perf", 1))
@@ -0,0 +1,56 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import pytest
+from aiogram.types import CallbackQuery
+
+from rate_limit import RateLimiter, RateLimitMiddleware
+
+
+@pytest.mark.asyncio
+async def test_single_atomic_call_per_event(redis):
+    limiter = RateLimiter(redis)
+    assert await limiter.hit("message:1", 2) is True
+    assert await limiter.hit("message:1", 2) is False
+    assert redis.round_trips == 2
+    assert redis.ttls["rl:message:1"] == 2000
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_bounded_local_lru(redis):
+    redis.broken = True
+    limiter = RateLimiter(redis, local_size=2)
+    assert await limiter.hit("message:1", 60) is True
+    assert await limiter.hit("message:1", 60) is False
+    await limiter.hit("message:2", 60)
+    await limiter.hit("message:3", 60)
+    # самая старая запись вытеснена
+    assert len(limiter.local) == 2
+    assert await limiter.hit("message:1", 60) is True
+
+
+@pytest.mark.asyncio
+async def test_middleware_limits_per_class():
+    middleware = RateLimitMiddleware(RateLimiter(), {"message": 60, "callback": 0, "admin": 0}, admin_ids=[100])
+    handled, answers = [], []
+
+    async def handler(event, data):
+        handled.append(data["event_from_user"].id)
+
+    class Msg:
+        async def answer(self, text, **kw):
+            answers.append(text)
+
+    user = type("U", (), {"id": 1})()
+    admin = type("U", (), {"id": 100})()
+    for _ in range(2):
+        await middleware(handler, Msg(), {"event_from_user": user})
+        await middleware(handler, Msg(), {"event_from_user": admin})
+        # callback-и с нулевым лимитом не ограничиваются
+        cb = CallbackQuery.model_construct(id="1", from_user=user, chat_instance="c")
+        await middleware(handler, cb, {"event_from_user": user})
+    assert handled == [1, 100, 1, 100, 1]
+    assert len(answers) == 1
@@ -0,0 +1,141 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+
+import pytest
+
+from rate_limit import RateLimiter, RateLimitMiddleware
+from state_storage import MemoryStateStorage, RedisStateStorage, StateMiddleware
+
+
+class Msg:
+    def __init__(self, answers):
+        self.answers = answers
+
+    async def answer(self, text, **kw):
+        self.answers.append(text)
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_defers_writes_to_next_read(redis):
+    storage = RedisStateStorage(redis, ttl=60, flush_delay=60)
+    middleware = StateMiddleware(storage)
+    user = type("U", (), {"id": 5})()
+
+    async def set_state(event, data):
+        data["session"].user_state = {"step": "awaiting_email", "nickname": "n"}
+
+    async def read_only(event, data):
+        return data["session"].user_state
+
+    await middleware(set_state, None, {"event_from_user": user})
+    # только чтение: запись отложена
+    assert redis.round_trips == 1
+    assert "fsm:user:5" not in redis.data
+
+    state = await middleware(read_only, None, {"event_from_user": user})
+    # запись уехала в том же pipeline, что и следующее чтение
+    assert redis.round_trips == 2
+    assert redis.ttls["fsm:user:5"] == 60
+    assert state == {"step": "awaiting_email", "nickname": "n"}
+
+    await middleware(set_state, None, {"event_from_user": type("U", (), {"id": 6})()})
+    await storage.close()
+    assert redis.round_trips == 4
+    assert "fsm:user:6" in redis.data
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_and_state_share_one_round_trip(redis):
+    storage = RedisStateStorage(redis, ttl=60, flush_delay=60)
+    state = StateMiddleware(storage)
+    limiter = RateLimitMiddleware(RateLimiter(redis), {"message": 60}, admin_ids=[], state=state)
+    user = type("U", (), {"id": 7})()
+    answers = []
+
+    async def set_state(event, data):
+        data["session"].user_state = "awaiting_nickname"
+
+    async def handler(event, data):
+        return await state(set_state, event, data)
+
+    await limiter(handler, Msg(answers), {"event_from_user": user})
+    assert redis.round_trips == 1
+    assert redis.ttls["rl:message:7"] == 60000
+    # второе сообщение ограничено, но отложенная запись стану всё равно уехала
+    await limiter(handler, Msg(answers), {"event_from_user": user})
+    assert redis.round_trips == 2
+    assert answers == ["⏳ Повільніше, будь ласка!"]
+    assert redis.data["fsm:user:7"] == b'"awaiting_nickname"'
+
+
+@pytest.mark.asyncio
+async def test_failed_pipeline_keeps_pending_writes(redis):
+    storage = RedisStateStorage(redis, ttl=60, flush_delay=60)
+    session = await storage.load(1)
+    session.user_state = "awaiting_nickname"
+    await storage.save(session)
+    redis.broken = True
+    with pytest.raises(ConnectionError):
+        await storage.load(2)
+    redis.broken = False
+    # незаписанное видно при чтении и дописывается следующим pipeline
+    assert (await storage.load(1)).user_state == "awaiting_nickname"
+    assert redis.data["fsm:user:1"] == b'"awaiting_nickname"'
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_expires_abandoned_state():
+    storage = MemoryStateStorage(ttl=0)
+    session = await storage.load(1)
+    session.admin_state = "awaiting_broadcast"
+    await storage.save(session)
+    assert (await storage.load(1)).admin_state is None
+    assert len(storage) == 0
+
+    storage.ttl = 60
+    session.admin_state = None
+    session.admin_state = "awaiting_schedule"
+    await storage.save(session)
+    assert (await storage.load(1)).admin_state == "awaiting_schedule"
+
+
+@pytest.mark.asyncio
+async def test_unpiggybacked_writes_reach_redis_within_flush_delay(redis):
+    # Окно потери при аварийном падении — flush_delay: дальше изменения уже в Redis
+    storage = RedisStateStorage(redis, ttl=60, flush_delay=0.05)
+    session = await storage.load(1)
+    session.user_state = "awaiting_nickname"
+    await storage.save(session)
+    assert "fsm:user:1" not in redis.data
+    await asyncio.sleep(0.15)
+    assert redis.data["fsm:user:1"] == b'"awaiting_nickname"'
+    assert redis.round_trips == 2
+
+    # Redis временно недоступен — фоновая запись повторяется
+    session.user_state = None
+    await storage.save(session)
+    redis.broken = True
+    await asyncio.sleep(0.08)
+    redis.broken = False
+    await asyncio.sleep(0.2)
+    assert "fsm:user:1" not in redis.data
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_state_middleware_survives_redis_outage_without_rate_limit(redis):
+    redis.broken = True
+    middleware = StateMiddleware(RedisStateStorage(redis, ttl=60, flush_delay=60))
+    user = type("U", (), {"id": 9})()
+
+    async def handler(event, data):
+        return data["session"].user_state
+
+    # Без антифлуда (админ с лимитом 0) загрузка стану идёт напрямую
+    assert await middleware(handler, None, {"event_from_user": user}) is None
@@ -0,0 +1,49 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+import pytest
+
+from subscription_cache import SubscriptionCache
+
+
+class DummyBot:
+    def __init__(self, status="member"):
+        self.status = status
+        self.calls = 0
+
+    async def get_chat_member(self, channel, user_id):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return type("Member", (), {"status": self.status})()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checks_are_coalesced_and_cached(redis):
+    bot = DummyBot()
+    cache = SubscriptionCache(bot, "@channel", redis)
+    results = await asyncio.gather(*(cache.is_subscribed(1) for _ in range(5)))
+    assert results == [True] * 5
+    assert bot.calls == 1
+    # повторная проверка берётся из кеша
+    assert await cache.is_subscribed(1) is True
+    assert bot.calls == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "coalesced": 4}
+
+
+@pytest.mark.asyncio
+async def test_negative_ttl_and_invalidate(redis):
+    bot = DummyBot(status="left")
+    cache = SubscriptionCache(bot, "@channel", redis, positive_ttl=600, negative_ttl=20)
+    assert await cache.is_subscribed(7) is False
+    assert redis.ttls["sub:@channel:7"] == 20
+
+    bot.status = "member"
+    assert await cache.is_subscribed(7) is False
+    assert await cache.invalidate(7) == 1
+    assert await cache.is_subscribed(7) is True
+    assert redis.ttls["sub:@channel:7"] == 600
+    assert await cache.invalidate() == 1
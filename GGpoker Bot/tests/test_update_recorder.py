@@ -0,0 +1,63 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+from datetime import datetime
+
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from update_recorder import Anonymiser, UpdateRecorder, read_recording, CALLBACK, MESSAGE
+
+
+def message_update(update_id, user_id, text):
+    user = User(id=user_id, is_bot=False, first_name="Іван", username="ivan")
+    message = Message(message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+                      from_user=user, text=text)
+    return Update(update_id=update_id, message=message)
+
+
+def test_anonymiser_keeps_buttons_and_duplicates():
+    anon = Anonymiser(keep_texts={"📜 Умови"})
+    assert anon.text("📜 Умови") == "📜 Умови"
+    assert anon.text("/ban 123456") == "/ban"
+    # Однаковий нік з різним регістром — однакова заміна, але сам нік не зберігається
+    assert anon.text("PokerKing") == anon.text(" pokerking ")
+    assert "poker" not in anon.text("PokerKing").lower()
+    email = anon.text("Ivan@Mail.com")
+    assert email.endswith("@example.com") and email == anon.text("ivan@mail.com")
+    # Невалідний email лишається невалідним
+    assert "@" not in anon.text("ivan-at-mail")
+    assert anon.user_id(42) == anon.user_id(42) != 42
+    # Інший ключ — інші заміни: записи різних сесій не зіставити
+    assert Anonymiser().user_id(42) != anon.user_id(42)
+
+
+def test_recorder_writes_and_merges_files(tmp_path):
+    anon = Anonymiser()
+
+    async def handler(event, data):
+        return "handled"
+
+    async def scenario():
+        paths = []
+        for shard in range(2):
+            path = str(tmp_path / f"updates.rec.gz.{shard}")
+            recorder = UpdateRecorder(path, anon, flush_every=2)
+            for i in range(3):
+                assert await recorder(handler, message_update(shard * 10 + i, 1000 + shard, "my nick"), {}) == "handled"
+            callback = CallbackQuery(id="1", from_user=User(id=7, is_bot=False, first_name="x"),
+                                     chat_instance="1", data="participate")
+            await recorder(handler, Update(update_id=99, callback_query=callback), {})
+            await recorder.close()
+            paths.append(path)
+        return paths
+
+    events = read_recording(asyncio.run(scenario()))
+    assert len(events) == 8
+    assert [e[0] for e in events] == sorted(e[0] for e in events)
+    assert {e[2] for e in events} == {MESSAGE, CALLBACK}
+    assert {e[1] for e in events} == {anon.user_id(1000), anon.user_id(1001), anon.user_id(7)}
+    assert all(e[3] != "my nick" for e in events)
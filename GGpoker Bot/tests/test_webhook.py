@@ -0,0 +1,103 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncio
+import json
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import UserOrderedDispatcher, WorkerSupervisor, create_gateway_app, shard_for
+
+
+@pytest.mark.asyncio
+async def test_updates_of_one_user_are_processed_in_order():
+    log = []
+
+    async def handle(payload):
+        user_id, n = payload
+        # первое сообщение пользователя 1 «долгое» — второе всё равно должно ждать его
+        await asyncio.sleep(0.05 if (user_id, n) == (1, 0) else 0)
+        log.append(payload)
+
+    dispatcher = UserOrderedDispatcher(handle, max_concurrency=10)
+    for payload in [(1, 0), (2, 0), (1, 1), (2, 1), (1, 2)]:
+        await dispatcher.submit(payload[0], payload)
+    await dispatcher.drain()
+    assert [p for p in log if p[0] == 1] == [(1, 0), (1, 1), (1, 2)]
+    # пользователь 2 не ждёт пользователя 1
+    assert log.index((2, 1)) < log.index((1, 1))
+
+
+@pytest.mark.asyncio
+async def test_gateway_shards_updates_by_user(redis):
+    app = create_gateway_app(redis, shards=4, path="/webhook", secret="s3cret")
+    update = {"update_id": 10, "message": {"message_id": 1, "from": {"id": 7}, "chat": {"id": 7}, "text": "hi"}}
+    async with TestClient(TestServer(app)) as client:
+        denied = await client.post("/webhook", json=update)
+        assert denied.status == 403
+        ok = await client.post("/webhook", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+        assert ok.status == 200
+    assert shard_for(update, 4) == 3
+    assert [json.loads(v) for v in redis.lists["updates:3"]] == [update]
+
+
+class FakeProcess:
+    def __init__(self, shard):
+        self.shard = shard
+        self.alive = False
+        self.exitcode = None
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def crash(self, code=1):
+        self.alive, self.exitcode = False, code
+
+    def terminate(self):
+        self.alive = False
+
+    def join(self):
+        pass
+
+
+def test_supervisor_restarts_dead_workers_with_backoff():
+    spawned, exits = [], []
+
+    def spawn(shard):
+        spawned.append(FakeProcess(shard))
+        return spawned[-1]
+
+    supervisor = WorkerSupervisor(spawn, 2, stable_uptime=30, max_backoff=4,
+                                  on_exit=lambda shard, code: exits.append((shard, code)))
+    supervisor.start(now=0)
+    assert [p.shard for p in spawned] == [0, 1]
+
+    # Воркер пропрацював довго — перезапуск одразу
+    supervisor.processes[1].crash()
+    supervisor.check(now=100)
+    assert [p.shard for p in spawned] == [0, 1, 1]
+    assert exits == [(1, 1)]
+
+    # Падає одразу після старту — паузи ростуть: 1, 2, 4, 4 с
+    delays = []
+    now = 100
+    for _ in range(4):
+        supervisor.processes[1].crash()
+        supervisor.check(now)
+        crashed_at, count = now, len(spawned)
+        while len(spawned) == count:
+            now += 0.5
+            supervisor.check(now)
+        delays.append(now - crashed_at)
+    assert delays == [1, 2, 4, 4]
+    assert supervisor.restarts == 5
+    assert supervisor.processes[0] is spawned[0]
+
+    supervisor.stop()
+    assert not any(p.is_alive() for p in supervisor.processes.values())
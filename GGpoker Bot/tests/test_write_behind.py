@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import asyncpg
+import pytest
+
+from write_behind import DEFERRED, ParticipantWriter, WriteBehindWriter
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def __aenter__(self):
+        self.conn.staged = []
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.db.committed.extend(self.conn.staged)
+        return False
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+        self.staged = []
+        self.staging = []
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.db.copies.append((table, len(records)))
+        if self.db.fail_next:
+            self.db.fail_next -= 1
+            raise ConnectionError("db down")
+        if table == "participants_staging":
+            self.staging = list(records)
+        else:
+            self.staged.extend(records)
+
+    async def execute(self, sql):
+        pass
+
+    async def fetch(self, sql):
+        # ON CONFLICT DO NOTHING по никнейму
+        inserted = []
+        for r in self.staging:
+            if r[4] not in self.db.nicknames:
+                self.db.nicknames.add(r[4])
+                self.staged.append(r)
+                inserted.append({"telegram_id": r[0], "nickname": r[4], "email": r[5]})
+        return inserted
+
+
+class FakePool:
+    def __init__(self):
+        self.copies = []
+        self.committed = []
+        self.nicknames = set()
+        self.fail_next = 0
+
+    def acquire(self):
+        db = self
+
+        class Ctx:
+            async def __aenter__(self):
+                return FakeConn(db)
+
+            async def __aexit__(self, exc_type, exc, tb):
+                return False
+        return Ctx()
+
+
+@pytest.mark.asyncio
+async def test_rows_are_batched_into_one_copy():
+    pool = FakePool()
+    writer = WriteBehindWriter(pool, "broadcast_logs", ["a"], max_rows=100, max_delay=0.05)
+    writer.start()
+    await asyncio.gather(*(writer.write((i,)) for i in range(10)))
+    assert pool.copies == [("broadcast_logs", 10)]
+    assert pool.committed == [(i,) for i in range(10)]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting_for_delay():
+    pool = FakePool()
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=5, max_delay=60)
+    writer.start()
+    await asyncio.wait_for(asyncio.gather(*(writer.write((i,)) for i in range(5))), 1)
+    assert pool.copies == [("t", 5)]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_without_losing_rows():
+    pool = FakePool()
+    pool.fail_next = 2
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=100, max_delay=0.01, retry_delay=0.01)
+    writer.start()
+    await asyncio.wait_for(asyncio.gather(*(writer.write((i,)) for i in range(3))), 1)
+    assert pool.committed == [(0,), (1,), (2,)]
+    assert writer.stats()["failures"] == 2
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_unflushed_rows_are_spilled_and_replayed(tmp_path):
+    spill = tmp_path / "pending.bin"
+    pool = FakePool()
+    pool.fail_next = 100
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=100, max_delay=60, spill_path=str(spill))
+    writer.start()
+    futures = [writer.submit((i,)) for i in range(3)]
+    await writer.close()
+    assert spill.exists()
+    # Рядки не відхилені, а відкладені: їх запишемо при наступному запуску
+    assert all(f.result() is DEFERRED for f in futures)
+
+    pool.fail_next = 0
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=100, max_delay=0.01, spill_path=str(spill))
+    writer.start()
+    assert not spill.exists()
+    await writer.close()
+    assert pool.committed == [(0,), (1,), (2,)]
+
+
+@pytest.mark.asyncio
+async def test_participant_writer_reports_conflicts_per_row():
+    pool = FakePool()
+    pool.nicknames.add("taken")
+    writer = ParticipantWriter(pool, max_rows=100, max_delay=0.01)
+    writer.start()
+    results = await asyncio.gather(
+        writer.write((1, "@a", "A", None, "fresh", "a@x.com")),
+        writer.write((2, "@b", "B", None, "taken", "b@x.com")),
+        writer.write((3, "@c", "C", None, "fresh", "c@x.com")),
+    )
+    assert results == [True, False, False]
+    assert pool.copies == [("participants_staging", 3)]
+    await writer.close()
+
+
+class RejectingPool(FakePool):
+    # Рядки з від'ємним значенням порушують CHECK-обмеження таблиці;
+    # down_at — номери COPY (з 1), на яких БД недоступна
+    def __init__(self, down_at=()):
+        super().__init__()
+        self.down_at = set(down_at)
+
+    def acquire(self):
+        db = self
+
+        class Conn(FakeConn):
+            async def copy_records_to_table(self, table, records, columns):
+                db.copies.append((table, len(records)))
+                if len(db.copies) in db.down_at:
+                    raise ConnectionError("db down")
+                if any(r[0] < 0 for r in records):
+                    raise asyncpg.CheckViolationError("new row violates check constraint")
+                self.staged.extend(records)
+
+        class Ctx:
+            async def __aenter__(self):
+                return Conn(db)
+
+            async def __aexit__(self, exc_type, exc, tb):
+                return False
+        return Ctx()
+
+
+@pytest.mark.asyncio
+async def test_rejected_rows_go_to_dead_letter_and_do_not_block_queue(tmp_path):
+    dead = tmp_path / "rejected.jsonl"
+    pool = RejectingPool()
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=100, max_delay=0.01, retry_delay=0.01,
+                               dead_letter_path=str(dead))
+    writer.start()
+    values = [0, 1, -2, 3, 4, -5, 6]
+    futures = [writer.submit((v,)) for v in values]
+    done = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+    assert [isinstance(r, asyncpg.CheckViolationError) for r in done] == [v < 0 for v in values]
+    assert sorted(pool.committed) == [(v,) for v in values if v >= 0]
+    lines = [json.loads(line) for line in dead.read_text().splitlines()]
+    assert [line["record"] for line in lines] == [[-2], [-5]]
+    assert writer.stats()["rejected"] == 2
+    # Наступні записи йдуть як зазвичай
+    await asyncio.wait_for(writer.write((7,)), 1)
+    assert pool.committed[-1] == (7,)
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_outage_during_isolation_requeues_remaining_rows():
+    # Пачку відхилено, а на другій половині (COPY №3) БД «падає»
+    pool = RejectingPool(down_at={3})
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=100, max_delay=0.01, retry_delay=0.01)
+    writer.start()
+    futures = [writer.submit((v,)) for v in (1, 2, -3, 4)]
+    done = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+    assert done[:2] == [None, None] and done[3] is None
+    assert isinstance(done[2], asyncpg.CheckViolationError)
+    assert sorted(pool.committed) == [(1,), (2,), (4,)]
+    assert writer.stats()["failures"] == 1
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_client_connection_errors_are_retried_not_isolated(tmp_path):
+    dead = tmp_path / "rejected.jsonl"
+    pool = FakePool()
+    errors = [
+        asyncpg.InterfaceError("cannot call PreparedStatement.fetchval(): the underlying connection "
+                               "has been released back to the pool"),
+        asyncpg.exceptions.ConnectionFailureError("connection failure"),
+    ]
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=100, max_delay=0.01, retry_delay=0.01,
+                               dead_letter_path=str(dead))
+
+    async def commit(batch):
+        if errors:
+            raise errors.pop(0)
+        await WriteBehindWriter._commit(writer, batch)
+
+    writer._commit = commit
+    writer.start()
+    await asyncio.wait_for(asyncio.gather(*(writer.write((i,)) for i in range(3))), 1)
+    assert pool.committed == [(0,), (1,), (2,)]
+    assert writer.stats()["failures"] == 2 and writer.stats()["rejected"] == 0
+    assert not dead.exists()
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_client_data_error_is_isolated(tmp_path):
+    # Значення не кодується в тип колонки: InterfaceError, але повтор не допоможе
+    pool = FakePool()
+    writer = WriteBehindWriter(pool, "t", ["a"], max_rows=100, max_delay=0.01, retry_delay=0.01)
+
+    async def commit(batch):
+        if any(not isinstance(record[0], int) for record, _ in batch):
+            raise asyncpg.exceptions._base.DataError("invalid input for query argument $1")
+        await WriteBehindWriter._commit(writer, batch)
+
+    writer._commit = commit
+    writer.start()
+    done = await asyncio.wait_for(asyncio.gather(*(writer.submit((v,)) for v in (1, "x", 3)), return_exceptions=True), 1)
+    assert done[0] is None and done[2] is None
+    assert isinstance(done[1], asyncpg.InterfaceError)
+    assert writer.stats()["rejected"] == 1
+    await writer.close()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+
+# Спільна основа кешів «так/ні» поверх повільного джерела (Bot API, PostgreSQL),
+# read-through. Позитивна відповідь живе positive_ttl, негативна — negative_ttl.
+# Зберігаються в Redis, спільному для процесів, а без Redis — у локальному LRU
+# на local_size записів (0 — без кешу). Одночасні промахи за одним ключем
+# зливаються в один виклик loader (single-flight). Якщо запис змінився
+# (set/invalidate), поки відповідь loader була в дорозі, її не кешуємо.
+class TTLCache:
+    def __init__(self, loader, prefix: str, redis_client=None, positive_ttl: int = 600,
+                 negative_ttl: int = 20, local_size: int = 100_000, label: str = "кеш"):
+        self.loader = loader
+        self.prefix = prefix
+        self.redis = redis_client
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.local_size = local_size
+        self.label = label
+        self._local: OrderedDict[int, tuple[bool, float]] = OrderedDict()
+        self._inflight: dict[int, asyncio.Future] = {}
+        self._stale: set[int] = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _key(self, key) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def _get_cached(self, key: int):
+        if self.redis is None:
+            entry = self._local.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0]
+        try:
+            value = await self.redis.get(self._key(key))
+        except Exception as e:
+            logging.warning(f"{self.label.capitalize()} недоступний: {e}")
+            return None
+        if value is None:
+            return None
+        return value in (b"1", "1")
+
+    async def _store(self, key: int, value: bool):
+        ttl = self.positive_ttl if value else self.negative_ttl
+        if self.redis is None:
+            if not self.local_size:
+                return
+            self._local[key] = (value, time.monotonic() + ttl)
+            self._local.move_to_end(key)
+            if len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+            return
+        try:
+            await self.redis.set(self._key(key), "1" if value else "0", ex=ttl)
+        except Exception as e:
+            logging.warning(f"Не вдалося оновити {self.label}: {e}")
+
+    async def get(self, key: int) -> bool:
+        cached = await self._get_cached(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Позначаємо виняток як прочитаний, навіть якщо інших очікувачів не було
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await self.loader(key)
+            if key not in self._stale:
+                await self._store(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            self._stale.discard(key)
+
+    async def set(self, key: int, value: bool):
+        if key in self._inflight:
+            self._stale.add(key)
+        await self._store(key, value)
+
+    # Скидання одного запису (помилки Redis лише логуються) або всіх (key=None)
+    async def invalidate(self, key: int | None = None) -> int:
+        if key is None:
+            return await self._invalidate_all()
+        if key in self._inflight:
+            self._stale.add(key)
+        removed = int(self._local.pop(key, None) is not None)
+        if self.redis is not None:
+            try:
+                removed = await self.redis.delete(self._key(key))
+            except Exception as e:
+                logging.warning(f"Не вдалося скинути {self.label} для {key}: {e}")
+        return removed
+
+    async def _invalidate_all(self) -> int:
+        self._stale.update(self._inflight)
+        removed = len(self._local)
+        self._local.clear()
+        if self.redis is None:
+            return removed
+        batch = []
+        async for key in self.redis.scan_iter(match=self._key("*"), count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                removed += await self.redis.delete(*batch)
+                batch = []
+        if batch:
+            removed += await self.redis.delete(*batch)
+        return removed
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
@@ -0,0 +1,113 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+
+from aiogram import BaseMiddleware
+
+# Запис потоку оновлень для навантажувальних прогонів (benchmarks/replay.py).
+# Кожне оновлення — рядок JSON [час_мс, user_id, тип, значення] у gzip-файлі;
+# пачки дописуються окремими gzip-членами, тож файл читається навіть після збою.
+# Дані знеособлюються ще до запису: ID і вільний текст замінюються ключованим
+# хешем із випадковим ключем, який ніде не зберігається.
+MESSAGE = "m"
+CALLBACK = "c"
+EMAIL_RE = re.compile(r'^[\w.-]+@[\w.-]+\.\w{2,}$')
+
+
+class Anonymiser:
+    def __init__(self, keep_texts=(), salt: bytes | None = None):
+        self.keep_texts = set(keep_texts)
+        self.salt = salt or secrets.token_bytes(16)
+
+    def _hash(self, value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), key=self.salt, digest_size=5).digest(), "big")
+
+    def user_id(self, telegram_id: int) -> int:
+        return self._hash(f"id:{telegram_id}") + 1
+
+    # Кнопки лишаються як є, у командах — лише сама команда без аргументів.
+    # Однакові (з точністю до регістру) нікнейми та email дають однакову заміну,
+    # тож дублікати в записі лишаються дублікатами, а невалідний email — невалідним.
+    def text(self, text: str | None) -> str | None:
+        if text is None or text in self.keep_texts:
+            return text
+        if text.startswith("/"):
+            return text.split(maxsplit=1)[0]
+        normalized = text.strip().lower()
+        if EMAIL_RE.match(normalized):
+            return f"user{self._hash('email:' + normalized)}@example.com"
+        return f"nick{self._hash('text:' + normalized)}"
+
+    def record(self, update, timestamp_ms: int) -> list | None:
+        if update.message is not None and update.message.from_user is not None:
+            message = update.message
+            return [timestamp_ms, self.user_id(message.from_user.id), MESSAGE, self.text(message.text)]
+        if update.callback_query is not None:
+            callback = update.callback_query
+            return [timestamp_ms, self.user_id(callback.from_user.id), CALLBACK, callback.data]
+        return None
+
+
+# Зовнішній middleware на dp.update: запис не затримує обробку — рядки
+# накопичуються в пам'яті й дописуються у файл пачками у пулі блокуючих задач
+class UpdateRecorder(BaseMiddleware):
+    def __init__(self, path: str, anonymiser: Anonymiser, flush_every: int = 1000, executor=None):
+        self.path = path
+        self.anonymiser = anonymiser
+        self.flush_every = flush_every
+        self.executor = executor
+        self.recorded = 0
+        self._buffer: list[str] = []
+        self._lock = threading.Lock()
+        self._flushes: set[asyncio.Task] = set()
+
+    async def __call__(self, handler, event, data):
+        # Настінний час, а не монотонний: записи різних воркерів зводяться в один потік
+        record = self.anonymiser.record(event, int(time.time() * 1000))
+        if record is not None:
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            self.recorded += 1
+            if len(self._buffer) >= self.flush_every:
+                task = asyncio.create_task(self.flush())
+                self._flushes.add(task)
+                task.add_done_callback(self._flushes.discard)
+        return await handler(event, data)
+
+    async def flush(self):
+        lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        run = self.executor.run if self.executor is not None else asyncio.to_thread
+        try:
+            await run(self._write, lines)
+        except Exception as e:
+            # Запис — допоміжний: пачку втрачаємо, бот працює далі
+            logging.warning(f"Не вдалося дописати {len(lines)} оновлень у {self.path}: {e}")
+
+    def _write(self, lines: list[str]):
+        with self._lock, gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def close(self):
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
+
+
+# Записи з кількох файлів (у режимі webhook кожен воркер пише свій) — за часом
+def read_recording(paths) -> list[list]:
+    events = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    events.append(json.loads(line))
+    events.sort(key=lambda e: e[0])
+    return events
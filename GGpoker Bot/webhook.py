@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+import time
+
+import redis.asyncio as redis
+from aiohttp import web
+
+# Режим webhook: шлюз (aiohttp) приймає оновлення від Telegram і кладе їх у
+# спільну чергу Redis, а N процесів-воркерів забирають і обробляють їх.
+# Черга розбита на шарди за user_id, тож усі оновлення одного користувача
+# потрапляють до одного воркера і обробляються ним строго по черзі.
+QUEUE_PREFIX = "updates"
+
+
+def queue_key(shard: int) -> str:
+    return f"{QUEUE_PREFIX}:{shard}"
+
+
+def processing_key(shard: int) -> str:
+    return f"{QUEUE_PREFIX}:{shard}:processing"
+
+
+def extract_user_id(update: dict) -> int | None:
+    for kind, payload in update.items():
+        if isinstance(payload, dict):
+            user = payload.get("from") or payload.get("user")
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+            chat = payload.get("chat")
+            if isinstance(chat, dict) and "id" in chat:
+                return chat["id"]
+    return None
+
+
+def shard_for(update: dict, shards: int) -> int:
+    user_id = extract_user_id(update)
+    key = user_id if user_id is not None else update.get("update_id", 0)
+    return key % shards
+
+
+# ─── ШЛЮЗ ───────────────────────────────────────────────────────────────────
+
+
+def create_gateway_app(redis_client, shards: int, path: str, secret: str | None) -> web.Application:
+    async def receive(request: web.Request):
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=403)
+        raw = await request.read()
+        try:
+            update = json.loads(raw)
+        except ValueError:
+            return web.Response(status=400)
+        await redis_client.rpush(queue_key(shard_for(update, shards)), raw)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
+
+
+# ─── ВОРКЕР ─────────────────────────────────────────────────────────────────
+
+
+# Обробка з конкурентністю між різними користувачами, але послідовно для одного:
+# кожне нове оновлення користувача чекає завершення його попереднього.
+class UserOrderedDispatcher:
+    def __init__(self, handle, max_concurrency: int = 100):
+        self.handle = handle
+        self._tails: dict[int, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def submit(self, user_id: int, payload):
+        # Якщо всі слоти зайняті — перестаємо забирати нові оновлення з черги
+        await self._slots.acquire()
+        previous = self._tails.get(user_id)
+        task = asyncio.create_task(self._run(previous, payload))
+        self._tails[user_id] = task
+        task.add_done_callback(lambda t: self._done(user_id, t))
+        return task
+
+    async def _run(self, previous, payload):
+        if previous is not None:
+            await asyncio.wait([previous])
+        await self.handle(payload)
+
+    def _done(self, user_id: int, task: asyncio.Task):
+        self._slots.release()
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Помилка обробки оновлення користувача {user_id}: {task.exception()}")
+
+    async def drain(self):
+        tails = list(self._tails.values())
+        if tails:
+            await asyncio.wait(tails)
+
+
+async def consume(redis_client, shard: int, handle, max_concurrency: int, stop: asyncio.Event):
+    source, processing = queue_key(shard), processing_key(shard)
+    # Повертаємо в чергу оновлення, які попередній воркер взяв, але не завершив
+    while await redis_client.lmove(processing, source, "RIGHT", "LEFT"):
+        pass
+
+    async def process(raw):
+        try:
+            await handle(json.loads(raw))
+        finally:
+            await redis_client.lrem(processing, 1, raw)
+
+    dispatcher = UserOrderedDispatcher(process, max_concurrency)
+    while not stop.is_set():
+        raw = await redis_client.blmove(source, processing, 1, "LEFT", "RIGHT")
+        if raw is None:
+            continue
+        update = json.loads(raw)
+        user_id = extract_user_id(update)
+        await dispatcher.submit(user_id if user_id is not None else -update.get("update_id", 0), raw)
+    await dispatcher.drain()
+
+
+def _worker_process(shard: int, redis_url: str, max_concurrency: int):
+    # Кожен воркер — окремий процес зі своїм пулом БД, клієнтом Redis та сесією бота
+    import BotGGpokerMain as app
+    from aiogram.types import Update
+
+    async def run():
+        # Кожен воркер віддає власні метрики на окремому порту й пише власний запис оновлень
+        metrics_port = app.METRICS_PORT + shard if app.METRICS_PORT else 0
+        record_path = f"{app.RECORD_UPDATES}.{shard}" if app.RECORD_UPDATES else ""
+        await app.on_startup(resume_jobs=shard == 0, metrics_port=metrics_port, record_path=record_path,
+                             shard=shard)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        queue_client = redis.from_url(redis_url)
+
+        async def handle(update: dict):
+            await app.dp.feed_update(app.bot, Update.model_validate(update, context={"bot": app.bot}))
+
+        try:
+            await consume(queue_client, shard, handle, max_concurrency, stop)
+        finally:
+            await app.on_shutdown()
+            await queue_client.aclose()
+
+    asyncio.run(run())
+
+
+# Нагляд за воркерами: процес, що впав, запускається знову з тим самим шардом
+# (його незавершені оновлення повертаються в чергу в consume). Якщо воркер
+# падає одразу після старту, пауза перед перезапуском подвоюється до max_backoff.
+class WorkerSupervisor:
+    def __init__(self, spawn, workers: int, stable_uptime: float = 30.0, max_backoff: float = 60.0,
+                 on_exit=None):
+        self.spawn = spawn
+        self.workers = workers
+        self.stable_uptime = stable_uptime
+        self.max_backoff = max_backoff
+        self.on_exit = on_exit
+        self.processes = {}
+        self.restarts = 0
+        self._started = {}
+        self._backoff = {}
+        self._restart_at = {}
+
+    def _launch(self, shard: int, now: float):
+        process = self.spawn(shard)
+        process.start()
+        self.processes[shard] = process
+        self._started[shard] = now
+
+    def start(self, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        for shard in range(self.workers):
+            self._launch(shard, now)
+
+    def check(self, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        for shard, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            if shard not in self._restart_at:
+                if now - self._started[shard] >= self.stable_uptime:
+                    self._backoff[shard] = 0.0
+                delay = self._backoff.get(shard, 0.0)
+                self._backoff[shard] = min(max(delay * 2, 1.0), self.max_backoff)
+                self._restart_at[shard] = now + delay
+                logging.error(f"Воркер {shard} завершився (код {process.exitcode}), перезапуск через {delay:.0f} с")
+                if self.on_exit is not None:
+                    self.on_exit(shard, process.exitcode)
+            if now >= self._restart_at[shard]:
+                del self._restart_at[shard]
+                self.restarts += 1
+                self._launch(shard, now)
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.join()
+
+
+def run_webhook(bot, base_url: str, path: str, host: str, port: int, secret: str | None,
+                workers: int, redis_url: str, max_concurrency: int = 100, admin_ids=()):
+    ctx = multiprocessing.get_context("spawn")
+    alerts = []
+
+    def spawn(shard: int):
+        return ctx.Process(target=_worker_process, args=(shard, redis_url, max_concurrency), name=f"bot-worker-{shard}")
+
+    supervisor = WorkerSupervisor(spawn, workers, on_exit=lambda shard, code: alerts.append((shard, code)))
+    supervisor.start()
+
+    # Адміністраторам — повідомлення про кожне падіння воркера
+    async def watch(app):
+        while True:
+            await asyncio.sleep(1)
+            supervisor.check()
+            while alerts:
+                shard, code = alerts.pop(0)
+                for admin_id in admin_ids:
+                    try:
+                        await bot.send_message(admin_id, f"⚠️ Воркер {shard} завершився (код {code}), перезапускаємо")
+                    except Exception:
+                        pass
+
+    async def on_startup(app):
+        await bot.set_webhook(f"{base_url.rstrip('/')}{path}", secret_token=secret, drop_pending_updates=False)
+        logging.info(f"Webhook встановлено, воркерів: {workers}")
+        app["supervisor"] = asyncio.create_task(watch(app))
+
+    async def on_cleanup(app):
+        app["supervisor"].cancel()
+        await app["redis"].aclose()
+        await bot.session.close()
+
+    queue_client = redis.from_url(redis_url)
+    gateway = create_gateway_app(queue_client, workers, path, secret)
+    gateway["redis"] = queue_client
+    gateway.on_startup.append(on_startup)
+    gateway.on_cleanup.append(on_cleanup)
+    try:
+        web.run_app(gateway, host=host, port=port)
+    finally:
+        supervisor.stop()
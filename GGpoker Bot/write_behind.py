@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+from collections import deque
+from datetime import datetime
+
+import asyncpg
+
+from database import Query
+
+# Відкладений пакетний запис у PostgreSQL. Рядки накопичуються в пам'яті й
+# записуються одним COPY, щойно назбирається max_rows або мине max_delay.
+# Виклик write() завершується лише після коміту пачки, у якій був рядок.
+# Якщо БД недоступна (з'єднання, тайм-аут, перезапуск сервера), пачка
+# повертається на початок черги і повторюється; рядки, які не вдалося
+# записати до зупинки, зберігаються у spill-файл (їхні write() повертають
+# DEFERRED) і дописуються при наступному запуску. Якщо ж БД відхиляє саму
+# пачку (DataError, порушене обмеження), пачка ділиться навпіл, доки не
+# залишаться окремі погані рядки: вони йдуть у dead-letter файл, їхні виклики
+# write() отримують виняток, решта пишеться.
+MAX_RETRY_DELAY = 30.0
+TRANSIENT_ERRORS = (
+    OSError, asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError, asyncpg.exceptions.ConnectionFailureError,
+    asyncpg.TransactionRollbackError, asyncpg.InsufficientResourcesError, asyncpg.OperatorInterventionError,
+    # Клієнтські збої з'єднання: закрите чи повернуте в пул з'єднання, паралельна операція
+    asyncpg.InterfaceError,
+)
+# Результат write() для рядка, збереженого у spill-файл під час зупинки:
+# він не відхилений і буде записаний при наступному запуску
+DEFERRED = object()
+
+
+def is_transient(error: Exception) -> bool:
+    # Клієнтські DataError / ClientConfigurationError — теж InterfaceError (і ValueError),
+    # але це поганий рядок чи налаштування, а не збій з'єднання: повтор не допоможе
+    return isinstance(error, TRANSIENT_ERRORS) and not isinstance(error, ValueError)
+
+
+class WriteBehindWriter:
+    def __init__(self, pool, table: str, columns: list[str], max_rows: int = 500,
+                 max_delay: float = 0.05, retry_delay: float = 1.0, spill_path: str | None = None,
+                 dead_letter_path: str | None = None):
+        self.pool = pool
+        self.table = table
+        self.columns = columns
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self._pending: deque[tuple[tuple, asyncio.Future | None]] = deque()
+        self._has_rows = None
+        self._full = None
+        self._task = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        self._has_rows = asyncio.Event()
+        self._full = asyncio.Event()
+        for record in self._load_spill():
+            self._pending.append((record, None))
+        if self._pending:
+            logging.info(f"{self.table}: дописуємо {len(self._pending)} рядків із попереднього запуску")
+            self._has_rows.set()
+        self._task = asyncio.create_task(self._run(), name=f"write-behind-{self.table}")
+
+    def submit(self, record: tuple) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((record, future))
+        self._has_rows.set()
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+        return future
+
+    async def write(self, record: tuple):
+        return await self.submit(record)
+
+    async def _run(self):
+        delay = self.retry_delay
+        while True:
+            await self._has_rows.wait()
+            if len(self._pending) < self.max_rows:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            if await self._flush_batch():
+                delay = self.retry_delay
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _take_batch(self):
+        batch = [self._pending.popleft() for _ in range(min(self.max_rows, len(self._pending)))]
+        if len(self._pending) < self.max_rows:
+            self._full.clear()
+        if not self._pending:
+            self._has_rows.clear()
+        return batch
+
+    async def _commit(self, batch: list):
+        records = [record for record, _ in batch]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                results = await self._write_batch(conn, records)
+        self.flushes += 1
+        self.rows_written += len(records)
+        for (_, future), result in zip(batch, results):
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    def _requeue(self, batch: list):
+        # Нічого не втрачаємо: рядки повертаються на початок черги в тому ж порядку
+        self._pending.extendleft(reversed(batch))
+        self._has_rows.set()
+
+    async def _flush_batch(self) -> bool:
+        batch = self._take_batch()
+        if not batch:
+            return True
+        settled = set()
+        try:
+            try:
+                await self._commit(batch)
+                return True
+            except Exception as e:
+                if is_transient(e):
+                    self.failures += 1
+                    self._requeue(batch)
+                    logging.error(f"{self.table}: не вдалося записати {len(batch)} рядків, повторимо: {e}")
+                    return False
+                logging.warning(f"{self.table}: БД відхилила пачку з {len(batch)} рядків ({e}), шукаємо погані рядки")
+                left = await self._isolate(batch, e, settled)
+        except asyncio.CancelledError:
+            self._requeue([item for item in batch if id(item) not in settled])
+            raise
+        if left:
+            self.failures += 1
+            self._requeue(left)
+            return False
+        return True
+
+    # Ділення пачки навпіл до окремих рядків, які БД відхиляє. Повертає рядки,
+    # що лишилися незаписаними через тимчасову недоступність БД
+    async def _isolate(self, batch: list, error: Exception, settled: set) -> list:
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            settled.add(id(batch[0]))
+            return []
+        middle = len(batch) // 2
+        halves = (batch[:middle], batch[middle:])
+        for i, half in enumerate(halves):
+            try:
+                await self._commit(half)
+                settled.update(map(id, half))
+            except Exception as e:
+                if is_transient(e):
+                    return [item for rest in halves[i:] for item in rest]
+                left = await self._isolate(half, e, settled)
+                if left:
+                    return left + (halves[1] if i == 0 else [])
+        return []
+
+    def _dead_letter(self, item: tuple, error: Exception):
+        record, future = item
+        self.rejected += 1
+        logging.error(f"{self.table}: рядок відхилено БД ({type(error).__name__}: {error}): {record!r}")
+        if self.dead_letter_path:
+            line = json.dumps({
+                "at": datetime.now().isoformat(timespec="seconds"), "table": self.table,
+                "error": f"{type(error).__name__}: {error}", "record": list(record),
+            }, ensure_ascii=False, default=str)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    # Повертає результат для кожного рядка пачки (для простого COPY — None)
+    async def _write_batch(self, conn, records: list[tuple]) -> list:
+        await conn.copy_records_to_table(self.table, records=records, columns=self.columns)
+        return [None] * len(records)
+
+    async def flush(self):
+        while self._pending:
+            if not await self._flush_batch():
+                return False
+        return True
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if not await self.flush():
+            self._spill()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rows": self.rows_written,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+    def _spill(self):
+        if not self.spill_path:
+            logging.error(f"{self.table}: {len(self._pending)} рядків не записано")
+            return
+        with open(self.spill_path, "ab") as f:
+            for record, _ in self._pending:
+                pickle.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        logging.warning(f"{self.table}: {len(self._pending)} рядків збережено в {self.spill_path}")
+        for _, future in self._pending:
+            if future is not None and not future.done():
+                future.set_result(DEFERRED)
+        self._pending.clear()
+
+    def _load_spill(self) -> list[tuple]:
+        if not self.spill_path:
+            return []
+        records = []
+        try:
+            with open(self.spill_path, "rb") as f:
+                while True:
+                    try:
+                        records.append(pickle.load(f))
+                    except EOFError:
+                        break
+                    except pickle.UnpicklingError:
+                        # Обірваний останній запис (збій під час збереження)
+                        break
+            os.remove(self.spill_path)
+        except FileNotFoundError:
+            pass
+        return records
+
+
+# Учасники: COPY у тимчасову таблицю, далі один INSERT ... ON CONFLICT DO NOTHING.
+# Для кожного рядка повертається True, якщо його вставлено, і False, якщо
+# унікальні індекси знайшли дубль (у БД або в цій же пачці).
+class ParticipantWriter(WriteBehindWriter):
+    COLUMNS = ["telegram_id", "username", "full_name", "joined_at", "nickname", "email"]
+
+    # Тимчасова таблиця живе до кінця з'єднання, тож готовий INSERT лишається дійсним
+    INSERT = Query("participants_insert_staged", f"""
+        INSERT INTO participants ({", ".join(COLUMNS)})
+        SELECT {", ".join(COLUMNS)} FROM participants_staging
+        ON CONFLICT DO NOTHING
+        RETURNING telegram_id, nickname, email
+    """)
+
+    def __init__(self, pool, **kwargs):
+        super().__init__(pool, "participants", self.COLUMNS, **kwargs)
+
+    async def _write_batch(self, conn, records: list[tuple]) -> list[bool]:
+        columns = ", ".join(self.COLUMNS)
+        await conn.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS participants_staging ON COMMIT DELETE ROWS AS "
+            f"SELECT {columns} FROM participants WITH NO DATA"
+        )
+        await conn.copy_records_to_table("participants_staging", records=records, columns=self.COLUMNS)
+        rows = await conn.fetch(self.INSERT)
+        inserted = {(r["telegram_id"], r["nickname"], r["email"]) for r in rows}
+        return [(r[0], r[4], r[5]) in inserted for r in records]